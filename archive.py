@@ -0,0 +1,368 @@
+import os
+import ssl
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+import subprocess
+import requests
+from urllib.parse import urlsplit, urlunsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Headers which belong to one connection, or which no longer hold once the
+# body is stored decoded
+HOP_HEADERS = frozenset(['connection', 'keep-alive', 'proxy-connection', 'proxy-authorization', 'te', 'trailer',
+						'transfer-encoding', 'upgrade', 'content-length', 'content-encoding', 'accept-encoding',
+						'host', 'alt-svc', 'strict-transport-security'])
+
+# Requests which are recorded; the others, like the POST of the contact form,
+# are never sent to the website
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def path_key(url):
+	"""
+	The url without its query, to replay a resource requested with another cache-busting parameter
+	"""
+	parts = urlsplit(url)
+	return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+class PageArchive:
+	"""
+	SQLite archive of the responses fetched while visiting websites. The
+	bodies are stored once per content, compressed, so the scripts and styles
+	shared by many sites take no extra space.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		# Written by the proxy threads
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS bodies (
+									hash TEXT PRIMARY KEY,
+									size INTEGER NOT NULL,
+									data BLOB NOT NULL)""")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+									method TEXT NOT NULL,
+									url TEXT NOT NULL,
+									path TEXT NOT NULL,
+									status INTEGER NOT NULL,
+									headers TEXT NOT NULL,
+									hash TEXT NOT NULL,
+									recorded REAL NOT NULL,
+									PRIMARY KEY (method, url))""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS responses_path ON responses (method, path)")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS sites (
+									website TEXT PRIMARY KEY,
+									row_id INTEGER,
+									event TEXT,
+									recorded REAL NOT NULL)""")
+		self.connection.commit()
+
+	def put(self, method, url, status, headers, body):
+		"""
+		Stores a response, replacing the previous one of the same request
+
+		Args:
+			headers: list of (name, value) tuples, without the hop-by-hop headers
+			body: decoded body bytes
+		"""
+		digest = hashlib.sha1(body).hexdigest()
+		with self.lock, self.connection:
+			self.connection.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?, ?)",
+									(digest, len(body), zlib.compress(body, 6)))
+			self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+									(method, url, path_key(url), status, json.dumps(headers), digest, time.time()))
+
+	def get(self, method, url):
+		"""
+		Returns:
+			(status, headers, body) of the recorded response, the one of the
+			same path with another query if the url was not recorded, None
+			if neither was
+		"""
+		with self.lock:
+			row = self.connection.execute("""SELECT status, headers, data FROM responses JOIN bodies USING (hash)
+											WHERE method = ? AND url = ?""", (method, url)).fetchone()
+			if row is None:
+				row = self.connection.execute("""SELECT status, headers, data FROM responses JOIN bodies USING (hash)
+												WHERE method = ? AND path = ? ORDER BY recorded DESC LIMIT 1""",
+											(method, path_key(url))).fetchone()
+		if row is None:
+			return None
+		return row[0], [tuple(header) for header in json.loads(row[1])], zlib.decompress(row[2])
+
+	def add_site(self, website, row_id=None, event=None):
+		"""
+		Lists a recorded website, to be replayed later
+		"""
+		with self.lock, self.connection:
+			self.connection.execute("INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?)",
+									(website, row_id, event if isinstance(event, str) else None, time.time()))
+
+	def sites(self):
+		"""
+		Returns:
+			list of (row_id, website, event) rows of the recorded websites, in row order
+		"""
+		with self.lock:
+			return [tuple(row) for row in
+					self.connection.execute("SELECT row_id, website, event FROM sites ORDER BY row_id")]
+
+	def stats(self):
+		"""
+		Returns:
+			dict with the number of sites, responses and distinct bodies, the
+			size of the bodies as served and as stored
+		"""
+		with self.lock:
+			sites = self.connection.execute("SELECT COUNT(*) FROM sites").fetchone()[0]
+			responses, served = self.connection.execute(
+				"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses JOIN bodies USING (hash)").fetchone()
+			bodies, unique, stored = self.connection.execute(
+				"SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM bodies").fetchone()
+		return {'sites': sites, 'responses': responses, 'bodies': bodies,
+				'served_kb': round(served / 1024), 'unique_kb': round(unique / 1024), 'stored_kb': round(stored / 1024)}
+
+	def close(self):
+		self.connection.close()
+
+
+def ensure_certificate(directory):
+	"""
+	Creates, once, the self-signed certificate the proxy shows for every
+	https site, with the openssl command line tool. Chrome accepts it with
+	--ignore-certificate-errors.
+
+	Returns:
+		(certificate path, key path)
+	"""
+	cert = os.path.join(directory, 'archive_proxy.cert.pem')
+	key = os.path.join(directory, 'archive_proxy.key.pem')
+	if not (os.path.exists(cert) and os.path.exists(key)):
+		subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '3650',
+						'-subj', '/CN=contact-bot archive proxy', '-keyout', key, '-out', cert],
+					check=True, capture_output=True)
+	return cert, key
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+	"""
+	Proxy requests of the browser: plain http requests come with their full
+	url, https ones through CONNECT, whose tunnel is opened here with the
+	proxy certificate so the requests inside can be read
+	"""
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_CONNECT(self):
+		host = self.path[:-4] if self.path.endswith(':443') else self.path
+		self.send_response(200, 'Connection Established')
+		self.end_headers()
+		self.wfile.flush()
+		# The requests of the tunnel are handled by the same loop, on the TLS stream
+		self.connection = self.server.ssl_context.wrap_socket(self.connection, server_side=True)
+		self.rfile = self.connection.makefile('rb', self.rbufsize)
+		self.wfile = self.connection.makefile('wb')
+		self.tunnel = f"https://{host}"
+		# Clients open the tunnel with HTTP/1.0, which would close it right away
+		self.close_connection = False
+
+	def target_url(self):
+		if self.path.startswith(('http://', 'https://')):
+			return self.path
+		return getattr(self, 'tunnel', f"http://{self.headers.get('Host', '')}") + self.path
+
+	def relay(self):
+		url = self.target_url()
+		length = int(self.headers.get('Content-Length') or 0)
+		body = self.rfile.read(length) if length else b''
+		if self.command not in SAFE_METHODS:
+			status, headers, content = self.server.hold(self.command, url, self.headers, body)
+		elif self.server.mode == 'record':
+			status, headers, content = self.server.record(self.command, url, self.headers)
+		else:
+			status, headers, content = self.server.replay(self.command, url)
+		self.send_response(status)
+		for name, value in headers:
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(content)))
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(content)
+
+	def finish(self):
+		super().finish()
+		if hasattr(self, 'tunnel'):
+			self.connection.close()
+
+	do_GET = do_HEAD = do_OPTIONS = do_POST = do_PUT = do_PATCH = do_DELETE = relay
+
+
+class ArchiveProxy(ThreadingHTTPServer):
+	"""
+	Local proxy between the browser and the websites. In 'record' mode the
+	GET, HEAD and OPTIONS requests are fetched from the websites and stored in
+	the archive; in 'replay' mode they are served from the archive, and the
+	ones which were not recorded get a 404. In both modes the other requests,
+	the form POST first of all, are kept in `held` and never sent anywhere.
+	"""
+	daemon_threads = True
+
+	def __init__(self, archive, mode='replay', port=0, timeout=20, verify=True, cert_dir=None):
+		"""
+		Args:
+			archive: PageArchive
+			mode: 'record' or 'replay'
+			port: port of the proxy, any free one by default
+			timeout: timeout of the requests to the websites, when recording
+			verify: check the certificates of the websites, when recording
+			cert_dir: directory of the proxy certificate, the one of the archive by default
+		"""
+		if mode not in ('record', 'replay'):
+			raise ValueError(f"Unknown archive mode '{mode}'")
+		self.archive = archive
+		self.mode = mode
+		self.timeout = timeout
+		self.verify = verify
+		self.lock = threading.Lock()
+		self.counters = {'recorded': 0, 'replayed': 0, 'missing': 0, 'held': 0, 'errors': 0}
+		self.held = []
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		cert, key = ensure_certificate(cert_dir or os.path.dirname(os.path.abspath(archive.path)))
+		self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+		self.ssl_context.load_cert_chain(cert, key)
+		super().__init__(('127.0.0.1', port), ArchiveHandler)
+
+	@property
+	def url(self):
+		return f"http://127.0.0.1:{self.server_port}"
+
+	def chrome_arguments(self):
+		"""
+		Chrome command line arguments sending all the traffic, also to the local hosts, through the proxy
+		"""
+		return [f"--proxy-server={self.url}", '--proxy-bypass-list=<-loopback>', '--ignore-certificate-errors']
+
+	def count(self, name):
+		with self.lock:
+			self.counters[name] += 1
+
+	def hold(self, method, url, headers, body):
+		with self.lock:
+			self.held.append({'method': method, 'url': url, 'body': body.decode('utf-8', 'replace'),
+							'time': time.time()})
+		self.count('held')
+		return 204, [], b''
+
+	def record(self, method, url, headers):
+		forwarded = {name: value for name, value in headers.items() if name.lower() not in HOP_HEADERS}
+		try:
+			response = self.session.request(method, url, headers=forwarded, allow_redirects=False,
+											timeout=self.timeout, verify=self.verify)
+		except requests.RequestException as e:
+			self.count('errors')
+			return 502, [('Content-Type', 'text/plain')], str(e).encode()
+		# Repeated headers like Set-Cookie are kept apart
+		kept = [(name, value) for name, value in response.raw.headers.items() if name.lower() not in HOP_HEADERS]
+		self.archive.put(method, url, response.status_code, kept, response.content)
+		self.count('recorded')
+		return response.status_code, kept, response.content
+
+	def replay(self, method, url):
+		found = self.archive.get(method, url)
+		if found is None:
+			self.count('missing')
+			return 404, [('Content-Type', 'text/plain')], b'Not in the archive'
+		self.count('replayed')
+		return found
+
+	def start(self):
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+		return self
+
+def record_rows(archive, rows):
+	"""
+	Lists the rows in the archive as they are handed out, so the same websites can be replayed
+	"""
+	for row in rows:
+		archive.add_site(row[1], row[0], row[2])
+		yield row
+
+def open_archive(path, mode):
+	"""
+	Opens the archive and starts its proxy
+
+	Returns:
+		(PageArchive, started ArchiveProxy)
+	"""
+	archive = PageArchive(path)
+	proxy = ArchiveProxy(archive, mode).start()
+	print(f"{mode.capitalize()}ing {path} through the proxy {proxy.url}")
+	return archive, proxy
+
+def close_archive(archive, proxy):
+	"""
+	Stops the proxy and closes the archive, printing what went through the proxy
+	"""
+	proxy.shutdown()
+	proxy.server_close()
+	print(f"Archive proxy: {proxy.counters}, archive: {archive.stats()}")
+	archive.close()
+
+def compare_runs(old_path, new_path):
+	"""
+	Prints the websites whose outcome changed between two journals, e.g. the
+	replay of an archive before and after a change of the heuristics
+
+	Returns:
+		number of websites which changed
+	"""
+	from journal import read_journal
+	old = {record['website']: record for record in read_journal(old_path).values()}
+	new = {record['website']: record for record in read_journal(new_path).values()}
+	keys = ['status', 'stage', 'contact_url']
+	changed = 0
+	for website in sorted(set(old) & set(new)):
+		before, after = old[website], new[website]
+		differences = [f"{key}: {before.get(key)} -> {after.get(key)}" for key in keys if before.get(key) != after.get(key)]
+		filled_before = sorted((before.get('fill') or {}).get('filled') or [])
+		filled_after = sorted((after.get('fill') or {}).get('filled') or [])
+		if filled_before != filled_after:
+			differences.append(f"filled: {filled_before} -> {filled_after}")
+		if differences:
+			changed += 1
+			print(f"{website}\n\t" + "\n\t".join(differences))
+	print(f"{changed} of {len(set(old) & set(new))} websites changed")
+	return changed
+
+def main():
+	parser = argparse.ArgumentParser(description="Recorded website archives")
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	stats = subparsers.add_parser('stats', help="size and deduplication of an archive")
+	stats.add_argument('archive')
+	compare = subparsers.add_parser('compare', help="websites whose outcome changed between two journals")
+	compare.add_argument('old')
+	compare.add_argument('new')
+	args = parser.parse_args()
+
+	if args.command == 'stats':
+		archive = PageArchive(args.archive)
+		print(json.dumps(archive.stats()))
+		archive.close()
+	else:
+		compare_runs(args.old, args.new)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,732 @@
+import os
+import sys
+import time
+import glob
+import json
+import random
+import socket
+import asyncio
+import multiprocessing
+import resource
+import argparse
+import itertools
+import subprocess
+import tempfile
+from web_bot import load_contact_information, confirmation_messages, process_website
+from discovery import prefetch_rows
+from input_reader import iter_websites
+from worker_pool import measure_throughput
+from form_analysis import fields_from_html
+from field_rules import assign_fields
+from fixture_server import FixtureServer, FIXTURES_DIR
+from utils import create_driver, load_page, open_page, find_contact_form, find_form_in_iframe, url_blocked
+from form_analysis import snapshot_form, build_fill_plan, execute_fill_plan, type_fill_step
+from tracing import instrument_driver
+from watchdog import SITE_DEADLINE, BrowserSession
+from http_submit import submit_static_form
+from preflight import PreflightCache, preflight_rows, is_address
+from ledger import WorkLedger, Heartbeat, ledger_rows
+from governor import MAX_RSS_MB, MAX_SITES, MAX_ERROR_STREAK
+from waits import wait_for_page_ready, set_pacing
+from lexicon import language_code, rules_for_language
+from bs4 import BeautifulSoup
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+
+CORPUS_PATH = os.path.join(FIXTURES_DIR, 'corpus.json')
+
+
+def benchmark_throughput(args):
+	"""
+	Runs the same websites with the worker pool at each concurrency level
+	and prints the sites per minute and the speedup over one worker. The
+	fixture sites are used unless a list is given, and the forms are only
+	filled in, never submitted, so no real website gets a message.
+	"""
+	server = None
+	if args.input:
+		rows = list(itertools.islice(iter_websites(args.input), args.limit))
+	else:
+		corpus = json.load(open(CORPUS_PATH))
+		server = FixtureServer().start()
+		starts = itertools.cycle(corpus[name]['start'] for name in corpus)
+		rows = [(index, f"{server.url}/{next(starts)}", "Benchmark") for index in range(args.limit)]
+	info = load_contact_information()
+
+	results = []
+	try:
+		for workers in args.concurrency:
+			result = measure_throughput(rows, info, confirmation_messages, workers,
+										settings={'pacing': args.pacing, 'stop_before_submit': True})
+			results.append(result)
+			print(json.dumps(result))
+	finally:
+		if server:
+			server.shutdown()
+
+	base = results[0]['sites_per_minute'] or 1.0
+	print(f"{'workers':>8} {'wall s':>10} {'sites/min':>10} {'speedup':>8}")
+	for result in results:
+		print(f"{result['workers']:>8} {result['wall']:>10} {result['sites_per_minute']:>10} "
+			f"{result['sites_per_minute'] / base:>8.2f}")
+
+def benchmark_rules(args):
+	"""
+	Evaluates the field matching rules against the stored forms, without a
+	browser, and prints the assignments and the forms per second
+	"""
+	forms = {path: fields_from_html(open(path).read()) for path in sorted(glob.glob(args.forms))}
+	for path, fields in forms.items():
+		print(path)
+		for match in assign_fields(fields):
+			field = match['field']
+			print(f"  {match['rule']['field']:<18} {match['matched_by']:<12} "
+				f"{field['tag']} name={field['name']!r} id={field['id']!r} label={field['label']!r}")
+
+	start = time.perf_counter()
+	for _ in range(args.repeat):
+		for fields in forms.values():
+			assign_fields(fields)
+	elapsed = time.perf_counter() - start
+	print(f"{args.repeat * len(forms) / elapsed:.0f} forms per second")
+
+def pandas_rows(path):
+	"""
+	The old input path: the whole list is loaded with pandas before the first row
+	"""
+	import pandas as pd
+	df = pd.read_excel(path)
+	for i in range(0, len(df)):
+		yield (i, df.loc[i, 'Website'], df.loc[i, 'Event'])
+
+def benchmark_reader_probe(args):
+	"""
+	Reads the list with one reader in this process and prints the time to
+	the first row, the total time and the peak RSS growth as JSON
+	"""
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.perf_counter()
+	rows = pandas_rows(args.file) if args.mode == 'pandas' else iter_websites(args.file)
+	first = None
+	count = 0
+	for _ in rows:
+		if first is None:
+			first = time.perf_counter() - start
+		count += 1
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	print(json.dumps({'mode': args.mode,
+					'rows': count,
+					'first_site_s': round(first, 3),
+					'total_s': round(time.perf_counter() - start, 3),
+					'peak_rss_growth_mb': round((peak - before) / 1024, 1)}))
+
+def write_sample_list(path, rows):
+	from openpyxl import Workbook
+	workbook = Workbook(write_only=True)
+	sheet = workbook.create_sheet()
+	sheet.append(['Company', 'Website', 'Event'])
+	for i in range(rows):
+		sheet.append([f"Company {i}", f"https://www.company-{i}.example/", "Maintenance"])
+	workbook.save(path)
+
+def benchmark_reader(args):
+	"""
+	Compares the pandas input path with the streaming reader on a generated
+	list, each in its own process so the peak RSS is not shared
+	"""
+	with tempfile.TemporaryDirectory() as directory:
+		path = args.file
+		if not path:
+			path = os.path.join(directory, 'websites.xlsx')
+			print(f"Writing a list of {args.rows} websites")
+			write_sample_list(path, args.rows)
+		for mode in ['pandas', 'stream']:
+			output = subprocess.run([sys.executable, os.path.abspath(__file__), 'reader-probe',
+									'--mode', mode, '--file', path],
+									capture_output=True, text=True, check=True).stdout
+			print(output.strip().splitlines()[-1])
+
+def benchmark_lean(args):
+	"""
+	Loads the heavy fixture site with the default and the lean browser
+	profile and prints the load time and the bytes served by the fixture server
+	"""
+	server = FixtureServer().start()
+	pages = [f"{server.url}/sites/heavy/index.html", f"{server.url}/sites/heavy/contact.html"]
+	print(f"{'profile':>8} {'load s':>8} {'requests':>9} {'kB':>9}")
+	try:
+		for lean in [False, True]:
+			arguments = ['--headless=new'] if args.headless and not lean else []
+			times, requests_served, kilobytes = [], [], []
+			for _ in range(args.repeat):
+				# A new browser each time, so nothing comes from its cache
+				driver = create_driver(lean=lean, arguments=arguments)
+				try:
+					server.reset_counters()
+					start = time.perf_counter()
+					for page in pages:
+						load_page(driver, page)
+						wait_for_page_ready(driver)
+					times.append(time.perf_counter() - start)
+					requests_served.append(server.requests)
+					kilobytes.append(server.bytes_sent / 1024)
+				finally:
+					driver.quit()
+			print(f"{'lean' if lean else 'default':>8} {sum(times) / len(times):>8.2f} "
+				f"{sum(requests_served) / len(requests_served):>9.0f} {sum(kilobytes) / len(kilobytes):>9.0f}")
+	finally:
+		server.shutdown()
+
+def benchmark_blocking(args):
+	"""
+	Checks the url patterns the lean profile blocks, without a browser: the
+	homepages of the websites list and hosts named like a media file must
+	load, the images, fonts, media and trackers must not
+	"""
+	loaded = ["https://www.icodata.de/", "http://www.moviik.com/", "https://gif.example.com/contact.html",
+			"https://www.example.com/contact?file=logo.png.html"]
+	loaded += [website for _, website, _ in iter_websites(args.input)]
+	blocked = ["https://www.example.com/logo.png", "https://www.example.com/logo.PNG.png?v=3",
+			"https://cdn.example.com/fonts/inter.woff2", "https://www.example.com/video/intro.mov?autoplay=1",
+			"https://www.google-analytics.com/collect?v=1"]
+	wrong = [(url, True) for url in loaded if url_blocked(url)] + [(url, False) for url in blocked if not url_blocked(url)]
+	print(f"{len(loaded)} pages which must load, {len(blocked)} urls which must be blocked, {len(wrong)} wrong")
+	for url, was_blocked in wrong:
+		print(f"\t{url}: {'blocked' if was_blocked else 'loaded'}")
+
+def benchmark_fill(args):
+	"""
+	Fills in the contact form of each fixture site twice, with the one-script
+	fill and with keystrokes, and prints the time, the WebDriver commands and
+	the fields which kept their value
+	"""
+	corpus = json.load(open(args.corpus))
+	names = args.sites or [name for name in corpus if corpus[name]['fields'] and not corpus[name].get('captcha')]
+	info = dict(load_contact_information(), message="Meeting at Benchmark")
+	set_pacing(args.pacing)
+	server = FixtureServer().start()
+	driver = create_driver(lean=args.lean)
+	counter = instrument_driver(driver)
+	print(f"{'site':<16} {'mode':<8} {'s':>7} {'cmds':>6} {'kept':>7}")
+	try:
+		for name in names:
+			for mode in ('script', 'keys'):
+				lang = open_page(driver, f"{server.url}/{corpus[name]['contact']}")
+				form, frame = find_contact_form(driver, lang), None
+				if not form:
+					form, frame = find_form_in_iframe(driver, lang)
+				plan = build_fill_plan(snapshot_form(driver, form), info, lang)
+				start, commands = time.perf_counter(), counter['count']
+				if mode == 'script':
+					kept = len(execute_fill_plan(driver, plan, form, type_fallback=False)['filled'])
+				else:
+					for step in plan:
+						type_fill_step(driver, step)
+					kept = sum(driver.execute_script(
+						"return arguments[0].type === 'radio' || arguments[0].type === 'checkbox' ? "
+						"arguments[0].checked : arguments[0].value === arguments[1];",
+						step['field']['element'], step['value']) for step in plan)
+				print(f"{name:<16} {mode:<8} {time.perf_counter() - start:>7.2f} {counter['count'] - commands:>6} "
+					f"{kept:>3}/{len(plan):<3}")
+				if frame:
+					driver.switch_to.default_content()
+	finally:
+		driver.quit()
+		server.shutdown()
+
+def check_submission(expected, posts, info):
+	"""
+	Compares the POST the fixture server recorded for a site with the values
+	the bot should have filled in
+
+	Args:
+		expected: dict of posted field name to the contact information key,
+			None meaning any non-empty value and '' a field which must stay empty
+		posts: the POSTs recorded while the site ran
+		info: the contact information of the site, with its message
+
+	Returns:
+		(number of correct fields, whether the contact form was posted)
+	"""
+	# Other forms of the page, like a search or a login, do not count
+	posts = [post for post in posts if set(post['fields']) & set(expected)]
+	if not posts:
+		return 0, False
+	fields = posts[-1]['fields']
+	correct = 0
+	for name, key in expected.items():
+		value = str(fields.get(name) or '')
+		if key == '':
+			correct += not value
+		else:
+			correct += bool(value) if key is None else value == info.get(key)
+	return correct, True
+
+def benchmark_corpus(args):
+	"""
+	Runs the bot on the offline fixture sites and prints the latency, the
+	number of WebDriver commands and whether each site was filled in,
+	submitted and confirmed correctly
+	"""
+	corpus = json.load(open(args.corpus))
+	names = args.sites or list(corpus)
+	info = load_contact_information()
+	site_info = dict(info, message="Meeting at Benchmark")
+	set_pacing(args.pacing)
+
+	server = FixtureServer().start()
+	rows = [(i, f"{server.url}/{corpus[name]['start']}", "Benchmark") for i, name in enumerate(names)]
+	discoveries = {} if args.no_prefetch else {row[0]: discovery for row, discovery in prefetch_rows(rows)}
+	browser = BrowserSession({'lean': args.lean, 'consent_preseed': not args.no_consent_preseed})
+	lines = []
+	try:
+		for row in rows:
+			name = names[row[0]]
+			server.reset_counters()
+			result = process_website(browser.driver, row, info, confirmation_messages, discoveries.get(row[0]),
+									deadline=args.site_timeout, http_submit=args.http_submit)
+			correct, submitted = check_submission(corpus[name]['fields'], server.posts, site_info)
+			browser.recover(result)
+			lines.append({'site': name,
+						'status': result['status'],
+						'stage': result['stage'],
+						'backend': result['backend'],
+						'rejected': (result.get('fill') or {}).get('rejected'),
+						'challenge': (result.get('challenge') or {}).get('kind'),
+						'captcha_ok': (result['status'] == 'captcha') == corpus[name].get('captcha', False),
+						'rss_mb': (result.get('memory') or {}).get('rss_mb'),
+						'consent': result['consent'],
+						'elapsed': result['elapsed'],
+						'commands': result['commands'],
+						'contact_page_s': result['timings'].get('contact_page'),
+						'page_ok': result['contact_url'] == f"{server.url}/{corpus[name]['contact']}",
+						'fields': f"{correct}/{len(corpus[name]['fields'])}",
+						'filled': correct == len(corpus[name]['fields']),
+						'submitted': submitted,
+						# Confirmed exactly when the form really was posted
+						'confirm_ok': (result['status'] == 'confirmed') == submitted})
+	finally:
+		browser.quit()
+		server.shutdown()
+
+	print(f"\n{'site':<16} {'status':<14} {'stage':<13} {'backend':<8} {'s':>7} {'cmds':>6} {'contact s':>10} "
+		f"{'page ok':>8} {'fields':>7} {'submitted':>10} {'confirm ok':>11} {'challenge':<14}")
+	for line in lines:
+		contact_page = f"{line['contact_page_s']:.2f}" if line['contact_page_s'] is not None else '-'
+		print(f"{line['site']:<16} {line['status']:<14} {line['stage'] or '-':<13} {line['backend'] or '-':<8} "
+			f"{line['elapsed']:>7.2f} {line['commands']:>6} {contact_page:>10} {str(line['page_ok']):>8} "
+			f"{line['fields']:>7} {str(line['submitted']):>10} {str(line['confirm_ok']):>11} {line['challenge'] or '-':<14}")
+	print(f"\n{len(lines)} sites, {sum(l['elapsed'] for l in lines):.1f} s, "
+		f"{sum(l['commands'] for l in lines)} commands, {sum(l['page_ok'] for l in lines)} right contact pages, "
+		f"{sum(l['filled'] for l in lines)} filled correctly, "
+		f"{sum(l['submitted'] for l in lines)} submitted, {sum(l['confirm_ok'] for l in lines)} confirm outcomes correct, "
+		f"{sum(l['captcha_ok'] for l in lines)} captcha outcomes correct")
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump(lines, f, indent=2)
+
+def benchmark_http(args):
+	"""
+	Submits the contact page of each fixture site with plain HTTP requests,
+	without a browser, and prints which sites fall back to the browser and
+	whether the POST the fixture server recorded has the right fields
+	"""
+	corpus = json.load(open(args.corpus))
+	names = args.sites or list(corpus)
+	site_info = dict(load_contact_information(), message="Meeting at Benchmark")
+	server = FixtureServer().start()
+	lines = []
+	try:
+		for name in names:
+			server.reset_counters()
+			start = time.perf_counter()
+			outcome = submit_static_form(f"{server.url}/{corpus[name]['contact']}", site_info, confirmation_messages)
+			elapsed = time.perf_counter() - start
+			correct, submitted = check_submission(corpus[name]['fields'], server.posts, site_info)
+			lines.append({'site': name,
+						'backend': 'browser' if outcome['fallback'] else 'http',
+						'reason': outcome['fallback'] or outcome['signal'],
+						'elapsed': elapsed,
+						'fields': f"{correct}/{len(corpus[name]['fields'])}",
+						'filled': correct == len(corpus[name]['fields']),
+						'submitted': submitted,
+						'confirm_ok': outcome['confirmed'] == submitted})
+	finally:
+		server.shutdown()
+
+	print(f"\n{'site':<16} {'backend':<8} {'reason':<40} {'ms':>7} {'fields':>7} {'submitted':>10} {'confirm ok':>11}")
+	for line in lines:
+		print(f"{line['site']:<16} {line['backend']:<8} {line['reason']:<40} {line['elapsed'] * 1000:>7.1f} "
+			f"{line['fields']:>7} {str(line['submitted']):>10} {str(line['confirm_ok']):>11}")
+	http = [line for line in lines if line['backend'] == 'http']
+	print(f"\n{len(http)} of {len(lines)} sites submitted over HTTP in {sum(l['elapsed'] for l in http):.2f} s, "
+		f"{sum(l['filled'] for l in http)} filled correctly, {sum(l['confirm_ok'] for l in lines)} confirm outcomes correct")
+
+def benchmark_preflight(args):
+	"""
+	Runs the preflight on the fixture sites mixed with dead hosts, a parked
+	page, a refused connection, a failed TLS handshake and duplicates, with a
+	stub resolver which only knows the IP addresses, then again from the
+	cache, and prints whether each row got the expected status. The rows
+	passed on to the browser count as 'alive'.
+	"""
+	corpus = json.load(open(args.corpus))
+	server = FixtureServer().start()
+	expected = {}
+	websites = []
+
+	def add(url, status):
+		expected[len(websites)] = status
+		websites.append(url)
+
+	first = corpus[next(iter(corpus))]['start']
+	# Redirects to a site further down the list, which becomes its duplicate whatever finishes first
+	add(f"{server.url}/moved.html?redirect=/{first}", 'alive')
+	for name in corpus:
+		add(f"{server.url}/{corpus[name]['start']}", 'duplicate' if corpus[name]['start'] == first else 'alive')
+	add(f"{server.url}/sites/parked/index.html", 'parked')
+	add("http://127.0.0.1:1/", 'dead')
+	# Not a dead website, the browser decides
+	add(server.url.replace('http://', 'https://') + "/tls-only/", 'alive')
+	for i in range(args.dead):
+		add(f"http://www.dead-{i}.invalid/", 'dead')
+		add(f"https://shop.dead-{i}.invalid/contact", 'duplicate')
+
+	async def stub_resolve(host):
+		await asyncio.sleep(args.dns_delay)
+		if is_address(host):
+			return [host]
+		raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+
+	with tempfile.TemporaryDirectory() as directory:
+		cache = PreflightCache(os.path.join(directory, 'preflight.sqlite'))
+		try:
+			for run in ('checked', 'cached'):
+				statuses = {}
+				skipped = []
+				rows = [(index, url, None) for index, url in enumerate(websites)]
+				start = time.perf_counter()
+				for row in preflight_rows(rows, on_skipped=skipped.append, concurrency=args.concurrency,
+										cache=cache, resolve=stub_resolve):
+					statuses[row[0]] = 'alive'
+				elapsed = time.perf_counter() - start
+				statuses.update({record['row_id']: record['status'] for record in skipped})
+				wrong = {index: statuses.get(index) for index in expected if statuses.get(index) != expected[index]}
+				print(f"{run}: {len(rows)} websites in {elapsed:.2f} s, {len(skipped)} skipped without the browser, "
+					f"{len(expected) - len(wrong)} of {len(expected)} statuses as expected")
+				for index, status in wrong.items():
+					print(f"\t{websites[index]}: {status}, expected {expected[index]}")
+		finally:
+			cache.close()
+			server.shutdown()
+	print("Each skipped website saves a browser page load of up to the page load timeout, plus the consent waits")
+
+def ledger_node(path, node, lease_seconds, delay, crash_after):
+	"""
+	Stand-in of a node of a distributed run: claims the sites of the ledger,
+	spends `delay` seconds on each, and dies without a word while holding a
+	lease after `crash_after` sites if it is set
+	"""
+	ledger = WorkLedger(path, node, lease_seconds)
+	heartbeat = Heartbeat(ledger, interval=lease_seconds / 4).start()
+	processed = 0
+	for row_id, website, _ in ledger_rows(ledger, poll=lease_seconds / 4):
+		if crash_after is not None and processed >= crash_after:
+			os._exit(1)
+		time.sleep(random.uniform(0.5, 1.5) * delay)
+		ledger.complete({'row_id': row_id, 'website': website, 'status': "confirmed", 'node': node})
+		processed += 1
+	heartbeat.stop()
+	ledger.close()
+
+def benchmark_ledger(args):
+	"""
+	Runs several node processes against one ledger, one of them crashing
+	midway, and checks that every site got exactly one result, with the
+	sites of the crashed node reclaimed after its lease expired
+	"""
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'ledger.sqlite')
+		ledger = WorkLedger(path, 'loader', args.lease_seconds)
+		ledger.load((row_id, f"http://site-{row_id}.example/", None) for row_id in range(args.sites))
+		start = time.perf_counter()
+		processes = []
+		for index in range(args.nodes):
+			crash_after = args.crash_after if index == 0 else None
+			process = multiprocessing.Process(target=ledger_node,
+											args=(path, f"node-{index}", args.lease_seconds, args.delay, crash_after))
+			process.start()
+			processes.append(process)
+		for process in processes:
+			process.join()
+		wall = time.perf_counter() - start
+
+		results = list(ledger.results())
+		rows = [result['row_id'] for result in results]
+		claims = dict(ledger.connection.execute("SELECT row_id, attempts FROM sites").fetchall())
+		per_node = {node: done for node, _, done in ledger.nodes()}
+		print(f"{args.nodes} nodes, {args.sites} sites in {wall:.1f} s "
+			f"({args.sites * args.delay:.1f} s on a single node), ledger {ledger.progress()}")
+		print(f"Results per node: {per_node}")
+		print(f"Exit codes: {[process.exitcode for process in processes]}")
+		print(f"Sites claimed more than once: {sum(attempts > 1 for attempts in claims.values())}")
+		print(f"Every site has exactly one result: {sorted(rows) == list(range(args.sites))}")
+		ledger.close()
+
+def benchmark_ledger_run(args):
+	"""
+	Runs several `web_bot.py --ledger` node processes, each with its own
+	browsers, on the fixture sites repeated into one list, and checks that
+	every site got exactly one result and that the nodes shared the work
+	"""
+	corpus = json.load(open(args.corpus))
+	server = FixtureServer().start()
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'ledger.sqlite')
+		input_path = os.path.join(directory, 'websites.jsonl')
+		starts = [corpus[name]['start'] for name in corpus]
+		with open(input_path, 'w') as f:
+			for index in range(args.sites):
+				# A different query per row, so the lists reader keeps the repeated sites
+				f.write(json.dumps({'Website': f"{server.url}/{starts[index % len(starts)]}?row={index}",
+									'Event': "Benchmark"}) + '\n')
+		start = time.perf_counter()
+		processes = []
+		for index in range(args.nodes):
+			command = [sys.executable, 'web_bot.py', '--input', input_path, '--ledger', path,
+					'--node', f"node-{index}", '--workers', str(args.workers), '--no-cache', '--pacing', 'fast',
+					'--journal', os.path.join(directory, f"node-{index}.jsonl"),
+					'--output', os.path.join(directory, 'results.xlsx')]
+			if args.lean:
+				command.append('--lean')
+			processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL))
+		codes = [process.wait() for process in processes]
+		wall = time.perf_counter() - start
+		server.shutdown()
+
+		ledger = WorkLedger(path, 'check')
+		rows = sorted(result['row_id'] for result in ledger.results())
+		per_node = {node: done for node, _, done in ledger.nodes()}
+		statuses = {}
+		for result in ledger.results():
+			statuses[result['status']] = statuses.get(result['status'], 0) + 1
+		print(f"{args.nodes} nodes x {args.workers} workers, {args.sites} sites in {wall:.1f} s, "
+			f"exit codes {codes}, ledger {ledger.progress()}")
+		print(f"Results per node: {per_node}, statuses {statuses}")
+		print(f"Every site has exactly one result: {rows == list(range(args.sites))}, "
+			f"merged journal written: {os.path.exists(os.path.join(directory, 'ledger.jsonl'))}")
+		ledger.close()
+
+def benchmark_memory(args):
+	"""
+	Soak test of the memory governor: runs the fixture sites over and over
+	with one browser session and prints the memory of the browser process
+	tree per block of sites, with the restarts
+	"""
+	corpus = json.load(open(args.corpus))
+	names = list(corpus)
+	info = load_contact_information()
+	set_pacing('fast')
+	server = FixtureServer().start()
+	governor = {'max_rss_mb': args.max_rss_mb, 'max_sites': args.recycle_after, 'max_error_streak': args.max_error_streak}
+	browser = BrowserSession({'lean': args.lean}, governor)
+	samples = []
+	restarts = []
+	try:
+		for i in range(args.sites):
+			name = names[i % len(names)]
+			row = (i, f"{server.url}/{corpus[name]['start']}", "Benchmark")
+			result = process_website(browser.driver, row, info, confirmation_messages)
+			browser.recover(result)
+			if result.get('memory'):
+				samples.append(result['memory'])
+			if result.get('recycle'):
+				restarts.append((i, result['recycle']['code'], result['recycle']['reason']))
+	finally:
+		browser.quit()
+		server.shutdown()
+
+	print(f"\n{'sites':>12} {'mean MB':>9} {'max MB':>8} {'handles':>8} {'processes':>10}")
+	for start in range(0, len(samples), args.block):
+		block = [sample for sample in samples[start:start + args.block] if sample['rss_mb'] is not None]
+		if block:
+			print(f"{start:>5}-{start + len(block) - 1:<6} {sum(s['rss_mb'] for s in block) / len(block):>9.0f} "
+				f"{max(s['rss_mb'] for s in block):>8.0f} {max(s['handles'] for s in block):>8} "
+				f"{max(s['processes'] for s in block):>10}")
+	codes = {}
+	for _, code, _ in restarts:
+		codes[code] = codes.get(code, 0) + 1
+	print(f"\n{len(restarts)} browser restarts {codes}: {restarts}")
+
+def translation_hop(driver, url, translate_url, frame_wait):
+	"""
+	The old non-English path: the page is loaded a second time through the
+	translation service, then the translated frame is waited for
+	"""
+	load_page(driver, translate_url.format(url=url))
+	wait_for_page_ready(driver)
+	try:
+		WebDriverWait(driver, frame_wait).until(
+			EC.frame_to_be_available_and_switch_to_it((By.ID, 'google_translate_iframe')))
+	except WebDriverException:
+		pass
+	driver.switch_to.default_content()
+
+def benchmark_languages(args):
+	"""
+	Compares the fields matched on the non-English fixture pages with the
+	English rules and with the lexicon of the page language, then the time
+	to open each page in one load vs with the translation hop
+	"""
+	paths = sorted(glob.glob(args.pages))
+	print(f"{'page':<36} {'lang':>5} {'english':>8} {'lexicon':>8}")
+	for path in paths:
+		html = open(path, encoding='utf-8').read()
+		soup = BeautifulSoup(html, 'html.parser')
+		lang = language_code(soup.html.get('lang'))
+		fields = fields_from_html(html)
+		english = len(assign_fields(fields, rules_for_language('en')))
+		lexicon = len(assign_fields(fields, rules_for_language(lang)))
+		print(f"{os.path.relpath(path, FIXTURES_DIR):<36} {lang:>5} {english:>5}/{len(fields):<2} {lexicon:>5}/{len(fields):<2}")
+	if args.no_browser:
+		return
+
+	server = FixtureServer().start()
+	driver = create_driver(lean=args.lean)
+	print(f"\n{'page':<36} {'one load s':>11} {'with hop s':>11} {'saved s':>8}")
+	saved = []
+	try:
+		for path in paths:
+			url = f"{server.url}/{os.path.relpath(path, FIXTURES_DIR)}"
+			single, translated = [], []
+			for _ in range(args.repeat):
+				start = time.perf_counter()
+				open_page(driver, url)
+				single.append(time.perf_counter() - start)
+				start = time.perf_counter()
+				open_page(driver, url)
+				translation_hop(driver, url, args.translate_url, args.frame_wait)
+				translated.append(time.perf_counter() - start)
+			single = sum(single) / len(single)
+			translated = sum(translated) / len(translated)
+			saved.append(translated - single)
+			print(f"{os.path.relpath(path, FIXTURES_DIR):<36} {single:>11.2f} {translated:>11.2f} {translated - single:>8.2f}")
+	finally:
+		driver.quit()
+		server.shutdown()
+	print(f"\n{sum(saved) / len(saved):.2f} s saved per non-English page on average")
+
+def main():
+	parser = argparse.ArgumentParser(description="Performance benchmarks of the contact form bot")
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	throughput = subparsers.add_parser('throughput', help="worker pool throughput at several concurrency levels")
+	throughput.add_argument('--input', default=None,
+							help="websites list, the fixture sites by default; the forms are never submitted")
+	throughput.add_argument('--limit', type=int, default=16, help="number of websites per run")
+	throughput.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+	throughput.add_argument('--pacing', default='fast')
+	throughput.set_defaults(func=benchmark_throughput)
+
+	rules = subparsers.add_parser('rules', help="field matching rules on the stored forms, without a browser")
+	rules.add_argument('--forms', default='fixtures/forms/*.html', help="glob of the stored form HTML files")
+	rules.add_argument('--repeat', type=int, default=1000)
+	rules.set_defaults(func=benchmark_rules)
+
+	reader = subparsers.add_parser('reader', help="time to first site and peak RSS, pandas vs streaming reader")
+	reader.add_argument('--file', default=None, help="websites list, a generated one by default")
+	reader.add_argument('--rows', type=int, default=100000, help="size of the generated list")
+	reader.set_defaults(func=benchmark_reader)
+
+	probe = subparsers.add_parser('reader-probe')
+	probe.add_argument('--mode', choices=['pandas', 'stream'], required=True)
+	probe.add_argument('--file', required=True)
+	probe.set_defaults(func=benchmark_reader_probe)
+
+	lean = subparsers.add_parser('lean', help="load time and bytes of the lean vs the default browser profile")
+	lean.add_argument('--repeat', type=int, default=3)
+	lean.add_argument('--headless', action='store_true', help="run the default profile headless too")
+	lean.set_defaults(func=benchmark_lean)
+
+	blocking = subparsers.add_parser('blocking', help="url patterns of the lean profile on the websites list, without a browser")
+	blocking.add_argument('--input', default='Websites Sample.xlsx', help="websites list whose homepages must load")
+	blocking.set_defaults(func=benchmark_blocking)
+
+	corpus = subparsers.add_parser('corpus', help="correctness, latency and commands on the offline fixture sites")
+	corpus.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	corpus.add_argument('--sites', nargs='+', default=None, help="names of the sites to run, all by default")
+	corpus.add_argument('--lean', action='store_true', help="use the lean browser profile")
+	corpus.add_argument('--pacing', default='fast')
+	corpus.add_argument('--no-prefetch', action='store_true', help="skip the HTTP discovery of the sites")
+	corpus.add_argument('--no-consent-preseed', action='store_true', help="let the consent banners show up")
+	corpus.add_argument('--site-timeout', type=float, default=SITE_DEADLINE,
+						help="seconds after which a site is cancelled")
+	corpus.add_argument('--http-submit', action='store_true',
+						help="post the static contact forms without the browser")
+	corpus.add_argument('--json', default=None, help="also write the per site results to this file")
+	corpus.set_defaults(func=benchmark_corpus)
+
+	fill = subparsers.add_parser('fill', help="one-script fill vs keystrokes on the fixture contact forms")
+	fill.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	fill.add_argument('--sites', nargs='+', default=None, help="names of the sites to run, all by default")
+	fill.add_argument('--lean', action='store_true', help="use the lean browser profile")
+	fill.add_argument('--pacing', default='human', help="pacing of the keystroke fill")
+	fill.set_defaults(func=benchmark_fill)
+
+	memory = subparsers.add_parser('memory', help="browser memory over a long run, with the memory governor")
+	memory.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	memory.add_argument('--sites', type=int, default=500, help="number of sites to run")
+	memory.add_argument('--block', type=int, default=50, help="sites per line of the report")
+	memory.add_argument('--lean', action='store_true', help="use the lean browser profile")
+	memory.add_argument('--max-rss-mb', type=float, default=MAX_RSS_MB)
+	memory.add_argument('--recycle-after', type=int, default=MAX_SITES)
+	memory.add_argument('--max-error-streak', type=int, default=MAX_ERROR_STREAK)
+	memory.set_defaults(func=benchmark_memory)
+
+	http = subparsers.add_parser('http', help="browserless submission of the fixture contact forms")
+	http.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	http.add_argument('--sites', nargs='+', default=None, help="names of the sites to run, all by default")
+	http.set_defaults(func=benchmark_http)
+
+	preflight = subparsers.add_parser('preflight', help="liveness check and deduplication of the websites, without a browser")
+	preflight.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	preflight.add_argument('--dead', type=int, default=50, help="number of unresolvable hosts in the list")
+	preflight.add_argument('--dns-delay', type=float, default=0.2, help="seconds each stub DNS lookup takes")
+	preflight.add_argument('--concurrency', type=int, default=32)
+	preflight.set_defaults(func=benchmark_preflight)
+
+	ledger = subparsers.add_parser('ledger', help="distributed run of several node processes over one work ledger")
+	ledger.add_argument('--nodes', type=int, default=4)
+	ledger.add_argument('--sites', type=int, default=200)
+	ledger.add_argument('--delay', type=float, default=0.05, help="seconds each node spends on a site")
+	ledger.add_argument('--lease-seconds', type=float, default=2)
+	ledger.add_argument('--crash-after', type=int, default=10, help="sites after which the first node crashes")
+	ledger.set_defaults(func=benchmark_ledger)
+
+	ledger_run = subparsers.add_parser('ledger-run', help="several web_bot.py --ledger nodes on the fixture sites")
+	ledger_run.add_argument('--corpus', default=CORPUS_PATH, help="description of the fixture sites")
+	ledger_run.add_argument('--nodes', type=int, default=2)
+	ledger_run.add_argument('--workers', type=int, default=2, help="browser workers per node")
+	ledger_run.add_argument('--sites', type=int, default=24)
+	ledger_run.add_argument('--lean', action='store_true', help="use the lean browser profile")
+	ledger_run.set_defaults(func=benchmark_ledger_run)
+
+	languages = subparsers.add_parser('languages', help="lexicon matching and time saved without the translation hop")
+	languages.add_argument('--pages', default=os.path.join(FIXTURES_DIR, 'sites', 'languages', '*.html'),
+						help="glob of the non-English fixture pages")
+	languages.add_argument('--repeat', type=int, default=3)
+	languages.add_argument('--lean', action='store_true', help="use the lean browser profile")
+	languages.add_argument('--translate-url', default='https://translate.google.com/translate?hl=en&sl=auto&tl=en&u={url}',
+						help="translation service url of the old path, '{url}' alone reloads the page")
+	languages.add_argument('--frame-wait', type=float, default=10, help="wait for the translated frame, as in the old path")
+	languages.add_argument('--no-browser', action='store_true', help="only compare the field matching")
+	languages.set_defaults(func=benchmark_languages)
+
+	args = parser.parse_args()
+	args.func(args)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,142 @@
+# Captcha widgets: the elements and iframes they render, the scripts which load
+# them and the window globals they define
+CAPTCHA_PROVIDERS = [
+	{'name': 'recaptcha',
+	'selector': '.g-recaptcha, iframe[src*="/recaptcha/api2/"], iframe[src*="/recaptcha/enterprise/"], iframe[title="reCAPTCHA"]',
+	'scripts': ['google.com/recaptcha/', 'gstatic.com/recaptcha/', 'recaptcha.net/recaptcha/'],
+	'globals': ['grecaptcha']},
+	{'name': 'hcaptcha',
+	'selector': '.h-captcha, iframe[src*="hcaptcha.com"]',
+	'scripts': ['hcaptcha.com/1/api.js', 'js.hcaptcha.com'],
+	'globals': ['hcaptcha']},
+	{'name': 'turnstile',
+	'selector': '.cf-turnstile, iframe[src*="challenges.cloudflare.com"]',
+	'scripts': ['challenges.cloudflare.com/turnstile'],
+	'globals': ['turnstile']},
+	{'name': 'friendlycaptcha',
+	'selector': '.frc-captcha',
+	'scripts': ['friendlycaptcha', 'friendly-challenge'],
+	'globals': ['friendlyChallenge']},
+]
+
+# Markers of the captchas and bot challenges in raw HTML, for the pages fetched without a browser
+HTML_MARKERS = ('g-recaptcha', 'grecaptcha', 'recaptcha/api.js', 'h-captcha', 'hcaptcha.com',
+				'cf-turnstile', 'challenges.cloudflare.com', 'data-sitekey', 'cf-browser-verification',
+				'cf_chl_', 'challenge-form')
+
+# Words in the attributes of a field asking for the text of a captcha image
+CAPTCHA_FIELD_WORDS = ('captcha', 'security code', 'verification code', 'spam protection')
+
+# Checks the page and the form for the challenges in one call: a Cloudflare
+# interstitial, the captcha widgets with their scripts, captcha images and
+# the honeypot fields, which are text fields kept out of sight of the users
+CHALLENGE_SCRIPT = """
+var form = arguments[0], providers = arguments[1];
+function visible(el) {
+	var style = window.getComputedStyle(el);
+	if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') return false;
+	var rect = el.getBoundingClientRect();
+	if (rect.width < 2 || rect.height < 2) return false;
+	// Measured against the document, a field scrolled out of the viewport is still on the page
+	return rect.right + window.scrollX > 0 && rect.bottom + window.scrollY > 0 &&
+		rect.left + window.scrollX < Math.max(document.documentElement.scrollWidth, window.innerWidth);
+}
+var result = {interstitial: null, widgets: [], scripts: [], images: 0, honeypots: []};
+var title = (document.title || '').toLowerCase();
+if (document.querySelector('#challenge-form, #challenge-running, #cf-challenge-running, .cf-browser-verification') ||
+	title.indexOf('just a moment') === 0 || title.indexOf('attention required') === 0) {
+	result.interstitial = 'cloudflare';
+}
+var scope = form ? (form.parentElement || form) : document;
+var sources = Array.prototype.map.call(document.scripts, function(s) { return (s.src || '').toLowerCase(); });
+providers.forEach(function(provider) {
+	var widgets = scope.querySelectorAll(provider.selector);
+	for (var i = 0; i < widgets.length; i++) {
+		var el = widgets[i];
+		result.widgets.push({provider: provider.name, visible: visible(el),
+			invisible: el.getAttribute('data-size') === 'invisible'});
+	}
+	var loaded = sources.filter(function(src) {
+		return provider.scripts.some(function(marker) { return src.indexOf(marker) >= 0; });
+	});
+	var global = provider.globals.some(function(name) { return !!window[name]; });
+	if (loaded.length || global) {
+		// reCAPTCHA v3 scores the visitor in the background, with no widget to solve
+		var background = loaded.some(function(src) { return /[?&]render=(?!explicit)/.test(src); });
+		result.scripts.push({provider: provider.name, background: background});
+	}
+});
+if (form) {
+	var images = form.querySelectorAll('img');
+	for (var j = 0; j < images.length; j++) {
+		var text = [images[j].id, images[j].getAttribute('class'), images[j].getAttribute('src'),
+					images[j].getAttribute('alt')].join(' ').toLowerCase();
+		if (text.indexOf('captcha') >= 0) result.images++;
+	}
+	var controls = form.querySelectorAll('input, textarea, select');
+	for (var k = 0; k < controls.length; k++) {
+		var control = controls[k], type = (control.getAttribute('type') || 'text').toLowerCase();
+		if (['text', 'email', 'url', 'tel'].indexOf(type) < 0 && control.tagName.toLowerCase() !== 'textarea') continue;
+		if (!visible(control) || control.getAttribute('tabindex') === '-1' ||
+			control.closest('[aria-hidden="true"]')) {
+			result.honeypots.push(k);
+		}
+	}
+}
+return result;
+"""
+
+def challenge_fields(fields):
+	"""
+	The visible fields of the snapshot asking for the text of a captcha image
+	"""
+	found = []
+	for field in fields or []:
+		if not field.get('visible', True) or field['type'] in ('hidden', 'submit', 'button', 'checkbox', 'radio'):
+			continue
+		text = ' '.join(field.get(a) or '' for a in ('name', 'id', 'class', 'placeholder', 'aria-label', 'label')).lower()
+		if any(word in text for word in CAPTCHA_FIELD_WORDS):
+			found.append(field['name'] or field['id'])
+	return found
+
+def classify_challenge(driver, form_element=None, fields=None):
+	"""
+	Classifies the protection of a form from one script call and the form
+	snapshot. Captcha widgets, captcha images and Cloudflare interstitials
+	block the submission; a reCAPTCHA v3 running in the background and
+	honeypot fields, which are left empty, do not.
+
+	Args:
+		driver: webdriver object, in the browsing context of the form
+		form_element: the contact form, None to check the page only
+		fields: field dicts from snapshot_form
+
+	Returns:
+		dict with the kind of protection ('cloudflare', 'recaptcha', 'hcaptcha',
+		'turnstile', 'friendlycaptcha', 'image_captcha', 'recaptcha_v3',
+		'honeypot' or None), whether it blocks the submission, a detail and
+		the indexes of the honeypot fields in the snapshot
+	"""
+	providers = [{'name': p['name'], 'selector': p['selector'], 'scripts': p['scripts'], 'globals': p['globals']}
+				for p in CAPTCHA_PROVIDERS]
+	found = driver.execute_script(CHALLENGE_SCRIPT, form_element, providers)
+	challenge = {'kind': None, 'blocking': False, 'detail': None, 'honeypots': found['honeypots']}
+	widgets = [widget for widget in found['widgets'] if widget['visible'] or widget['invisible']]
+	captcha_fields = challenge_fields(fields)
+	if found['interstitial']:
+		challenge.update(kind=found['interstitial'], blocking=True, detail="interstitial challenge page")
+	elif widgets:
+		widget = widgets[0]
+		challenge.update(kind=widget['provider'], blocking=True,
+						detail="invisible widget" if widget['invisible'] else "widget")
+	elif found['images'] or captcha_fields:
+		challenge.update(kind='image_captcha', blocking=True,
+						detail=', '.join(captcha_fields) or f"{found['images']} captcha images")
+	elif any(script['background'] for script in found['scripts']):
+		challenge.update(kind='recaptcha_v3', detail="background score")
+	elif found['honeypots']:
+		challenge.update(kind='honeypot', detail=f"{len(found['honeypots'])} hidden fields")
+	elif found['scripts']:
+		# Loaded, but no widget near the form, e.g. for the login form of another page part
+		challenge.update(detail=f"{found['scripts'][0]['provider']} script without a widget")
+	return challenge
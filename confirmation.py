@@ -0,0 +1,295 @@
+import time
+from selenium.common.exceptions import WebDriverException
+from waits import STAGE_TIMEOUTS, POLL_INTERVAL
+from http_submit import ERROR_MARKERS
+
+# Elements which sites and form plugins show once the message was sent
+SUCCESS_SELECTOR = ('.alert-success, .wpcf7-mail-sent-ok, .wpcf7-response-output.sent, '
+					'.form-success, .success-message, .submitted-message, [role="status"].success')
+
+# Fields the page or the form plugin flagged as invalid after the submission
+INVALID_SELECTOR = '[aria-invalid="true"], .wpcf7-not-valid, .wpcf7-validation-errors'
+
+# Signals which decide the outcome on their own, the others only confirm the
+# submission if nothing better shows up within the grace period
+STRONG_SIGNALS = ('phrase', 'success_class', 'response_error')
+
+# Installed on the page right before the submit click. A MutationObserver checks
+# every change of the page for a new confirmation phrase or success element,
+# and fetch / XMLHttpRequest are wrapped to record the status of the POSTs of
+# the form: the ones to its action, or carrying the values typed in its fields.
+# Phrases, error messages, success elements and invalid fields already on the
+# page before the click do not count. Returns what identifies the form and the
+# error messages of the page, to check them again after a navigation.
+ARM_SCRIPT = """
+var form = arguments[0], phrases = arguments[1], selector = arguments[2];
+var errors = arguments[3], invalidSelector = arguments[4];
+function count(text, phrase) {
+	var n = 0, at = text.indexOf(phrase);
+	while (at >= 0) { n++; at = text.indexOf(phrase, at + phrase.length); }
+	return n;
+}
+function bodyText() {
+	return document.body ? document.body.innerText.toLowerCase() : '';
+}
+function visible(el) {
+	return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
+var baseline = {}, text = bodyText();
+phrases.forEach(function(phrase) { baseline[phrase] = count(text, phrase); });
+var oldSuccess = Array.prototype.slice.call(document.querySelectorAll(selector)).filter(visible);
+var errorBaseline = {};
+errors.forEach(function(marker) { errorBaseline[marker] = count(text, marker); });
+var oldInvalid = Array.prototype.slice.call(document.querySelectorAll(invalidSelector)).filter(visible);
+function path(url) {
+	try { url = new URL(String(url), location.href); } catch (e) { return null; }
+	return url.origin + url.pathname.replace(/\\/+$/, '');
+}
+var action = path(form.getAttribute('action') || location.href);
+var values = Array.prototype.slice.call(form.elements).filter(function(el) {
+	return /^(text|email|tel|textarea)$/.test(el.type) && el.value.trim().length >= 5;
+}).map(function(el) { return el.value.trim(); });
+function requestText(body) {
+	if (typeof body === 'string') return body;
+	if (window.URLSearchParams && body instanceof URLSearchParams) return body.toString();
+	if (window.FormData && body instanceof FormData) {
+		var text = '';
+		body.forEach(function(value) { if (typeof value === 'string') text += value + '\\n'; });
+		return text;
+	}
+	return '';
+}
+function carriesForm(body) {
+	var text = body ? requestText(body) : '';
+	return !!text && values.some(function(value) {
+		return text.indexOf(value) >= 0 || text.indexOf(encodeURIComponent(value)) >= 0
+			|| text.indexOf(new URLSearchParams({v: value}).toString().slice(2)) >= 0
+			|| text.indexOf(JSON.stringify(value).slice(1, -1)) >= 0;
+	});
+}
+var state = {url: location.href, signal: null, detail: null, responses: []};
+state.check = function() {
+	if (state.signal) return;
+	var text = bodyText();
+	for (var i = 0; i < phrases.length; i++) {
+		if (count(text, phrases[i]) > baseline[phrases[i]]) {
+			state.signal = 'phrase'; state.detail = phrases[i]; return;
+		}
+	}
+	var success = document.querySelectorAll(selector);
+	for (var j = 0; j < success.length; j++) {
+		if (oldSuccess.indexOf(success[j]) < 0 && visible(success[j]) && success[j].innerText.trim()) {
+			state.signal = 'success_class'; state.detail = success[j].className; return;
+		}
+	}
+};
+state.error = function() {
+	var text = bodyText();
+	for (var i = 0; i < errors.length; i++) {
+		if (count(text, errors[i]) > errorBaseline[errors[i]]) return errors[i];
+	}
+	var invalid = document.querySelectorAll(invalidSelector);
+	for (var j = 0; j < invalid.length; j++) {
+		if (oldInvalid.indexOf(invalid[j]) < 0 && visible(invalid[j])) {
+			return 'invalid ' + (invalid[j].name || invalid[j].className);
+		}
+	}
+	return null;
+};
+state.formRemoved = function() {
+	return !document.contains(form) || !visible(form);
+};
+// Analytics and other scripts post too, only the requests of the form count
+state.record = function(method, url, body, status) {
+	if ((method || 'GET').toUpperCase() !== 'POST') return;
+	if (path(url) === action || carriesForm(body)) state.responses.push({url: String(url), status: status});
+};
+// The wrappers are installed once per document and report to its latest state
+function record(method, url, body, status) {
+	if (window.__contactBotConfirm) window.__contactBotConfirm.record(method, url, body, status);
+}
+if (window.fetch && !window.__contactBotFetch) {
+	window.__contactBotFetch = window.fetch;
+	window.fetch = function(input, init) {
+		var method = (init && init.method) || (input && input.method);
+		var url = (input && input.url) || input;
+		var body = init && init.body;
+		return window.__contactBotFetch.apply(this, arguments).then(function(response) {
+			record(method, url, body, response.status);
+			return response;
+		});
+	};
+}
+if (!window.__contactBotXhr) {
+	window.__contactBotXhr = {open: XMLHttpRequest.prototype.open, send: XMLHttpRequest.prototype.send};
+	XMLHttpRequest.prototype.open = function(method, url) {
+		this.__contactBotRequest = {method: method, url: url};
+		return window.__contactBotXhr.open.apply(this, arguments);
+	};
+	XMLHttpRequest.prototype.send = function(body) {
+		var request = this.__contactBotRequest;
+		if (request) {
+			this.addEventListener('loadend', function() { record(request.method, request.url, body, this.status); });
+		}
+		return window.__contactBotXhr.send.apply(this, arguments);
+	};
+}
+var pending = false;
+var observer = new MutationObserver(function() {
+	// innerText lays the page out, check at most every 100 ms
+	if (pending) return;
+	pending = true;
+	setTimeout(function() { pending = false; state.check(); }, 100);
+});
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true, attributes: true});
+window.__contactBotConfirm = state;
+return {url: location.href, action: action, id: form.id || null, name: form.getAttribute('name'), errors: errorBaseline,
+		fields: Array.prototype.slice.call(form.elements).map(function(el) { return el.name; }).filter(Boolean)};
+"""
+
+# Reads the signals in one call. A missing state means the submit loaded a new
+# document, which is then checked as a whole, with the status of its POST. The
+# form only counts as removed if the new document has no visible form with the
+# id, the name or the fields of the submitted one, as a server answering with
+# the form and its errors reloads it. A change of the url fragment alone is no
+# url change.
+POLL_SCRIPT = """
+var phrases = arguments[0], armed = arguments[1], invalidSelector = arguments[2];
+var state = window.__contactBotConfirm;
+function visible(el) {
+	return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
+function page(url) {
+	return url.split('#')[0];
+}
+function count(text, marker) {
+	var n = 0, at = text.indexOf(marker);
+	while (at >= 0) { n++; at = text.indexOf(marker, at + marker.length); }
+	return n;
+}
+function sameForm(form) {
+	if (armed.id && form.id === armed.id) return true;
+	if (armed.name && form.getAttribute('name') === armed.name) return true;
+	if (!armed.fields.length) return false;
+	var names = Array.prototype.slice.call(form.elements).map(function(el) { return el.name; });
+	return armed.fields.every(function(name) { return names.indexOf(name) >= 0; });
+}
+if (!state) {
+	var text = document.body ? document.body.innerText.toLowerCase() : '';
+	var navigation = performance.getEntriesByType('navigation')[0];
+	var phrase = null;
+	for (var i = 0; i < phrases.length; i++) {
+		if (text.indexOf(phrases[i]) >= 0) { phrase = phrases[i]; break; }
+	}
+	var removed = !!armed && !Array.prototype.slice.call(document.forms).some(function(form) {
+		return visible(form) && sameForm(form);
+	});
+	var error = null;
+	if (armed) {
+		for (var marker in armed.errors) {
+			if (count(text, marker) > armed.errors[marker]) { error = marker; break; }
+		}
+	}
+	var invalid = Array.prototype.slice.call(document.querySelectorAll(invalidSelector)).filter(visible);
+	if (!error && invalid.length) error = 'invalid ' + (invalid[0].name || invalid[0].className);
+	return {navigated: true, url: location.href, phrase: phrase, signal: phrase ? 'phrase' : null,
+			status: navigation && navigation.responseStatus || null, responses: [], formRemoved: removed,
+			urlChanged: removed && !!armed && page(location.href) !== page(armed.url), error: error};
+}
+state.check();
+return {navigated: false, url: location.href, signal: state.signal, phrase: state.detail,
+		status: null, responses: state.responses, formRemoved: state.formRemoved(),
+		urlChanged: page(location.href) !== page(state.url), error: state.error()};
+"""
+
+def arm_confirmation(driver, form_element, confirmation_messages):
+	"""
+	Starts watching the page for the confirmation signals, to be called
+	right before the submit click in the browsing context of the form
+
+	Args:
+		driver: webdriver object
+		form_element: the form which is submitted
+		confirmation_messages: list of strings to check if the submission was successfull
+
+	Returns:
+		dict identifying the form (url, action, id, name, fields), for detect_confirmation
+	"""
+	return driver.execute_script(ARM_SCRIPT, form_element, [m.lower() for m in confirmation_messages],
+								SUCCESS_SELECTOR, list(ERROR_MARKERS), INVALID_SELECTOR)
+
+def read_signals(state):
+	"""
+	Turns one poll of the page into the signals which fired
+
+	Returns:
+		list of (signal, detail) tuples, the strongest first
+	"""
+	signals = []
+	if state['signal']:
+		signals.append((state['signal'], state['phrase']))
+	statuses = [r['status'] for r in state['responses'] if r['status']]
+	# A new document still showing the form is the server answering with its errors, whatever its status
+	if state['status'] and (state['status'] >= 400 or state['formRemoved']):
+		statuses.append(state['status'])
+	errors = [status for status in statuses if status >= 400]
+	if errors:
+		signals.append(('response_error', errors[-1]))
+	elif statuses:
+		signals.append(('response_ok', statuses[-1]))
+	if state.get('urlChanged'):
+		signals.append(('url_change', state['url']))
+	if state['formRemoved']:
+		signals.append(('form_removed', None))
+	return signals
+
+def detect_confirmation(driver, confirmation_messages, timeout=None, grace=1.5, form=None):
+	"""
+	Watches all the confirmation signals at once, after the submit click,
+	and returns as soon as one decides: a new confirmation phrase or success
+	element confirms, an error status of the form POST fails. A changed url,
+	a removed form or a successful POST of the form confirm if nothing else
+	shows up within the grace period and no new error message or invalid
+	field appeared, as form plugins answer a rejected form with a 200.
+
+	Args:
+		driver: webdriver object, in the browsing context armed before the click
+		confirmation_messages: list of strings to check if the submission was successfull
+		form: what arm_confirmation returned, to tell whether a new document still has the form
+		timeout: overall deadline in seconds, the 'confirm' stage budget by default
+		grace: seconds a weak signal waits for a phrase or an error
+
+	Returns:
+		(confirmed, signal, detail), signal being the name of the signal which
+		decided the outcome, or 'timeout'
+	"""
+	if timeout is None:
+		timeout = STAGE_TIMEOUTS['confirm']
+	phrases = [m.lower() for m in confirmation_messages]
+	deadline = time.time() + timeout
+	weak = None
+	error = None
+	while True:
+		try:
+			state = driver.execute_script(POLL_SCRIPT, phrases, form, INVALID_SELECTOR)
+		except WebDriverException:
+			# The frame of the form went away or the page is navigating
+			state = None
+			try:
+				driver.switch_to.default_content()
+			except WebDriverException:
+				pass
+		if state:
+			error = state.get('error')
+			for signal, detail in read_signals(state):
+				if signal in STRONG_SIGNALS:
+					return signal != 'response_error', signal, detail
+				if weak is None:
+					weak = (signal, detail, time.time())
+		if weak and time.time() >= min(weak[2] + grace, deadline):
+			if error:
+				return False, 'form_error', error
+			return True, weak[0], weak[1]
+		if time.time() >= deadline:
+			return False, 'timeout', None
+		time.sleep(POLL_INTERVAL)
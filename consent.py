@@ -0,0 +1,215 @@
+import time
+from selenium.common.exceptions import WebDriverException
+from waits import STAGE_TIMEOUTS, POLL_INTERVAL, pause
+from lexicon import keywords
+
+# Consent management platforms: the window globals and the banner which reveal
+# them, the call of their API accepting everything, and their accept button
+CONSENT_PLATFORMS = [
+	{'name': 'onetrust',
+	'globals': ['OneTrust', 'Optanon'],
+	'banner': '#onetrust-banner-sdk',
+	'accept': "OneTrust.AllowAll(); return true;",
+	'button': '#onetrust-accept-btn-handler'},
+	{'name': 'cookiebot',
+	'globals': ['Cookiebot'],
+	'banner': '#CybotCookiebotDialog',
+	'accept': "Cookiebot.submitCustomConsent(true, true, true); if (Cookiebot.hide) Cookiebot.hide(); return true;",
+	'button': '#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll, #CybotCookiebotDialogBodyButtonAccept'},
+	{'name': 'didomi',
+	'globals': ['Didomi'],
+	'banner': '#didomi-popup, #didomi-notice',
+	'accept': "Didomi.setUserAgreeToAll(); return true;",
+	'button': '#didomi-notice-agree-button'},
+	{'name': 'usercentrics',
+	'globals': ['UC_UI', '__ucCmp'],
+	'banner': '#usercentrics-root, #usercentrics-cmp-ui',
+	'accept': ("if (window.UC_UI) { UC_UI.acceptAllConsents(); if (UC_UI.closeCMP) UC_UI.closeCMP(); return true; }"
+				"__ucCmp.acceptAllConsents().then(function() { __ucCmp.closeCmp(); }); return true;"),
+	'button': '[data-testid="uc-accept-all-button"], #uc-btn-accept-banner'},
+	{'name': 'quantcast',
+	'globals': [],
+	'banner': '#qc-cmp2-container, .qc-cmp2-container',
+	'accept': None,
+	'button': '.qc-cmp2-summary-buttons button[mode="primary"], #qc-cmp2-ui button[mode="primary"]'},
+]
+
+# Banners of the other sites, checked when no platform is found
+GENERIC_BANNER_SELECTOR = ('[id*="cookie" i], [class*="cookie" i], [id*="consent" i], [class*="consent" i], '
+							'[id*="gdpr" i], [class*="gdpr" i], [aria-label*="cookie" i], [aria-label*="consent" i]')
+
+# Seconds to wait for a banner to show up on a ready page before giving up
+CONSENT_WINDOW = 1.5
+
+# Runs before the scripts of every new document and stores the "already
+# answered" state of the platforms which only need a first-party cookie or
+# localStorage entry, so their banner is never rendered
+PRESEED_SCRIPT = """
+(function() {
+	try {
+		if (location.protocol.indexOf('http') !== 0) return;
+		var expires = new Date(Date.now() + 365 * 864e5).toUTCString();
+		function set(name, value) {
+			if (document.cookie.indexOf(name + '=') < 0) {
+				document.cookie = name + '=' + value + '; path=/; expires=' + expires + '; SameSite=Lax';
+			}
+		}
+		set('OptanonAlertBoxClosed', encodeURIComponent(new Date().toISOString()));
+		set('CookieConsent', encodeURIComponent("{stamp:'-1',necessary:true,preferences:true,statistics:true," +
+			"marketing:true,method:'explicit',ver:1,utc:" + Date.now() + "}"));
+		set('cookieconsent_status', 'allow');
+		if (!localStorage.getItem('uc_user_interaction')) localStorage.setItem('uc_user_interaction', 'true');
+	} catch (e) {}
+})();
+"""
+
+# Finds the platform and whether a banner is visible, in one call
+PROBE_SCRIPT = """
+var platforms = arguments[0], generic = arguments[1];
+function visible(el) {
+	if (!el) return false;
+	if (el.shadowRoot) return true;
+	var style = window.getComputedStyle(el);
+	return style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0' &&
+		!!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
+for (var i = 0; i < platforms.length; i++) {
+	var platform = platforms[i], banner = document.querySelector(platform.banner);
+	var loaded = platform.globals.some(function(name) { return !!window[name]; });
+	if (banner || loaded) {
+		return {platform: platform.name, banner: visible(banner)};
+	}
+}
+var candidates = document.querySelectorAll(generic);
+for (var j = 0; j < candidates.length; j++) {
+	var el = candidates[j];
+	if (visible(el) && el.querySelector('button, a, [role="button"], input[type="submit"], input[type="button"]')) {
+		return {platform: null, banner: true};
+	}
+}
+return {platform: null, banner: false};
+"""
+
+# Accepts with the platform API, or clicks its accept button, also inside shadow roots
+PLATFORM_ACCEPT_SCRIPT = """
+var api = arguments[0], selector = arguments[1];
+if (api) {
+	try {
+		if (new Function(api)()) return 'api';
+	} catch (e) {}
+}
+function find(root) {
+	var el = root.querySelector(selector);
+	if (el) return el;
+	var hosts = root.querySelectorAll('*');
+	for (var i = 0; i < hosts.length; i++) {
+		if (hosts[i].shadowRoot) {
+			el = find(hosts[i].shadowRoot);
+			if (el) return el;
+		}
+	}
+	return null;
+}
+var button = find(document);
+if (button) {
+	button.click();
+	return 'button';
+}
+return null;
+"""
+
+# Fallback: the buttons and links whose text, id, class or data-action has an
+# accept keyword, inside the cookie banner if there is one
+GENERIC_ACCEPT_SCRIPT = """
+var words = arguments[0], generic = arguments[1];
+var scopes = Array.prototype.slice.call(document.querySelectorAll(generic));
+scopes.push(document);
+for (var s = 0; s < scopes.length; s++) {
+	var elements = scopes[s].querySelectorAll('button, a, [role="button"], input[type="submit"], input[type="button"], div[class*="button"]');
+	for (var i = 0; i < elements.length; i++) {
+		var el = elements[i];
+		if (!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)) continue;
+		var text = [el.innerText || el.value || '', el.id, el.getAttribute('class'), el.getAttribute('data-action')]
+			.join(' ').toLowerCase();
+		for (var w = 0; w < words.length; w++) {
+			if (text.indexOf(words[w]) >= 0) {
+				el.click();
+				return (el.innerText || el.id || el.tagName).trim().slice(0, 50);
+			}
+		}
+	}
+}
+return null;
+"""
+
+def install_consent_preseed(driver):
+	"""
+	Registers the pre-seeding script to run before the scripts of every page
+	loaded by the driver. Only Chrome supports it, other drivers are left as they are.
+	"""
+	try:
+		driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': PRESEED_SCRIPT})
+	except (WebDriverException, AttributeError):
+		pass
+
+def probe_consent(driver):
+	"""
+	Returns:
+		dict with the name of the consent platform of the page, or None, and
+		whether a banner is visible
+	"""
+	platforms = [{'name': p['name'], 'globals': p['globals'], 'banner': p['banner']} for p in CONSENT_PLATFORMS]
+	return driver.execute_script(PROBE_SCRIPT, platforms, GENERIC_BANNER_SELECTOR)
+
+def accept_platform(driver, name):
+	"""
+	Accepts the consent with the known action of the platform
+
+	Returns:
+		'api' or 'button' depending on how it was accepted, None if it was not
+	"""
+	platform = next(p for p in CONSENT_PLATFORMS if p['name'] == name)
+	return driver.execute_script(PLATFORM_ACCEPT_SCRIPT, platform['accept'], platform['button'])
+
+def handle_consent(driver, lang='en', window=CONSENT_WINDOW):
+	"""
+	Accepts the cookie consent of the page, if it shows a banner. The
+	consent platform is recognized with one probe and accepted with its own
+	action; other banners are accepted through the generic search of an
+	accept button. Gives up when no banner shows up within the window.
+
+	Args:
+		driver: webdriver object
+		lang: language of the page, selects the accept keywords of the fallback
+		window: seconds to wait for a banner, 0 for a single probe
+
+	Returns:
+		how the consent was handled: the platform and action, 'generic',
+		'no banner' or 'not accepted'
+	"""
+	deadline = time.time() + min(window, STAGE_TIMEOUTS['cookie'])
+	while True:
+		try:
+			probe = probe_consent(driver)
+		except WebDriverException:
+			probe = {'platform': None, 'banner': False}
+		if probe['banner']:
+			break
+		if time.time() >= deadline:
+			print("No cookie pop-up found")
+			return 'no banner'
+		time.sleep(POLL_INTERVAL)
+
+	if probe['platform']:
+		action = accept_platform(driver, probe['platform'])
+		if action:
+			pause('click')
+			print(f"Cookie pop-up of {probe['platform']} accepted with its {action}")
+			return f"{probe['platform']} {action}"
+	clicked = driver.execute_script(GENERIC_ACCEPT_SCRIPT, keywords('accept', lang), GENERIC_BANNER_SELECTOR)
+	if clicked:
+		pause('click')
+		print(f"Cookie pop-up accepted with '{clicked}'")
+		return 'generic'
+	print("Cookie pop-up found but not accepted")
+	return 'not accepted'
@@ -0,0 +1,261 @@
+import time
+import queue
+import asyncio
+import threading
+import requests
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from lexicon import keywords, language_code
+
+SKIP_SCHEMES = ('mailto:', 'tel:', 'javascript:', 'data:', '#')
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+			"(KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+def create_session(pool_size=16):
+	"""
+	Creates the pooled HTTP session used by the prefetch stage
+	"""
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+	session.mount('http://', adapter)
+	session.mount('https://', adapter)
+	session.headers['User-Agent'] = USER_AGENT
+	return session
+
+def same_site(url, base_url):
+	host = urlparse(url).netloc.lower().removeprefix('www.')
+	return host == urlparse(base_url).netloc.lower().removeprefix('www.')
+
+def score_contact_text(text, lang='en'):
+	"""
+	Scores the visible text of a link or button for the contact keywords,
+	short texts like 'Contact us' get a bonus
+	"""
+	text = ' '.join((text or '').lower().split())
+	score = 0
+	for keyword in keywords('contact', lang):
+		if keyword in text:
+			score += 4
+			if len(text) <= len(keyword) + 4:
+				score += 1
+	return score
+
+def score_contact_link(href, text, base_url, in_nav=False, lang='en'):
+	"""
+	Scores how likely a link leads to the contact page
+
+	Args:
+		href: href attribute of the link
+		text: visible text of the link
+		base_url: url of the page the link is on
+		in_nav: True if the link is inside the header, nav or footer
+		lang: language of the page, selects the contact keywords
+
+	Returns:
+		(score, absolute url), score is 0 for links which are not contact links
+	"""
+	href = (href or '').strip()
+	if not href or href.lower().startswith(SKIP_SCHEMES):
+		return 0, None
+	url = urljoin(base_url, href)
+	if urlparse(url).scheme not in ('http', 'https'):
+		return 0, None
+	path = urlparse(url).path.lower()
+
+	score = score_contact_text(text, lang)
+	for keyword in keywords('contact', lang):
+		slug = keyword.replace(' ', '-')
+		if slug in path:
+			score += 4
+			# '/contact' itself beats '/contact-sales/europe/...'
+			if path.rstrip('/').endswith(slug) or path.rstrip('/').endswith(slug + '.html'):
+				score += 2
+	if not score:
+		return 0, None
+	if in_nav:
+		score += 2
+	if same_site(url, base_url):
+		score += 2
+	else:
+		score -= 4
+	return score, url
+
+def has_contact_form(soup):
+	"""
+	Checks if the HTML already has a form with an email input and a textarea
+	"""
+	for form in soup.find_all('form'):
+		if not form.find('textarea'):
+			continue
+		for el in form.find_all('input'):
+			attributes = ' '.join([el.get('type', ''), el.get('name', ''), el.get('id', ''),
+									el.get('placeholder', '')]).lower()
+			if 'mail' in attributes:
+				return True
+	return False
+
+def parse_page(html, base_url):
+	"""
+	Ranks the contact link candidates of a page and checks it for a static contact form
+
+	Args:
+		html: HTML of the page
+		base_url: final url of the page
+
+	Returns:
+		(list of (score, url, text) candidates best first, True if the page has a contact form)
+	"""
+	soup = BeautifulSoup(html, 'html.parser')
+	lang = language_code(soup.html.get('lang') if soup.html else None)
+	candidates = {}
+	for link in soup.find_all('a', href=True):
+		text = link.get_text(' ', strip=True) or link.get('title', '') or link.get('aria-label', '')
+		in_nav = link.find_parent(['nav', 'header', 'footer']) is not None
+		score, url = score_contact_link(link['href'], text, base_url, in_nav, lang)
+		if score and score > candidates.get(url, (0, ''))[0]:
+			candidates[url] = (score, text)
+	ranked = sorted(((score, url, text) for url, (score, text) in candidates.items()),
+					key=lambda c: -c[0])
+	return ranked, has_contact_form(soup)
+
+def fetch(session, url, timeout):
+	response = session.get(url, timeout=timeout, allow_redirects=True)
+	return response.status_code, response.url, response.text
+
+async def prefetch_site(session, website_url, semaphore, timeout=10):
+	"""
+	Fetches the homepage, finds the contact page and checks both for a
+	static contact form
+
+	Returns:
+		discovery dict with the contact url, the ranked candidates, the url
+		where a static contact form was found and the error if any
+	"""
+	result = {'website': website_url,
+			'final_url': None,
+			'contact_url': None,
+			'candidates': [],
+			'static_form': False,
+			'form_url': None,
+			'error': None,
+			'elapsed': None}
+	async with semaphore:
+		start = time.time()
+		try:
+			url = website_url if '://' in website_url else 'http://' + website_url
+			status, final_url, html = await asyncio.to_thread(fetch, session, url, timeout)
+			result['final_url'] = final_url
+			if status >= 400:
+				result['error'] = f"HTTP {status}"
+				return result
+			candidates, static_form = parse_page(html, final_url)
+			result['candidates'] = [(score, url) for score, url, _ in candidates[:5]]
+			if static_form:
+				result['static_form'] = True
+				result['form_url'] = final_url
+			if candidates:
+				result['contact_url'] = candidates[0][1]
+				if not static_form:
+					status, contact_url, html = await asyncio.to_thread(
+						fetch, session, result['contact_url'], timeout)
+					if status < 400 and has_contact_form(BeautifulSoup(html, 'html.parser')):
+						result['static_form'] = True
+						result['form_url'] = contact_url
+		except Exception as e:
+			result['error'] = str(e)
+		finally:
+			result['elapsed'] = round(time.time() - start, 3)
+	return result
+
+async def prefetch_all(website_urls, concurrency=16, timeout=10):
+	"""
+	Runs the prefetch of all websites concurrently, at most `concurrency` at a time
+
+	Returns:
+		dict of website url to its discovery dict
+	"""
+	session = create_session(concurrency)
+	semaphore = asyncio.Semaphore(concurrency)
+	results = {}
+
+	async def run(url):
+		results[url] = await prefetch_site(session, url, semaphore, timeout)
+
+	try:
+		await asyncio.gather(*(run(url) for url in website_urls))
+	finally:
+		session.close()
+	return results
+
+def prefetch_homepages(website_urls, concurrency=16, timeout=10):
+	"""
+	Finds the contact pages of the websites over plain HTTP, before any browser starts
+
+	Args:
+		website_urls: list of website urls
+		concurrency: number of parallel requests
+		timeout: timeout of each request, in seconds
+
+	Returns:
+		dict of website url to its discovery dict
+	"""
+	return asyncio.run(prefetch_all(website_urls, concurrency, timeout))
+
+def prefetch_rows(rows, concurrency=16, timeout=10, skip=None):
+	"""
+	Streams the rows together with their discovery as soon as each prefetch
+	finishes, so the browsers can start before the whole list is prefetched.
+	Only a bounded number of rows is prefetched ahead of the consumer.
+
+	Args:
+		rows: iterable of (row_id, website, event) tuples
+		skip: optional callable telling which rows need no prefetch, they
+			are passed through with None as discovery
+
+	Yields:
+		(row, discovery dict) tuples, in completion order
+	"""
+	done = queue.Queue(maxsize=concurrency * 4)
+	finished = object()
+	rows = iter(rows)
+
+	def intake():
+		# The rows may come from a blocking source, like the preflight with its
+		# journal writes, so they are read off the event loop with the skip check
+		row = next(rows, finished)
+		return row, row is not finished and bool(skip and skip(row))
+
+	async def run_all():
+		session = create_session(concurrency)
+		semaphore = asyncio.Semaphore(concurrency)
+		pending = set()
+
+		async def run(row):
+			discovery = await prefetch_site(session, row[1], semaphore, timeout)
+			await asyncio.to_thread(done.put, (row, discovery))
+
+		try:
+			while True:
+				row, skipped = await asyncio.to_thread(intake)
+				if row is finished:
+					break
+				if skipped:
+					await asyncio.to_thread(done.put, (row, None))
+					continue
+				pending.add(asyncio.ensure_future(run(row)))
+				if len(pending) >= concurrency * 2:
+					_, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+			if pending:
+				await asyncio.wait(pending)
+		finally:
+			session.close()
+			done.put(finished)
+
+	thread = threading.Thread(target=lambda: asyncio.run(run_all()), daemon=True)
+	thread.start()
+	while True:
+		item = done.get()
+		if item is finished:
+			break
+		yield item
@@ -0,0 +1,85 @@
+import time
+import json
+import sqlite3
+from urllib.parse import urlsplit
+
+
+def domain_of(url):
+	"""
+	Cache key of a website: its host without 'www.'
+	"""
+	if '://' not in url:
+		url = 'http://' + url
+	return urlsplit(url).netloc.lower().removeprefix('www.')
+
+
+class DiscoveryCache:
+	"""
+	On-disk cache of what the discovery found on each domain: the contact page
+	url, the frame holding the form, the form fingerprint and the field mapping.
+	Stored in SQLite so the pool workers can share it. Entries expire after
+	the TTL, and the least recently used ones are evicted above max_entries.
+	"""
+
+	def __init__(self, path, ttl_days=30, max_entries=10000):
+		self.ttl = ttl_days * 24 * 3600
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		# The prefetch thread reads it while the main thread owns it
+		self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS discovery (
+									domain TEXT PRIMARY KEY,
+									entry TEXT NOT NULL,
+									created REAL NOT NULL,
+									used REAL NOT NULL)""")
+		self.connection.commit()
+
+	def get(self, url):
+		"""
+		Returns:
+			the cached entry of the url's domain, or None if there is no fresh one
+		"""
+		row = self.connection.execute("SELECT entry, created FROM discovery WHERE domain = ?",
+									(domain_of(url),)).fetchone()
+		if row is None or time.time() - row[1] > self.ttl:
+			self.misses += 1
+			return None
+		self.hits += 1
+		with self.connection:
+			self.connection.execute("UPDATE discovery SET used = ? WHERE domain = ?",
+									(time.time(), domain_of(url)))
+		return json.loads(row[0])
+
+	def contains(self, url):
+		"""
+		Checks for a fresh entry without counting it as a hit or a miss
+		"""
+		row = self.connection.execute("SELECT created FROM discovery WHERE domain = ?",
+									(domain_of(url),)).fetchone()
+		return row is not None and time.time() - row[0] <= self.ttl
+
+	def put(self, url, entry):
+		now = time.time()
+		with self.connection:
+			self.connection.execute("INSERT OR REPLACE INTO discovery VALUES (?, ?, ?, ?)",
+									(domain_of(url), json.dumps(entry), now, now))
+		self.evict()
+
+	def invalidate(self, url):
+		with self.connection:
+			self.connection.execute("DELETE FROM discovery WHERE domain = ?", (domain_of(url),))
+
+	def evict(self):
+		"""
+		Deletes the expired entries, then the least recently used ones above max_entries
+		"""
+		with self.connection:
+			self.connection.execute("DELETE FROM discovery WHERE created < ?", (time.time() - self.ttl,))
+			self.connection.execute("""DELETE FROM discovery WHERE domain NOT IN
+									(SELECT domain FROM discovery ORDER BY used DESC LIMIT ?)""",
+									(self.max_entries,))
+
+	def close(self):
+		self.connection.close()
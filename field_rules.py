@@ -0,0 +1,138 @@
+import os
+import json
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'field_rules.json')
+
+# Input types which can not receive typed text
+NOT_TYPABLE = frozenset(['hidden', 'submit', 'button', 'reset', 'image', 'checkbox', 'radio', 'file'])
+
+def load_rules(path=RULES_PATH):
+	with open(path, 'r') as f:
+		return json.load(f)
+
+def compile_rules(config):
+	"""
+	Compiles the field matching rules into matchers
+
+	Args:
+		config: dict read from field_rules.json
+
+	Returns:
+		dict with the attribute weights, the keywords of all rules and the compiled rules
+	"""
+	bonus = config.get('keyword_bonus', 0)
+	keywords = set()
+	rules = []
+	for index, rule in enumerate(config['rules']):
+		groups = [(frozenset(k.lower() for k in group), (len(group) - 1) * bonus)
+				for group in rule['keywords']]
+		exclude = frozenset(k.lower() for k in rule.get('exclude', []))
+		for group, _ in groups:
+			keywords.update(group)
+		keywords.update(exclude)
+		rules.append({'index': index,
+					'field': rule['field'],
+					'key': rule['key'],
+					'action': rule.get('action', 'type'),
+					'tags': frozenset(rule['tags']),
+					'types': frozenset(rule['types']) if 'types' in rule else None,
+					'groups': groups,
+					'exclude': exclude,
+					'priority': rule.get('priority', 0),
+					'default_score': rule.get('default_score', 0)})
+	return {'weights': sorted(config['attribute_weights'].items(), key=lambda w: -w[1]),
+			'keywords': tuple(sorted(keywords)),
+			'rules': rules}
+
+def field_keywords(field, compiled):
+	"""
+	Finds which rule keywords are present in each attribute of the field
+
+	Returns:
+		dict of attribute name to the frozenset of keywords found in it
+	"""
+	found = {}
+	for attribute, _ in compiled['weights']:
+		text = field.get(attribute)
+		if text:
+			text = text.lower()
+			found[attribute] = frozenset(k for k in compiled['keywords'] if k in text)
+	return found
+
+def is_candidate(rule, field):
+	if field['tag'] not in rule['tags'] or field.get('disabled') or not field.get('visible', True):
+		return False
+	if rule['types'] is not None:
+		return field.get('type', '') in rule['types']
+	return field['tag'] != 'input' or field.get('type', '') not in NOT_TYPABLE
+
+def score_field(rule, found, weights):
+	"""
+	Scores how well a field matches a rule: the weight of the best attribute
+	containing all keywords of one of the rule's keyword groups, plus a bonus
+	for groups with more keywords
+
+	Returns:
+		(score, attribute which matched), score is 0 when nothing matched
+	"""
+	best, matched_by = 0, None
+	for attribute, weight in weights:
+		present = found.get(attribute)
+		if not present or present & rule['exclude']:
+			continue
+		for group, bonus in rule['groups']:
+			if weight + bonus > best and group <= present:
+				best, matched_by = weight + bonus, attribute
+	if matched_by:
+		return best + rule['priority'], matched_by
+	if rule['default_score']:
+		return rule['default_score'], 'tag'
+	return 0, None
+
+def assign_fields(fields, compiled=None):
+	"""
+	Scores every field against every rule in one pass and assigns each
+	field to its best matching rule, best scores first, so a generic rule
+	like 'name' can not take a field that a specific rule matches better
+
+	Args:
+		fields: field dicts from the form snapshot or fields_from_html
+		compiled: compiled rules, the bundled rules by default
+
+	Returns:
+		list of matches: dicts with the rule, the field, the score and the
+		attribute which matched, in page order
+	"""
+	compiled = compiled or FIELD_RULES
+	weights = compiled['weights']
+	scored = []
+	for position, field in enumerate(fields):
+		found = None
+		for rule in compiled['rules']:
+			if not is_candidate(rule, field):
+				continue
+			if found is None:
+				found = field_keywords(field, compiled)
+			score, matched_by = score_field(rule, found, weights)
+			if score:
+				scored.append((-score, position, rule['index'], matched_by))
+
+	scored.sort()
+	used_fields = set()
+	used_rules = set()
+	matches = []
+	for score, position, rule_index, matched_by in scored:
+		if position in used_fields or rule_index in used_rules:
+			continue
+		used_fields.add(position)
+		used_rules.add(rule_index)
+		matches.append({'rule': compiled['rules'][rule_index],
+						'field': fields[position],
+						'score': -score,
+						'matched_by': matched_by,
+						'position': position})
+	matches.sort(key=lambda match: match['position'])
+	return matches
+
+
+FIELD_RULES = compile_rules(load_rules())
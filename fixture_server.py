@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import time
+import threading
+from urllib.parse import urlsplit, parse_qsl, unquote
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+GENERATED_TYPES = {
+	'png': 'image/png',
+	'jpg': 'image/jpeg',
+	'woff2': 'font/woff2',
+	'mp4': 'video/mp4',
+	'js': 'application/javascript',
+	'css': 'text/css',
+}
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+	"""
+	Serves the fixtures directory, with:
+		- /generated/<kb>kb.<ext> returning a payload of that size, so the
+		  heavy assets of the fixture sites do not need to be stored
+		- ?delay=<seconds> on any path, to simulate slow resources
+		- ?redirect=<url> on any path, answered with a 301 to that url
+		- counters of the requests and bytes served
+		- POSTs recorded with their form or JSON fields, answered with the
+		  thanks.html page of the site if it has one
+	"""
+
+	def log_message(self, format, *args):
+		pass
+
+	def count(self, size):
+		with self.server.lock:
+			self.server.requests += 1
+			self.server.bytes_sent += size
+
+	def delay(self):
+		match = re.search(r'[?&]delay=([0-9.]+)', self.path)
+		if match:
+			time.sleep(float(match.group(1)))
+
+	def do_GET(self):
+		self.delay()
+		match = re.search(r'[?&]redirect=([^&]+)', self.path)
+		if match:
+			self.send_response(301)
+			self.send_header('Location', unquote(match.group(1)))
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+			self.count(0)
+			return
+		match = re.match(r'/generated/(\d+)kb\.(\w+)', self.path)
+		if match:
+			body = b'0' * int(match.group(1)) * 1024
+			self.send_response(200)
+			self.send_header('Content-Type', GENERATED_TYPES.get(match.group(2), 'application/octet-stream'))
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+			self.count(len(body))
+			return
+		super().do_GET()
+
+	def do_POST(self):
+		self.delay()
+		body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf-8', 'replace')
+		if 'json' in (self.headers.get('Content-Type') or ''):
+			try:
+				fields = json.loads(body)
+			except ValueError:
+				fields = {}
+		else:
+			fields = dict(parse_qsl(body, keep_blank_values=True))
+		path = urlsplit(self.path).path
+		with self.server.lock:
+			self.server.posts.append({'path': path, 'fields': fields, 'time': time.time()})
+
+		thanks = os.path.join(self.directory, os.path.dirname(path).lstrip('/'), 'thanks.html')
+		if os.path.isfile(thanks):
+			with open(thanks, 'rb') as f:
+				body = f.read()
+		else:
+			body = (b'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Thank you</title></head>'
+					b'<body><h1>Thank you for your message. It has been sent.</h1></body></html>')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		self.count(len(body))
+
+	def copyfile(self, source, outputfile):
+		data = source.read()
+		outputfile.write(data)
+		self.count(len(data))
+
+
+class FixtureServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, port=0, directory=FIXTURES_DIR, handler=FixtureHandler):
+		self.lock = threading.Lock()
+		self.requests = 0
+		self.bytes_sent = 0
+		self.posts = []
+		super().__init__(('127.0.0.1', port),
+						lambda *args: handler(*args, directory=directory))
+
+	@property
+	def url(self):
+		return f"http://127.0.0.1:{self.server_port}"
+
+	def reset_counters(self):
+		with self.lock:
+			self.requests = 0
+			self.bytes_sent = 0
+			self.posts = []
+
+	def start(self):
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+		return self
+
+
+if __name__ == '__main__':
+	server = FixtureServer(port=8000)
+	print(f"Serving {FIXTURES_DIR} on {server.url}")
+	server.serve_forever()
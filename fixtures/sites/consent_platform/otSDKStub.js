@@ -0,0 +1,26 @@
+// Stand-in for the OneTrust SDK: same banner ids, same API and the same
+// OptanonAlertBoxClosed cookie telling that the banner was answered
+window.OneTrust = {
+	AllowAll: function() {
+		document.cookie = 'OptanonAlertBoxClosed=' + encodeURIComponent(new Date().toISOString()) + '; path=/';
+		var banner = document.getElementById('onetrust-banner-sdk');
+		if (banner) banner.style.display = 'none';
+	}
+};
+document.addEventListener('DOMContentLoaded', function() {
+	if (document.cookie.indexOf('OptanonAlertBoxClosed=') !== -1) {
+		return;
+	}
+	// The real SDK renders the banner a little after the page is loaded
+	setTimeout(function() {
+		var banner = document.createElement('div');
+		banner.id = 'onetrust-banner-sdk';
+		banner.style.cssText = 'position:fixed;top:0;left:0;right:0;bottom:0;background:rgba(0,0,0,.6);z-index:1000';
+		banner.innerHTML = '<div style="background:#fff;margin:20% auto;width:400px;padding:20px">' +
+			'<p>We value your privacy.</p>' +
+			'<button id="onetrust-pc-btn-handler">Cookie settings</button> ' +
+			'<button id="onetrust-accept-btn-handler">I Accept</button></div>';
+		document.body.appendChild(banner);
+		document.getElementById('onetrust-accept-btn-handler').addEventListener('click', window.OneTrust.AllowAll);
+	}, 400);
+});
@@ -0,0 +1,18 @@
+// Cookie banner covering the whole page until it is accepted
+document.addEventListener('DOMContentLoaded', function() {
+	if (document.cookie.indexOf('banner_consent=1') !== -1) {
+		return;
+	}
+	var banner = document.createElement('div');
+	banner.id = 'cookie-banner';
+	banner.style.cssText = 'position:fixed;top:0;left:0;right:0;bottom:0;background:rgba(0,0,0,.6);z-index:1000';
+	banner.innerHTML = '<div style="background:#fff;margin:20% auto;width:400px;padding:20px">' +
+		'<p>We use cookies to improve your experience.</p>' +
+		'<button id="cookie-settings" class="btn settings">Settings</button> ' +
+		'<button id="cookie-accept" class="btn accept">Accept all</button></div>';
+	document.body.appendChild(banner);
+	document.getElementById('cookie-accept').addEventListener('click', function() {
+		document.cookie = 'banner_consent=1; path=/';
+		banner.remove();
+	});
+});
@@ -0,0 +1,44 @@
+// Controlled inputs like a React app: the values only live in the component
+// state, which is updated from the 'input' events. A value set on the DOM
+// element without an event is lost on the next render and never submitted.
+(function() {
+	var state = {name: '', email: '', phone: '', message: ''};
+	var root = document.getElementById('root');
+
+	function render() {
+		root.innerHTML =
+			'<form id="contact-form" method="post">' +
+			'<input name="name" placeholder="Name">' +
+			'<input name="email" type="email" placeholder="Email">' +
+			'<input name="phone" type="tel" placeholder="Phone">' +
+			'<textarea name="message" placeholder="Message"></textarea>' +
+			'<button type="submit">Send</button>' +
+			'</form>';
+		var form = document.getElementById('contact-form');
+		Object.keys(state).forEach(function(key) {
+			var field = form.elements[key];
+			field.value = state[key];
+			field.addEventListener('input', function(event) {
+				state[key] = event.target.value;
+			});
+			// Like a re-render, the DOM value is reset from the state on blur
+			field.addEventListener('blur', function(event) {
+				event.target.value = state[key];
+			});
+		});
+		form.addEventListener('submit', function(event) {
+			event.preventDefault();
+			fetch('api/contact', {
+				method: 'POST',
+				headers: {'Content-Type': 'application/json'},
+				body: JSON.stringify(state)
+			}).then(function(response) {
+				root.innerHTML = response.ok ?
+					'<div class="alert alert-success">Thank you! We will contact you soon.</div>' :
+					'<div class="alert alert-danger">Something went wrong.</div>';
+			});
+		});
+	}
+
+	setTimeout(render, 300);
+})();
@@ -0,0 +1,342 @@
+import json
+import hashlib
+from bs4 import BeautifulSoup
+from selenium.webdriver.support.ui import Select
+from selenium.common.exceptions import WebDriverException
+from waits import pause, wait_for_interactable
+from field_rules import assign_fields
+from lexicon import rules_for_language
+
+SNAPSHOT_SCRIPT = """
+var form = arguments[0];
+var controls = form.querySelectorAll('input, textarea, select');
+var fields = [];
+for (var i = 0; i < controls.length; i++) {
+	var el = controls[i];
+	var labels = [];
+	if (el.labels) {
+		for (var j = 0; j < el.labels.length; j++) {
+			labels.push(el.labels[j].textContent);
+		}
+	}
+	var options = [];
+	if (el.tagName.toLowerCase() === 'select') {
+		for (var k = 0; k < el.options.length; k++) {
+			options.push({value: el.options[k].value, text: el.options[k].text,
+						disabled: el.options[k].disabled});
+		}
+	}
+	fields.push({
+		element: el,
+		index: i,
+		tag: el.tagName.toLowerCase(),
+		type: (el.getAttribute('type') || '').toLowerCase(),
+		name: el.getAttribute('name') || '',
+		id: el.getAttribute('id') || '',
+		class: el.getAttribute('class') || '',
+		placeholder: el.getAttribute('placeholder') || '',
+		'aria-label': el.getAttribute('aria-label') || '',
+		autocomplete: el.getAttribute('autocomplete') || '',
+		label: labels.join(' ').replace(/\\s+/g, ' ').trim(),
+		options: options,
+		visible: !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length),
+		disabled: el.disabled
+	});
+}
+return fields;
+"""
+
+# Checkboxes ticked together with the fields: the required ones and the ones
+# asking to accept the privacy policy or the terms
+CONSENT_CHECKBOX_WORDS = ('accept', 'consent', 'privacy', 'agree', 'gdpr', 'terms')
+
+# Sets the values of all the plan steps with the native setters, so the
+# value trackers of React, Vue and Angular see a change, and dispatches the
+# input, change and blur events of a user. Radios and checkboxes are clicked.
+# Every value is read back after its blur, as frameworks may reset it then.
+FILL_SCRIPT = """
+var steps = arguments[0], form = arguments[1], words = arguments[2];
+function fire(el, name) {
+	el.dispatchEvent(new Event(name, {bubbles: true}));
+}
+function setValue(el, value) {
+	var proto = el.tagName === 'TEXTAREA' ? HTMLTextAreaElement.prototype :
+		el.tagName === 'SELECT' ? HTMLSelectElement.prototype : HTMLInputElement.prototype;
+	Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+}
+function tick(el) {
+	if (!el.checked) el.click();
+	return el.checked;
+}
+var results = [];
+for (var i = 0; i < steps.length; i++) {
+	var step = steps[i], el = step.element;
+	try {
+		if (step.action === 'click') {
+			results.push({ok: tick(el), value: el.checked, error: null});
+			continue;
+		}
+		el.focus();
+		setValue(el, step.value);
+		fire(el, 'input');
+		fire(el, 'change');
+		el.blur();
+		fire(el, 'blur');
+		results.push({ok: el.value === step.value, value: el.value, error: null});
+	} catch (e) {
+		results.push({ok: false, value: null, error: String(e)});
+	}
+}
+var consent = 0;
+if (form) {
+	var boxes = form.querySelectorAll('input[type="checkbox"]');
+	for (var j = 0; j < boxes.length; j++) {
+		var box = boxes[j], text = ((box.name || '') + ' ' + (box.id || '')).toLowerCase();
+		var wanted = box.required || box.getAttribute('aria-required') === 'true' ||
+			words.some(function(word) { return text.indexOf(word) >= 0; });
+		if (wanted && !box.disabled && tick(box)) consent++;
+	}
+}
+return {steps: results, consent: consent};
+"""
+
+_fill = {'type_fallback': False}
+
+def set_type_fallback(enabled):
+	"""
+	Enables typing in, with keystrokes, the values the pages reject when set from a script
+	"""
+	_fill['type_fallback'] = bool(enabled)
+
+def snapshot_form(driver, form_element):
+	"""
+	Reads every input, textarea and select of the form, with its attributes
+	and label text, in a single script execution
+
+	Args:
+		driver: webdriver object
+		form_element: the contact form web element
+
+	Returns:
+		list of field dicts, each holding its web element under 'element'
+	"""
+	return driver.execute_script(SNAPSHOT_SCRIPT, form_element)
+
+def fields_from_html(html):
+	"""
+	Builds the same field dicts as snapshot_form from stored HTML, without
+	a browser. Reads the first form of the document, or the whole document
+	if it has no form.
+
+	Args:
+		html: HTML string of the page or the form
+
+	Returns:
+		list of field dicts, with None as the element
+	"""
+	soup = BeautifulSoup(html, 'html.parser')
+	root = soup.find('form') or soup
+	labels = {}
+	for label in soup.find_all('label'):
+		if label.get('for'):
+			labels.setdefault(label['for'], []).append(label.get_text(' ', strip=True))
+
+	fields = []
+	for index, el in enumerate(root.find_all(['input', 'textarea', 'select'])):
+		texts = list(labels.get(el.get('id'), [])) if el.get('id') else []
+		wrapping = el.find_parent('label')
+		if wrapping:
+			texts.append(wrapping.get_text(' ', strip=True))
+		style = el.get('style', '').replace(' ', '').lower()
+		field_type = el.get('type', '').lower()
+		fields.append({'element': None,
+					'index': index,
+					'tag': el.name,
+					'type': field_type,
+					'name': el.get('name', ''),
+					'id': el.get('id', ''),
+					'class': ' '.join(el.get('class', [])),
+					'placeholder': el.get('placeholder', ''),
+					'aria-label': el.get('aria-label', ''),
+					'autocomplete': el.get('autocomplete', ''),
+					'label': ' '.join(texts),
+					'options': [{'value': o.get('value', o.get_text(strip=True)),
+								'text': o.get_text(strip=True),
+								'disabled': o.has_attr('disabled')}
+								for o in el.find_all('option')] if el.name == 'select' else [],
+					# Honeypots are also moved off the screen or out of the tab order
+					'visible': (field_type != 'hidden' and not el.has_attr('hidden') and
+								'display:none' not in style and 'visibility:hidden' not in style and
+								'left:-' not in style and el.get('tabindex') != '-1'),
+					'disabled': el.has_attr('disabled')})
+	return fields
+
+def choose_option(field, preferred=None):
+	"""
+	Picks the option of a select box, the one with the preferred text if
+	there is one, otherwise the first enabled option with a value
+	"""
+	enabled = [o for o in field['options'] if o['value'] and not o['disabled']]
+	if preferred:
+		for option in enabled:
+			if preferred.lower() in option['text'].lower():
+				return option['value']
+	return enabled[0]['value'] if enabled else None
+
+def build_fill_plan(fields, info, lang='en'):
+	"""
+	Matches the form fields with the contact information locally, using
+	the rules of field_rules.json extended with the keywords of the page
+	language from lexicon.json
+
+	Args:
+		fields: field dicts from snapshot_form or fields_from_html
+		info: contact information dict
+		lang: language code of the page
+
+	Returns:
+		list of plan steps in page order: dicts with the action ('type',
+		'select' or 'click'), the information key, the value, the rule,
+		how the field was matched and the field
+	"""
+	plan = []
+	for match in assign_fields(fields, rules_for_language(lang)):
+		rule, field = match['rule'], match['field']
+		if rule['action'] == 'type':
+			value = info.get(rule['key'])
+		elif rule['action'] == 'select':
+			value = choose_option(field, info.get(rule['key']))
+		else:
+			value = None
+		if rule['action'] != 'click' and not value:
+			continue
+		plan.append({'action': rule['action'],
+					'key': rule['key'],
+					'value': value,
+					'rule': rule['field'],
+					'matched_by': match['matched_by'],
+					'field': field})
+	return plan
+
+def form_fingerprint(fields):
+	"""
+	Hash of the structure of the form: tag, type, name and id of every field, in page order
+	"""
+	structure = [[f['tag'], f['type'], f['name'], f['id']] for f in fields]
+	return hashlib.sha1(json.dumps(structure).encode()).hexdigest()
+
+def plan_to_mapping(plan):
+	"""
+	The field mapping of the plan, without values nor elements, to be cached
+	"""
+	return [{'position': step['field']['index'],
+			'rule': step['rule'],
+			'key': step['key'],
+			'action': step['action']} for step in plan]
+
+def replay_fill_plan(fields, mapping, info):
+	"""
+	Rebuilds the fill plan from a cached field mapping, for a form with the same fingerprint
+
+	Args:
+		fields: field dicts from snapshot_form
+		mapping: list from plan_to_mapping
+		info: contact information dict
+
+	Returns:
+		list of plan steps, like build_fill_plan
+	"""
+	plan = []
+	for item in mapping:
+		field = fields[item['position']]
+		if item['action'] == 'type':
+			value = info.get(item['key'])
+		elif item['action'] == 'select':
+			value = choose_option(field, info.get(item['key']))
+		else:
+			value = None
+		if item['action'] != 'click' and not value:
+			continue
+		plan.append({'action': item['action'],
+					'key': item['key'],
+					'value': value,
+					'rule': item['rule'],
+					'matched_by': 'cache',
+					'field': field})
+	return plan
+
+def describe_plan(plan):
+	"""
+	Loggable representation of the fill plan, without the web elements
+	"""
+	steps = []
+	for step in plan:
+		field = step['field']
+		steps.append({'action': step['action'],
+					'rule': step['rule'],
+					'key': step['key'],
+					'value': step['value'],
+					'matched_by': step['matched_by'],
+					'field': {a: field[a] for a in ['tag', 'type', 'name', 'id', 'placeholder', 'label']}})
+	return json.dumps(steps, ensure_ascii=False)
+
+def type_fill_step(driver, step):
+	"""
+	Fills in one plan step like a user, with keystrokes and clicks. The
+	fallback for the fields which reject the values set from a script.
+	"""
+	element = step['field']['element']
+	if not wait_for_interactable(element):
+		raise WebDriverException(f"'{step['key']}' is not interactable")
+	if step['action'] == 'type':
+		element.clear()
+		element.send_keys(step['value'])
+		pause('field')
+	elif step['action'] == 'select':
+		Select(element).select_by_value(step['value'])
+		pause('click')
+	else:
+		driver.execute_script("arguments[0].click();", element)
+		pause('click')
+
+def execute_fill_plan(driver, plan, form_element=None, type_fallback=None):
+	"""
+	Fills in the form following the plan in one script execution: the values,
+	select choices and radio buttons of the plan and the consent checkboxes
+	of the form, with the events the framework inputs listen to. The values
+	are read back, the ones which did not stick are typed in with keystrokes
+	if the fallback is enabled.
+
+	Args:
+		driver: webdriver object
+		plan: list of plan steps from build_fill_plan
+		form_element: the form, to tick its consent checkboxes
+		type_fallback: type in the values the page rejected, the setting of
+			set_type_fallback by default
+
+	Returns:
+		dict with the information keys which were filled in, the ones
+		rejected by the page, the ones typed in and the number of consent
+		checkboxes ticked
+	"""
+	if type_fallback is None:
+		type_fallback = _fill['type_fallback']
+	steps = [{'element': step['field']['element'], 'action': step['action'], 'value': step['value']} for step in plan]
+	outcome = driver.execute_script(FILL_SCRIPT, steps, form_element, list(CONSENT_CHECKBOX_WORDS))
+	result = {'filled': [], 'rejected': [], 'typed': [], 'consent': outcome['consent']}
+	for step, check in zip(plan, outcome['steps']):
+		if check['ok']:
+			result['filled'].append(step['key'])
+			continue
+		result['rejected'].append(step['key'])
+		if not type_fallback:
+			print(f"Could not fill '{step['key']}': {check['error'] or 'the page kept ' + repr(check['value'])}")
+			continue
+		try:
+			type_fill_step(driver, step)
+			result['typed'].append(step['key'])
+			result['filled'].append(step['key'])
+		except WebDriverException as e:
+			print(f"Could not type '{step['key']}': {e.msg}")
+	pause('click')
+	return result
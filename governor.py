@@ -0,0 +1,124 @@
+import os
+import time
+from urllib.parse import urlparse
+from selenium.common.exceptions import WebDriverException
+
+# Thresholds after which the browser is restarted
+MAX_RSS_MB = 1500
+MAX_SITES = 200
+MAX_ERROR_STREAK = 5
+
+STORAGE_TYPES = 'cookies,local_storage,session_storage,indexeddb,websql,cache_storage,service_workers,file_systems'
+
+def clear_browser_state(driver):
+	"""
+	Clears what the last site left in the browser: the storage and service
+	workers of its origin, the HTTP cache and all the cookies. Drivers without
+	the DevTools protocol only get their cookies and web storage cleared.
+	"""
+	try:
+		origin = urlparse(driver.current_url)
+		if origin.scheme in ('http', 'https'):
+			driver.execute_cdp_cmd('Storage.clearDataForOrigin',
+								{'origin': f"{origin.scheme}://{origin.netloc}", 'storageTypes': STORAGE_TYPES})
+		driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+		driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+	except (WebDriverException, AttributeError):
+		try:
+			driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+		except WebDriverException:
+			pass
+		driver.delete_all_cookies()
+
+def browser_processes(driver):
+	"""
+	The chromedriver process and every browser process it started
+
+	Returns:
+		list of psutil processes, empty without psutil or a local driver process
+	"""
+	process = getattr(getattr(driver, 'service', None), 'process', None)
+	if process is None:
+		return []
+	try:
+		import psutil
+		root = psutil.Process(process.pid)
+		return [root] + root.children(recursive=True)
+	except Exception:
+		return []
+
+def sample_memory(driver):
+	"""
+	Measures the browser process tree
+
+	Returns:
+		dict with the resident memory of the whole tree in MB, the number of
+		processes and of open file descriptors (handles on Windows), None
+		values when it cannot be measured
+	"""
+	sample = {'rss_mb': None, 'processes': None, 'handles': None, 'time': round(time.time(), 3)}
+	processes = browser_processes(driver)
+	if not processes:
+		return sample
+	rss, handles = 0, 0
+	for process in processes:
+		try:
+			rss += process.memory_info().rss
+			handles += process.num_handles() if os.name == 'nt' else process.num_fds()
+		except Exception:
+			# The process exited while the tree was walked
+			continue
+	sample.update(rss_mb=round(rss / 2**20, 1), processes=len(processes), handles=handles)
+	return sample
+
+class MemoryGovernor:
+	"""
+	Keeps the memory of a long-lived browser flat: after each site the
+	process tree is sampled, and a restart is asked for when its memory,
+	the number of sites since the last start or the number of failures in
+	a row crosses its threshold
+	"""
+
+	def __init__(self, max_rss_mb=MAX_RSS_MB, max_sites=MAX_SITES, max_error_streak=MAX_ERROR_STREAK):
+		"""
+		Args:
+			max_rss_mb: resident memory of the browser process tree, in MB
+			max_sites: sites processed by one browser
+			max_error_streak: failed or timed out sites in a row
+		"""
+		self.max_rss_mb = max_rss_mb
+		self.max_sites = max_sites
+		self.max_error_streak = max_error_streak
+		self.started()
+
+	def started(self):
+		"""
+		Resets the counters, to be called when a new browser starts
+		"""
+		self.sites = 0
+		self.error_streak = 0
+
+	def check(self, driver, result):
+		"""
+		Samples the browser after a site and tells whether it has to be restarted
+
+		Args:
+			driver: webdriver object, already cleaned up after the site
+			result: result dict of the site, the sample is stored in it under 'memory'
+
+		Returns:
+			(code, message) of the restart, the code being 'rss', 'sites' or
+			'errors', or None
+		"""
+		self.sites += 1
+		self.error_streak = self.error_streak + 1 if result.get('status') in ('failed', 'timeout') else 0
+		sample = sample_memory(driver)
+		sample['sites'] = self.sites
+		result['memory'] = sample
+		if sample['rss_mb'] is not None and sample['rss_mb'] > self.max_rss_mb:
+			return 'rss', f"rss {sample['rss_mb']} MB"
+		if self.sites >= self.max_sites:
+			return 'sites', f"{self.sites} sites"
+		if self.error_streak >= self.max_error_streak:
+			return 'errors', f"{self.error_streak} errors in a row"
+		return None
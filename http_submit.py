@@ -0,0 +1,314 @@
+import re
+import requests
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from discovery import create_session
+from form_analysis import CONSENT_CHECKBOX_WORDS, fields_from_html, build_fill_plan
+from lexicon import keywords, language_code
+from utils import MIN_FORM_SCORE, score_form
+from captcha import HTML_MARKERS
+
+# Inputs whose value a browser never submits
+SKIPPED_TYPES = ('submit', 'button', 'reset', 'image', 'file')
+
+# Attributes of the frameworks and form libraries which submit the form from a script
+SCRIPT_ATTRIBUTES = ('onsubmit', 'data-ajax', 'data-remote', 'data-async', 'v-on:submit', '@submit',
+					'@submit.prevent', 'ng-submit', 'x-on:submit', '(ngsubmit)', 'hx-post', 'data-hx-post')
+
+# Script calls which take the submission over once they hold the form
+SCRIPT_SUBMIT = re.compile(r"addeventlistener\(\s*['\"]submit|\.(?:on)?submit\s*[(=]|preventdefault|\.ajax\(|fetch\(|xmlhttprequest")
+
+# Names of the hidden fields a script fills in right before the submission
+SCRIPT_TOKEN = re.compile(r"token|nonce|csrf|xsrf|timestamp|js|signature|hash")
+
+# Texts of a page answering the POST with the form and its errors
+ERROR_MARKERS = ('error', 'invalid', 'is required', 'required field', 'please correct', 'please fill',
+				'please enter', 'failed', 'try again', 'not valid', 'fehler', 'erreur', 'errore')
+
+_session = None
+
+def http_session():
+	"""
+	The pooled HTTP session of the process, created on first use
+	"""
+	global _session
+	if _session is None:
+		_session = create_session()
+	return _session
+
+def find_challenge(html):
+	"""
+	Returns:
+		the first captcha or bot challenge marker found in the HTML, None if there is none
+	"""
+	html = html.lower()
+	return next((marker for marker in HTML_MARKERS if marker in html), None)
+
+def form_summary(form):
+	"""
+	The summary of form_inventory for a form parsed with BeautifulSoup, so
+	the static forms are picked with the same score_form as in the browser
+	"""
+	summary = {'id': form.get('id', ''), 'class': ' '.join(form.get('class', [])), 'name': form.get('name', ''),
+			'action': form.get('action', ''), 'method': form.get('method', 'get').lower(), 'role': form.get('role', ''),
+			'visible': not form.has_attr('hidden') and 'display:none' not in form.get('style', '').replace(' ', ''),
+			'inputs': 0, 'emails': 0, 'textareas': 0, 'submits': 0, 'passwords': 0, 'searches': 0, 'selects': 0}
+	for el in form.find_all(['input', 'textarea', 'select', 'button']):
+		field_type = el.get('type', '').lower()
+		text = ' '.join([el.get('name', ''), el.get('id', ''), el.get('placeholder', ''),
+						el.get('autocomplete', '')]).lower()
+		if el.name == 'textarea':
+			summary['textareas'] += 1
+		elif el.name == 'select':
+			summary['selects'] += 1
+		elif el.name == 'button':
+			summary['submits'] += field_type not in ('button', 'reset')
+		elif field_type in ('submit', 'image'):
+			summary['submits'] += 1
+		elif field_type == 'password':
+			summary['passwords'] += 1
+		elif field_type == 'search':
+			summary['searches'] += 1
+		elif field_type not in ('hidden', 'checkbox', 'radio', 'file', 'reset', 'button'):
+			summary['inputs'] += 1
+			summary['emails'] += field_type == 'email' or 'mail' in text
+	return summary
+
+def find_static_form(soup, lang='en'):
+	"""
+	Picks the contact form of a parsed page
+
+	Returns:
+		the form tag, or None if no form looks like a contact form
+	"""
+	best, best_score = None, MIN_FORM_SCORE - 1
+	for form in soup.find_all('form'):
+		score, _ = score_form(form_summary(form), lang)
+		if score > best_score:
+			best, best_score = form, score
+	return best
+
+def script_handler(form, soup):
+	"""
+	Tells whether a script of the page takes over the submission of the form:
+	a framework attribute on the form or its buttons, or an inline script
+	naming the form and attaching a submit handler or posting it itself
+
+	Returns:
+		what gave the script away, or None
+	"""
+	for attribute in SCRIPT_ATTRIBUTES:
+		if form.has_attr(attribute):
+			return attribute
+	if any('ajax' in name.lower() for name in form.get('class', [])):
+		return "ajax class"
+	for button in form.find_all(['button', 'input']):
+		button_type = button.get('type', 'submit' if button.name == 'button' else '').lower()
+		if button.has_attr('onclick') and button_type == 'submit':
+			return "onclick"
+	names = [name for name in (form.get('id'), form.get('name')) if name]
+	names += ['.' + name for name in form.get('class', [])]
+	for script in (soup.find_all('script', src=False) if soup else []):
+		code = (script.string or '').lower()
+		if SCRIPT_SUBMIT.search(code) and (any(name.lower() in code for name in names) or 'forms[0]' in code
+										or "queryselector('form')" in code or 'queryselector("form")' in code):
+			return "inline script"
+	return None
+
+def js_driven(form, plan, soup=None):
+	"""
+	Tells why the form needs a browser, if it does
+
+	Args:
+		form: the form tag
+		plan: fill plan of the form
+		soup: the parsed page, to look for the scripts attached to the form
+
+	Returns:
+		the reason, or None for a form a plain POST can submit
+	"""
+	action = form.get('action', '').strip().lower()
+	if form.get('method', 'get').lower() != 'post':
+		return "not a POST form"
+	if action.startswith('javascript:') or not form_summary(form)['submits']:
+		return "submitted by a script"
+	handler = script_handler(form, soup)
+	if handler:
+		return f"submitted by a script ({handler})"
+	for el in form.find_all('input', type='hidden'):
+		if el.get('name') and not el.get('value') and SCRIPT_TOKEN.search(el['name'].lower()):
+			return f"token '{el['name']}' filled by a script"
+	if any(el.has_attr('required') and el.get('type', '').lower() == 'file' for el in form.find_all('input')):
+		return "required file upload"
+	planned = {step['field']['name'] for step in plan}
+	for el in form.find_all(['input', 'textarea', 'select']):
+		field_type = el.get('type', '').lower()
+		if (el.has_attr('required') and el.get('name') and el['name'] not in planned and not el.get('value')
+			and field_type not in ('hidden', 'checkbox') + SKIPPED_TYPES):
+			return f"required field '{el['name']}' not matched"
+	return None
+
+def consent_checkbox(el):
+	text = ' '.join([el.get('name', ''), el.get('id', '')]).lower()
+	return el.has_attr('required') or any(word in text for word in CONSENT_CHECKBOX_WORDS)
+
+def build_payload(form, plan):
+	"""
+	The fields the browser would send for the form once filled in following
+	the plan: the hidden fields and CSRF tokens as they are, the planned
+	values, the preselected values of the other fields, the consent
+	checkboxes ticked and the name of the submit button
+
+	Returns:
+		list of (name, value) tuples in form order
+	"""
+	# The fields of fields_from_html are indexed in the same order as find_all below
+	planned = {step['field']['index']: step for step in plan}
+	clicked_radios = {step['field']['name'] for step in plan
+					if step['action'] == 'click' and step['field']['type'] == 'radio'}
+
+	payload = []
+	for index, el in enumerate(form.find_all(['input', 'textarea', 'select'])):
+		name = el.get('name')
+		field_type = el.get('type', '').lower()
+		step = planned.get(index)
+		if not name or el.has_attr('disabled') or field_type in SKIPPED_TYPES:
+			continue
+		if field_type == 'radio':
+			if (step is not None) if name in clicked_radios else el.has_attr('checked'):
+				payload.append((name, el.get('value', 'on')))
+		elif field_type == 'checkbox':
+			if el.has_attr('checked') or step is not None or consent_checkbox(el):
+				payload.append((name, el.get('value', 'on')))
+		elif step is not None:
+			payload.append((name, step['value']))
+		elif el.name == 'textarea':
+			payload.append((name, el.get_text()))
+		elif el.name == 'select':
+			options = el.find_all('option')
+			selected = next((o for o in options if o.has_attr('selected')), options[0] if options else None)
+			if selected is not None:
+				payload.append((name, selected.get('value', selected.get_text(strip=True))))
+		else:
+			payload.append((name, el.get('value', '')))
+	submit = next((el for el in form.find_all(['button', 'input'])
+				if el.get('name') and el.get('type', 'submit' if el.name == 'button' else '').lower() in ('submit', 'image')), None)
+	if submit is not None:
+		payload.append((submit['name'], submit.get('value', '')))
+	return payload
+
+def same_target(url, action):
+	url, action = urlparse(url), urlparse(action)
+	return (url.scheme, url.netloc, url.path.rstrip('/')) == (action.scheme, action.netloc, action.path.rstrip('/'))
+
+def response_outcome(response, page_text, messages, action):
+	"""
+	Checks the answer of the POST like detect_confirmation checks the page:
+	a new confirmation phrase confirms and an error status fails. Without a
+	phrase, the POST only counts as confirmed if the form's own action
+	answered with a 2xx or a redirect and the page it led to has neither the
+	form nor a new error message. Anything else is not confirmed.
+
+	Returns:
+		(confirmed, signal, detail)
+	"""
+	if response.status_code >= 400:
+		return False, 'response_error', response.status_code
+	soup = BeautifulSoup(response.text, 'html.parser')
+	text = ' '.join(soup.get_text(' ').lower().split())
+	for phrase in messages:
+		if text.count(phrase) > page_text.count(phrase):
+			return True, 'phrase', phrase
+	first = response.history[0] if response.history else response
+	if not same_target(first.url, action) or response.status_code >= 300:
+		return False, 'no_confirmation', f"answered from {first.url} with HTTP {response.status_code}"
+	if soup.find('form') and find_static_form(soup) is not None:
+		return False, 'no_confirmation', "form shown again"
+	error = next((marker for marker in ERROR_MARKERS if text.count(marker) > page_text.count(marker)), None)
+	if error:
+		return False, 'no_confirmation', f"'{error}' on the answer"
+	if response.history:
+		# Redirected after the POST, like most form handlers do once the message is stored
+		return True, 'url_change', response.url
+	return True, 'form_removed', None
+
+def submit_static_form(url, info, confirmation_messages, session=None, timeout=15):
+	"""
+	Fills in and submits the contact form of a page with plain HTTP requests,
+	when it needs no browser: the page is fetched again in the session, so
+	the CSRF token matches its cookies, the fields are mapped with the same
+	rules as in the browser and the form is POSTed to its action. The browser
+	only takes over before the POST is sent, or when the bot protection
+	stopped it, so a form is never submitted twice.
+
+	Args:
+		url: url of the page with the static contact form
+		info: contact information dict
+		confirmation_messages: list of strings to check if the submission was successfull
+		session: requests session, the pooled session of the process by default
+		timeout: timeout of each request, in seconds
+
+	Returns:
+		dict with 'fallback', the reason to use the browser instead or None,
+		and once submitted 'confirmed', 'signal', 'detail', the language,
+		the action url and the number of fields sent
+	"""
+	session = session or http_session()
+	outcome = {'fallback': None, 'confirmed': False, 'signal': None, 'detail': None,
+			'lang': None, 'action': None, 'fields': 0}
+	try:
+		response = session.get(url, timeout=timeout)
+	except requests.RequestException as e:
+		outcome['fallback'] = f"page not fetched ({type(e).__name__})"
+		return outcome
+	challenge = find_challenge(response.text)
+	if response.status_code >= 400 or challenge:
+		outcome['fallback'] = f"challenge ({challenge})" if challenge else f"HTTP {response.status_code}"
+		return outcome
+	soup = BeautifulSoup(response.text, 'html.parser')
+	lang = language_code(soup.html.get('lang') if soup.html else None)
+	outcome['lang'] = lang
+	form = find_static_form(soup, lang)
+	if form is None:
+		outcome['fallback'] = "no static contact form"
+		return outcome
+	plan = build_fill_plan(fields_from_html(str(form)), info, lang)
+	reason = js_driven(form, plan, soup)
+	if reason:
+		outcome['fallback'] = reason
+		return outcome
+
+	page_url = response.url
+	action = urljoin(page_url, form.get('action', '').strip() or page_url)
+	if urlparse(action).scheme not in ('http', 'https'):
+		outcome['fallback'] = "unsupported form action"
+		return outcome
+	payload = build_payload(form, plan)
+	print(f"HTTP submit of {len(payload)} fields to {action}")
+	headers = {'Referer': page_url, 'Origin': f"{urlparse(page_url).scheme}://{urlparse(page_url).netloc}"}
+	try:
+		if 'multipart' in form.get('enctype', '').lower():
+			answer = session.post(action, files=[(name, (None, value)) for name, value in payload],
+								headers=headers, timeout=timeout)
+		else:
+			answer = session.post(action, data=payload, headers=headers, timeout=timeout)
+	except requests.ConnectTimeout as e:
+		# Nothing was sent yet
+		outcome['fallback'] = f"{type(e).__name__} on the POST"
+		return outcome
+	except requests.RequestException as e:
+		# The server may have stored the message, it is not sent again
+		outcome.update(action=action, fields=len(payload), signal='response_error', detail=type(e).__name__)
+		return outcome
+	outcome['action'] = action
+	outcome['fields'] = len(payload)
+
+	challenge = find_challenge(answer.text)
+	if challenge and answer.status_code in (403, 429, 503):
+		# The POST was stopped by the bot protection, nothing was sent yet
+		outcome['fallback'] = f"challenge ({challenge})"
+		return outcome
+	messages = [m.lower() for m in confirmation_messages + keywords('confirmation', lang)]
+	page_text = ' '.join(soup.get_text(' ').lower().split())
+	outcome['confirmed'], outcome['signal'], outcome['detail'] = response_outcome(answer, page_text, messages, action)
+	return outcome
@@ -0,0 +1,199 @@
+import os
+import csv
+import json
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from urllib.parse import urlsplit, urlunsplit
+
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def normalize_url(url):
+	"""
+	Normalizes a website url: adds the missing scheme and lowercases the host
+
+	Args:
+		url: the website as written in the list
+
+	Returns:
+		the normalized url, or None if the value is not a website
+	"""
+	if not isinstance(url, str):
+		return None
+	url = url.strip()
+	if not url:
+		return None
+	if '://' not in url:
+		url = 'http://' + url
+	parts = urlsplit(url)
+	if '.' not in parts.netloc or ' ' in parts.netloc:
+		return None
+	return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', parts.query, ''))
+
+def dedupe_key(url):
+	"""
+	Key under which two urls count as the same website:
+	no scheme, no 'www.' and no trailing slash
+	"""
+	parts = urlsplit(url)
+	return parts.netloc.removeprefix('www.') + parts.path.rstrip('/') + ('?' + parts.query if parts.query else '')
+
+class SharedStrings:
+	"""
+	The shared strings table of an xlsx file, read lazily only as far as the
+	sheet has referenced it. The strings are stored in order of first use,
+	so the first rows do not wait for the whole table to be parsed.
+	"""
+
+	def __init__(self, archive, name):
+		self.strings = []
+		self.parser = ET.iterparse(archive.open(name)) if name in archive.namelist() else iter(())
+
+	def __getitem__(self, index):
+		while index >= len(self.strings):
+			try:
+				_, element = next(self.parser)
+			except StopIteration:
+				raise IndexError(f"Shared string {index} is missing")
+			if element.tag == XLSX_NS + 'si':
+				# Plain text or rich text runs, the phonetic hints are skipped
+				texts = [element.findtext(XLSX_NS + 't') or '']
+				texts += [run.findtext(XLSX_NS + 't') or '' for run in element.findall(XLSX_NS + 'r')]
+				self.strings.append(''.join(texts))
+				element.clear()
+		return self.strings[index]
+
+def column_index(reference):
+	index = 0
+	for char in reference:
+		if not char.isalpha():
+			break
+		index = index * 26 + ord(char.upper()) - ord('A') + 1
+	return index - 1
+
+def cell_value(cell, shared_strings):
+	cell_type = cell.get('t')
+	if cell_type == 'inlineStr':
+		return ''.join(t.text or '' for t in cell.iter(XLSX_NS + 't'))
+	value = cell.findtext(XLSX_NS + 'v')
+	if value is None:
+		return None
+	if cell_type == 's':
+		return shared_strings[int(value)]
+	if cell_type in ('str', 'e'):
+		return value
+	if cell_type == 'b':
+		return value == '1'
+	number = float(value)
+	return int(number) if number.is_integer() else number
+
+def first_sheet_name(archive):
+	workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+	sheet = workbook.find(f'{XLSX_NS}sheets/{XLSX_NS}sheet')
+	relation_id = sheet.get(REL_NS + 'id')
+	relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+	for relation in relations.iter(PACKAGE_REL_NS + 'Relationship'):
+		if relation.get('Id') == relation_id:
+			target = relation.get('Target')
+			return target.lstrip('/') if target.startswith('/') else posixpath.join('xl', target)
+	raise ValueError("The workbook has no sheet")
+
+def iter_xlsx_rows(path):
+	"""
+	Streams the cell values of the first sheet of an xlsx file, row by row,
+	straight from the XML without loading the sheet or the strings table up front
+
+	Yields:
+		(row number, list of the cell values) of each row, the 1-based row
+		number of the sheet, as blank rows have no element of their own
+	"""
+	with zipfile.ZipFile(path) as archive:
+		shared_strings = SharedStrings(archive, 'xl/sharedStrings.xml')
+		sheet_data = None
+		number = 0
+		for event, element in ET.iterparse(archive.open(first_sheet_name(archive)), events=('start', 'end')):
+			if event == 'start':
+				if element.tag == XLSX_NS + 'sheetData':
+					sheet_data = element
+				continue
+			if element.tag != XLSX_NS + 'row':
+				continue
+			number = int(element.get('r')) if element.get('r') else number + 1
+			values = []
+			for cell in element.iter(XLSX_NS + 'c'):
+				index = column_index(cell.get('r', '')) if cell.get('r') else len(values)
+				values.extend([None] * (index - len(values)))
+				values.append(cell_value(cell, shared_strings))
+			# Drop the parsed rows so the memory stays flat
+			sheet_data.clear()
+			yield number, values
+
+def iter_raw_rows(path):
+	"""
+	Yields the data rows of the websites list as dicts, one at a time,
+	without loading the whole file. Supports .xlsx, .csv and .jsonl files.
+
+	Yields:
+		(row_id, dict) tuples, row_id being the index pandas gives the row,
+		which counts the blank rows of a sheet
+	"""
+	extension = os.path.splitext(path)[1].lower()
+	if extension in ('.xlsx', '.xlsm'):
+		rows = iter_xlsx_rows(path)
+		header_number, header = next(rows, (0, []))
+		header = [str(h) if h is not None else '' for h in header]
+		for number, values in rows:
+			yield number - header_number - 1, dict(zip(header, values))
+	elif extension == '.csv':
+		with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+			yield from enumerate(csv.DictReader(f))
+	elif extension == '.jsonl':
+		with open(path, 'r', encoding='utf-8') as f:
+			yield from enumerate(json.loads(line) for line in f if line.strip())
+	else:
+		raise ValueError(f"Unsupported websites list format '{extension}'")
+
+def iter_websites(path, dedupe=True):
+	"""
+	Streams the websites list
+
+	Args:
+		path: the websites list with "Website" and "Event" columns
+		dedupe: skip the websites already seen under another spelling
+
+	Yields:
+		(row_id, website, event) tuples, row_id being the index of the data row
+	"""
+	seen = set()
+	skipped = 0
+	for row_id, row in iter_raw_rows(path):
+		website = normalize_url(row.get('Website'))
+		if website is None:
+			skipped += 1
+			continue
+		if dedupe:
+			key = dedupe_key(website)
+			if key in seen:
+				skipped += 1
+				continue
+			seen.add(key)
+		event = row.get('Event')
+		yield (row_id, website, event if isinstance(event, str) and event else None)
+	if skipped:
+		print(f"{skipped} empty or duplicate websites skipped")
+
+def load_table(path):
+	"""
+	Loads the whole websites list into a DataFrame, for the final export
+	"""
+	# Only the export needs pandas, the streaming path does not pay for the import
+	import pandas as pd
+
+	extension = os.path.splitext(path)[1].lower()
+	if extension == '.csv':
+		return pd.read_csv(path)
+	if extension == '.jsonl':
+		return pd.read_json(path, lines=True)
+	return pd.read_excel(path)
@@ -0,0 +1,87 @@
+import os
+import json
+import threading
+from input_reader import load_table
+
+
+class Journal:
+	"""
+	Append-only JSONL file with one record per processed website.
+	Each record is flushed and synced to disk before the next site starts,
+	so a crash can only lose the line that was being written.
+	"""
+
+	def __init__(self, path, resume=False):
+		"""
+		Args:
+			path: path of the journal file
+			resume: keep the records of the previous run and append to them,
+				otherwise the journal is started from scratch
+		"""
+		self.path = path
+		# The preflight records its skipped rows from the prefetch thread
+		self.lock = threading.Lock()
+		self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+		if resume and self.file.tell() > 0:
+			# Terminate a line cut off by a crash, so it does not swallow the next record
+			with open(path, 'rb') as f:
+				f.seek(-1, os.SEEK_END)
+				if f.read(1) != b'\n':
+					self.file.write('\n')
+
+	def append(self, record):
+		line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+		with self.lock:
+			self.file.write(line)
+			self.file.flush()
+			os.fsync(self.file.fileno())
+
+	def close(self):
+		self.file.close()
+
+def read_journal(path):
+	"""
+	Reads the journal, skipping a line cut off by a crash
+
+	Returns:
+		dict of row id to the last record of that row
+	"""
+	records = {}
+	if not os.path.exists(path):
+		return records
+	with open(path, 'r', encoding='utf-8') as f:
+		for line in f:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				continue
+			records[record['row_id']] = record
+	return records
+
+def completed_rows(path, retry_failed=False):
+	"""
+	Ids of the rows which already have a record in the journal
+
+	Args:
+		path: path of the journal file
+		retry_failed: do not count the failed and timed out rows as completed
+	"""
+	return {row_id for row_id, record in read_journal(path).items()
+			if not (retry_failed and record['status'] in ('failed', 'timeout'))}
+
+def export_xlsx(journal_path, input_path, output_path):
+	"""
+	Writes the input list together with the journal results into an Excel file
+
+	Args:
+		journal_path: path of the journal file
+		input_path: the websites list
+		output_path: the Excel file to write
+	"""
+	records = read_journal(journal_path)
+	df = load_table(input_path)
+	columns = {'Status': 'status', 'Failure stage': 'stage', 'Error': 'error', 'Elapsed': 'elapsed'}
+	for column, key in columns.items():
+		df[column] = [records[i].get(key) if i in records else '' for i in range(0, len(df))]
+	df.to_excel(output_path, index=False)
+	print(f"{len(records)} results written to {output_path}")
@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+# Seconds a claimed site stays with its node without a heartbeat, above the
+# deadline of a site so a busy node never loses its lease
+LEASE_SECONDS = 300
+
+# Claims of a site, by nodes which then disappeared, after which it is given up as failed
+MAX_ATTEMPTS = 3
+
+def node_name():
+	"""
+	Default name of this node: the host name and the process id
+	"""
+	return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkLedger:
+	"""
+	Shared SQLite ledger of the websites of a distributed run. Every node
+	loads the same list, then claims sites one at a time under a lease which
+	its heartbeat keeps renewing. The sites of a node which stops beating are
+	claimed again by the others once the lease has expired. A result is only
+	accepted from the node holding the lease, so each site ends up with
+	exactly one result. The file needs a volume with working file locks.
+	"""
+
+	def __init__(self, path, node=None, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+		"""
+		Args:
+			path: path of the ledger, on a volume shared by the nodes
+			node: name of this node, the host name and the process id by default
+			lease_seconds: seconds a site stays claimed without a heartbeat
+			max_attempts: claims of a site before it is given up as failed
+		"""
+		self.path = path
+		self.node = node or node_name()
+		self.lease_seconds = lease_seconds
+		self.max_attempts = max_attempts
+		self.reclaimed = 0
+		self.lost = 0
+		# Shared by the run and the heartbeat thread
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS sites (
+									row_id INTEGER PRIMARY KEY,
+									website TEXT NOT NULL,
+									event TEXT,
+									state TEXT NOT NULL DEFAULT 'pending',
+									node TEXT,
+									lease_expires REAL,
+									attempts INTEGER NOT NULL DEFAULT 0,
+									result TEXT,
+									finished REAL)""")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS sites_state ON sites (state, row_id)")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS nodes (
+									node TEXT PRIMARY KEY,
+									started REAL NOT NULL,
+									heartbeat REAL NOT NULL,
+									done INTEGER NOT NULL DEFAULT 0)""")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS meta (
+									key TEXT PRIMARY KEY,
+									value TEXT)""")
+
+	@contextmanager
+	def transaction(self):
+		"""
+		Write transaction, taking the write lock of the file up front so two
+		nodes never claim the same site
+		"""
+		with self.lock:
+			self.connection.execute("BEGIN IMMEDIATE")
+			try:
+				yield self.connection
+			except BaseException:
+				self.connection.execute("ROLLBACK")
+				raise
+			self.connection.execute("COMMIT")
+
+	def load(self, rows, batch=1000):
+		"""
+		Adds the rows of the websites list. Every node may load the same list,
+		the rows already in the ledger are kept as they are.
+
+		Args:
+			rows: iterable of (row_id, website, event) tuples
+		"""
+		if self.loaded():
+			return
+		pending = []
+		for row_id, website, event in rows:
+			pending.append((row_id, website, event if isinstance(event, str) else None))
+			if len(pending) >= batch:
+				with self.transaction() as connection:
+					connection.executemany("INSERT OR IGNORE INTO sites (row_id, website, event) VALUES (?, ?, ?)",
+											pending)
+				pending = []
+		with self.transaction() as connection:
+			connection.executemany("INSERT OR IGNORE INTO sites (row_id, website, event) VALUES (?, ?, ?)", pending)
+			connection.execute("INSERT OR REPLACE INTO meta VALUES ('loaded', ?)", (self.node,))
+
+	def loaded(self):
+		with self.lock:
+			return self.connection.execute("SELECT 1 FROM meta WHERE key = 'loaded'").fetchone() is not None
+
+	def retry_failed(self):
+		"""
+		Puts the failed and timed out sites back in the pending state
+
+		Returns:
+			number of sites to retry
+		"""
+		with self.transaction() as connection:
+			retried = connection.execute("""UPDATE sites SET state = 'pending', node = NULL, lease_expires = NULL,
+										attempts = 0, result = NULL, finished = NULL
+										WHERE state = 'done' AND json_extract(result, '$.status') IN ('failed', 'timeout')
+									""").rowcount
+			if retried:
+				# The results change, the run is exported again when it finishes
+				connection.execute("DELETE FROM meta WHERE key = 'exported'")
+			return retried
+
+	def claim(self):
+		"""
+		Leases the first pending site, or the first one whose lease expired.
+		A site claimed too many times is given up as failed instead.
+
+		Returns:
+			(row_id, website, event) tuple, None if no site can be claimed now
+		"""
+		now = time.time()
+		with self.transaction() as connection:
+			connection.execute("INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, 0)", (self.node, now, now))
+			while True:
+				row = connection.execute("""SELECT row_id, website, event, state, node, attempts FROM sites
+											WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)
+											ORDER BY row_id LIMIT 1""", (now,)).fetchone()
+				if row is None:
+					return None
+				row_id, website, event, state, node, attempts = row
+				if state == 'leased' and attempts >= self.max_attempts:
+					result = {'row_id': row_id, 'website': website, 'status': "failed", 'stage': None,
+							'error': f"Lease of node {node} expired, {attempts} claims", 'elapsed': 0.0}
+					connection.execute("UPDATE sites SET state = 'done', result = ?, finished = ? WHERE row_id = ?",
+										(json.dumps(result), now, row_id))
+					continue
+				if state == 'leased':
+					print(f"Reclaiming row {row_id} from node {node}, its lease expired")
+					self.reclaimed += 1
+				connection.execute("""UPDATE sites SET state = 'leased', node = ?, lease_expires = ?,
+									attempts = attempts + 1 WHERE row_id = ?""",
+									(self.node, now + self.lease_seconds, row_id))
+				return (row_id, website, event)
+
+	def heartbeat(self):
+		"""
+		Renews the leases of the sites this node holds
+		"""
+		now = time.time()
+		with self.transaction() as connection:
+			connection.execute("UPDATE sites SET lease_expires = ? WHERE state = 'leased' AND node = ?",
+								(now + self.lease_seconds, self.node))
+			connection.execute("UPDATE nodes SET heartbeat = ? WHERE node = ?", (now, self.node))
+
+	def complete(self, result):
+		"""
+		Stores the result of a site, if this node still holds its lease
+
+		Returns:
+			False if the lease was lost to another node, whose result counts instead
+		"""
+		with self.transaction() as connection:
+			accepted = connection.execute("""UPDATE sites SET state = 'done', result = ?, finished = ?,
+											lease_expires = NULL WHERE row_id = ? AND node = ? AND state = 'leased'""",
+										(json.dumps(result, ensure_ascii=False, default=str), time.time(),
+										result['row_id'], self.node)).rowcount == 1
+			if accepted:
+				connection.execute("UPDATE nodes SET done = done + 1 WHERE node = ?", (self.node,))
+		if not accepted:
+			self.lost += 1
+			print(f"Lease of row {result['row_id']} was lost, the result of node {self.node} is dropped")
+		return accepted
+
+	def progress(self):
+		"""
+		Returns:
+			dict of the number of sites per state
+		"""
+		with self.lock:
+			counts = dict(self.connection.execute("SELECT state, COUNT(*) FROM sites GROUP BY state").fetchall())
+		return {state: counts.get(state, 0) for state in ('pending', 'leased', 'done')}
+
+	def finished(self):
+		progress = self.progress()
+		return self.loaded() and progress['pending'] == 0 and progress['leased'] == 0
+
+	def claim_export(self):
+		"""
+		Claims the export of the merged results, once every site has one. Of
+		the nodes finishing at the same time, only the first gets it, so the
+		files are written by one node.
+
+		Returns:
+			True if this node has to write the merged results
+		"""
+		with self.transaction() as connection:
+			unfinished = connection.execute("SELECT COUNT(*) FROM sites WHERE state != 'done'").fetchone()[0]
+			loaded = connection.execute("SELECT 1 FROM meta WHERE key = 'loaded'").fetchone() is not None
+			if unfinished or not loaded:
+				return False
+			return connection.execute("INSERT OR IGNORE INTO meta VALUES ('exported', ?)", (self.node,)).rowcount == 1
+
+	def nodes(self):
+		"""
+		Returns:
+			list of (node, seconds since its last heartbeat, sites done) of every node
+		"""
+		with self.lock:
+			rows = self.connection.execute("SELECT node, heartbeat, done FROM nodes ORDER BY started").fetchall()
+		return [(node, round(time.time() - heartbeat, 1), done) for node, heartbeat, done in rows]
+
+	def results(self):
+		"""
+		Yields:
+			the result dicts of the finished sites, in row order
+		"""
+		with self.lock:
+			rows = self.connection.execute("SELECT result FROM sites WHERE state = 'done' ORDER BY row_id").fetchall()
+		for (result,) in rows:
+			yield json.loads(result)
+
+	def export_journal(self, path):
+		"""
+		Writes the merged results of all the nodes as a journal, for export_xlsx and tracing.py
+
+		Returns:
+			number of results written
+		"""
+		count = 0
+		with open(path, 'w', encoding='utf-8') as f:
+			for result in self.results():
+				f.write(json.dumps(result, ensure_ascii=False) + '\n')
+				count += 1
+		return count
+
+	def close(self):
+		self.connection.close()
+
+
+class Heartbeat:
+	"""
+	Thread renewing the leases of the node, a few times per lease period,
+	for as long as the run goes on
+	"""
+
+	def __init__(self, ledger, interval=None):
+		self.ledger = ledger
+		self.interval = interval or ledger.lease_seconds / 4
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, daemon=True)
+
+	def start(self):
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.stopped.set()
+		self.thread.join()
+
+	def run(self):
+		while not self.stopped.wait(self.interval):
+			try:
+				self.ledger.heartbeat()
+			except sqlite3.Error as e:
+				# A busy or briefly unreachable ledger, the next beat tries again
+				print(f"Heartbeat failed: {e}")
+
+
+def ledger_rows(ledger, poll=5):
+	"""
+	Streams the sites claimed from the ledger until every site has a result.
+	When the only sites left are leased by other nodes, waits for them to
+	finish or for their leases to expire.
+
+	Yields:
+		(row_id, website, event) tuples
+	"""
+	while True:
+		row = ledger.claim()
+		if row is not None:
+			yield row
+			continue
+		if ledger.finished():
+			return
+		time.sleep(poll)
+
+def main():
+	parser = argparse.ArgumentParser(description="Shared work ledger of a distributed run")
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	status = subparsers.add_parser('status', help="sites per state and the nodes with their last heartbeat")
+	status.add_argument('ledger')
+	export = subparsers.add_parser('export', help="merged results of all the nodes, as a journal and an Excel file")
+	export.add_argument('ledger')
+	export.add_argument('--journal', default='merged.jsonl', help="journal file to write the results to")
+	export.add_argument('--input', default=None, help="websites list, to also write the Excel file")
+	export.add_argument('--output', default='full_test.xlsx', help="Excel file to write the results to")
+	args = parser.parse_args()
+
+	ledger = WorkLedger(args.ledger)
+	try:
+		if args.command == 'status':
+			print(f"Sites: {ledger.progress()}")
+			for node, silent, done in ledger.nodes():
+				print(f"{node:<32} {done:>8} done, last heartbeat {silent} s ago")
+		else:
+			print(f"{ledger.export_journal(args.journal)} results written to {args.journal}")
+			if args.input:
+				from journal import export_xlsx
+				export_xlsx(args.journal, args.input, args.output)
+	finally:
+		ledger.close()
+
+
+if __name__ == '__main__':
+	main()
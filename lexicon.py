@@ -0,0 +1,91 @@
+import os
+import json
+from field_rules import load_rules, compile_rules
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon.json')
+
+LANGUAGE_SCRIPT = "return document.documentElement.lang || '';"
+
+def load_lexicon(path=LEXICON_PATH):
+	with open(path, 'r', encoding='utf-8') as f:
+		return json.load(f)
+
+LEXICON = load_lexicon()
+
+def language_code(lang):
+	"""
+	Primary subtag of a lang attribute, e.g. 'de' for 'de-AT'. Pages
+	without a lang attribute count as English.
+	"""
+	lang = (lang or '').strip().lower().replace('_', '-').split('-')[0]
+	return lang or 'en'
+
+def page_language(driver):
+	"""
+	Language of the current page from the <html> lang attribute
+
+	Args:
+		driver: webdriver object
+
+	Returns:
+		language code, 'en' if the page does not declare one
+	"""
+	return language_code(driver.execute_script(LANGUAGE_SCRIPT))
+
+def keywords(category, lang=None):
+	"""
+	Keywords of a category ('contact', 'accept' or 'confirmation') for a
+	language. The English ones are always included, as many non-English
+	sites still use English ids, classes and button texts.
+
+	Args:
+		category: name of the keyword list in lexicon.json
+		lang: language code, English only if it is None or not in the lexicon
+
+	Returns:
+		list of lowercase keywords without duplicates
+	"""
+	words = list(LEXICON['en'][category])
+	if lang and lang != 'en' and lang in LEXICON:
+		words += [word for word in LEXICON[lang][category] if word not in words]
+	return words
+
+def language_rules(config, lang):
+	"""
+	Adds the keyword groups and exclusions of a language to the field rules
+
+	Args:
+		config: dict read from field_rules.json
+		lang: language code
+
+	Returns:
+		a copy of the config with the rules extended
+	"""
+	fields = LEXICON.get(lang, {}).get('fields', {})
+	rules = []
+	for rule in config['rules']:
+		extra = fields.get(rule['field'])
+		if extra:
+			rule = dict(rule,
+						keywords=rule['keywords'] + extra.get('keywords', []),
+						exclude=rule.get('exclude', []) + extra.get('exclude', []))
+		rules.append(rule)
+	return dict(config, rules=rules)
+
+_compiled_rules = {}
+
+def rules_for_language(lang):
+	"""
+	Compiled field rules of a language, compiled once per language
+
+	Args:
+		lang: language code, the bundled rules are used for English and
+			for the languages missing from the lexicon
+
+	Returns:
+		compiled rules for assign_fields
+	"""
+	lang = lang if lang in LEXICON else 'en'
+	if lang not in _compiled_rules:
+		_compiled_rules[lang] = compile_rules(language_rules(load_rules(), lang))
+	return _compiled_rules[lang]
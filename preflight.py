@@ -0,0 +1,357 @@
+import time
+import json
+import queue
+import socket
+import asyncio
+import sqlite3
+import argparse
+import ipaddress
+import threading
+import requests
+from collections import deque
+from urllib.parse import urlsplit
+from discovery import create_session
+from discovery_cache import domain_of
+from input_reader import normalize_url, dedupe_key
+
+# Suffixes under which every label is a website of its own, beyond the top
+# level domains: the second level country domains and the hosting platforms
+PUBLIC_SUFFIXES = frozenset([
+	'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'ltd.uk', 'plc.uk',
+	'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'co.nz', 'org.nz',
+	'co.jp', 'ne.jp', 'or.jp', 'ac.jp', 'co.kr', 'or.kr',
+	'com.tw', 'org.tw', 'net.tw', 'idv.tw', 'com.cn', 'net.cn', 'org.cn', 'com.hk', 'org.hk',
+	'com.sg', 'com.my', 'co.th', 'com.vn', 'com.ph', 'co.id', 'co.in', 'net.in', 'org.in', 'com.pk',
+	'co.za', 'org.za', 'com.ng', 'com.eg', 'com.sa', 'co.il', 'com.tr', 'com.ua', 'com.pl', 'co.at', 'or.at',
+	'com.br', 'net.br', 'org.br', 'com.mx', 'com.ar', 'com.co', 'com.pe', 'com.es',
+	'github.io', 'blogspot.com', 'wordpress.com', 'wixsite.com', 'squarespace.com', 'myshopify.com',
+	'webflow.io', 'herokuapp.com', 'netlify.app', 'vercel.app', 'pages.dev', 'appspot.com',
+	'azurewebsites.net', 'cloudfront.net',
+])
+
+# Texts of the pages put up by the domain registrars and parking services
+PARKED_MARKERS = ('this domain is for sale', 'this domain may be for sale', 'buy this domain',
+				'domain is parked', 'parked free', 'parked domain', 'the domain name is for sale',
+				'inquire about this domain', 'this domain has expired', 'domain has expired',
+				'renew this domain', 'sedoparking', 'parkingcrew', 'bodis.com', 'domain for sale')
+
+# Domains the parked websites redirect to
+PARKING_DOMAINS = frozenset(['sedo.com', 'dan.com', 'afternic.com', 'hugedomains.com', 'parkingcrew.net',
+							'bodis.com', 'undeveloped.com', 'domainmarket.com', 'sav.com'])
+
+# Bytes of the homepage read to look for the parking markers
+PROBE_BYTES = 64 * 1024
+
+def is_address(host):
+	try:
+		ipaddress.ip_address(host)
+		return True
+	except ValueError:
+		return False
+
+def registrable_domain(host):
+	"""
+	The domain a host was registered under: its public suffix and one more
+	label, e.g. 'shop.example.co.uk' -> 'example.co.uk'. IP addresses and
+	single label hosts are returned as they are.
+	"""
+	host = (host or '').lower().rstrip('.')
+	if not host or is_address(host) or '.' not in host:
+		return host
+	labels = host.split('.')
+	for index in range(1, len(labels)):
+		if '.'.join(labels[index:]) in PUBLIC_SUFFIXES:
+			return '.'.join(labels[index - 1:])
+	return '.'.join(labels[-2:])
+
+def site_key(url):
+	"""
+	Key under which two urls are the same website: the registrable domain,
+	or the host and path for IP addresses and local hosts, which serve many
+	websites side by side
+	"""
+	host = urlsplit(url).hostname or ''
+	if is_address(host) or '.' not in host:
+		return dedupe_key(url)
+	return registrable_domain(host)
+
+def host_key(url):
+	"""
+	Cache key of a check: the host without 'www.', with the path for IP addresses and local hosts
+	"""
+	host = urlsplit(url).hostname or ''
+	if is_address(host) or '.' not in host:
+		return dedupe_key(url)
+	return domain_of(url)
+
+async def resolve_host(host):
+	"""
+	Resolves a host name with the resolver of the system, off the event loop
+
+	Returns:
+		sorted list of the addresses of the host
+	"""
+	loop = asyncio.get_running_loop()
+	infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+	return sorted({info[4][0] for info in infos})
+
+def probe(session, url, timeout):
+	"""
+	Fetches the start of the page, following its redirects
+
+	Returns:
+		(HTTP status, final url, text of the first PROBE_BYTES)
+	"""
+	with session.get(url, timeout=timeout, allow_redirects=True, stream=True) as response:
+		head = next(response.iter_content(PROBE_BYTES), b'')
+		return response.status_code, response.url, head.decode(response.encoding or 'utf-8', 'replace')
+
+def parked_reason(final_url, text):
+	"""
+	Returns:
+		why the page looks like a parked domain, or None
+	"""
+	domain = registrable_domain(urlsplit(final_url).hostname)
+	if domain in PARKING_DOMAINS:
+		return f"redirected to {domain}"
+	text = ' '.join(text.lower().split())
+	for marker in PARKED_MARKERS:
+		if marker in text:
+			return f"'{marker}'"
+	return None
+
+def refused(error):
+	"""
+	Whether a request failed because the host refused the connection or its
+	name did not resolve, looking through the exceptions urllib3 and requests
+	wrap the socket error in
+	"""
+	pending = [error]
+	seen = set()
+	while pending:
+		error = pending.pop()
+		if not isinstance(error, BaseException) or id(error) in seen:
+			continue
+		seen.add(id(error))
+		if isinstance(error, (ConnectionRefusedError, socket.gaierror)):
+			return True
+		pending += [error.__cause__, error.__context__, getattr(error, 'reason', None), *error.args]
+	return False
+
+async def check_site(session, url, semaphore, timeout=10, resolve=resolve_host):
+	"""
+	Checks that the website answers: its host resolves, its homepage loads
+	after the redirects and it is not a parked domain. Only a failed DNS
+	lookup or a refused connection make a website dead, the timeouts, TLS and
+	other errors leave it 'unknown' for the browser to try.
+
+	Returns:
+		dict with the status ('alive', 'dead', 'parked' or 'unknown'), the reason,
+		the addresses of the host, the HTTP status, the final url and the elapsed time
+	"""
+	result = {'url': url,
+			'status': 'alive',
+			'reason': None,
+			'addresses': [],
+			'http_status': None,
+			'final_url': None,
+			'elapsed': None}
+	async with semaphore:
+		start = time.time()
+		try:
+			try:
+				result['addresses'] = await resolve(urlsplit(url).hostname)
+			except (socket.gaierror, UnicodeError) as e:
+				result.update(status='dead', reason=f"DNS: {e}")
+				return result
+			except OSError as e:
+				result.update(status='unknown', reason=f"DNS: {e}")
+				return result
+			if not result['addresses']:
+				result.update(status='dead', reason="DNS: no address")
+				return result
+			try:
+				status, final_url, text = await asyncio.to_thread(probe, session, url, timeout)
+			except requests.RequestException as e:
+				result.update(status='dead' if refused(e) else 'unknown', reason=f"{type(e).__name__}: {e}")
+				return result
+			except Exception as e:
+				# Not a sign of a dead website, the browser gets its chance
+				result.update(status='unknown', reason=f"not checked: {e}")
+				return result
+			result.update(http_status=status, final_url=final_url)
+			reason = parked_reason(final_url, text)
+			if reason:
+				result.update(status='parked', reason=reason)
+		finally:
+			result['elapsed'] = round(time.time() - start, 3)
+	return result
+
+
+class PreflightCache:
+	"""
+	SQLite cache of the preflight checks per host, so the next runs skip the
+	hosts known to be dead or parked without checking them again. The
+	checks expire after the TTL, as dead websites may come back. The
+	inconclusive 'unknown' checks are not kept.
+	"""
+
+	def __init__(self, path, ttl_days=7):
+		self.ttl = ttl_days * 24 * 3600
+		# Used from the worker threads of the preflight event loop
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.connection.execute("PRAGMA journal_mode=WAL")
+		self.connection.execute("""CREATE TABLE IF NOT EXISTS preflight (
+									host TEXT PRIMARY KEY,
+									result TEXT NOT NULL,
+									checked REAL NOT NULL)""")
+		self.connection.execute("DELETE FROM preflight WHERE checked < ?", (time.time() - self.ttl,))
+		self.connection.commit()
+
+	def get(self, url):
+		"""
+		Returns:
+			the fresh check of the url's host, or None
+		"""
+		with self.lock:
+			row = self.connection.execute("SELECT result, checked FROM preflight WHERE host = ?",
+										(host_key(url),)).fetchone()
+		if row is None or time.time() - row[1] > self.ttl:
+			return None
+		return json.loads(row[0])
+
+	def put(self, url, result):
+		if result['status'] == 'unknown':
+			return
+		with self.lock, self.connection:
+			self.connection.execute("INSERT OR REPLACE INTO preflight VALUES (?, ?, ?)",
+									(host_key(url), json.dumps(result), time.time()))
+
+	def close(self):
+		self.connection.close()
+
+
+def skipped_record(row, status, check=None, duplicate_of=None):
+	"""
+	Result record of a row the browser does not need to open, shaped like the ones of process_website
+	"""
+	elapsed = check['elapsed'] if check and check.get('elapsed') is not None else 0
+	reason = check['reason'] if check else None
+	if duplicate_of is not None:
+		reason = f"same website as row {duplicate_of}"
+	return {'row_id': row[0],
+			'website': row[1],
+			'status': status,
+			'stage': 'preflight',
+			'error': reason,
+			'elapsed': elapsed,
+			'stages': [{'name': 'preflight', 'wall': elapsed, 'commands': 0, 'outcome': status}],
+			'preflight': check,
+			'duplicate_of': duplicate_of,
+			'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def preflight_rows(rows, on_skipped=None, concurrency=32, timeout=10, cache=None, resolve=resolve_host):
+	"""
+	Streams the rows whose website is alive or could not be checked, checking
+	them concurrently ahead of the consumer. Rows of a website already in the
+	list, by registrable domain or by the host it redirects to, and rows of
+	dead or parked websites are handed to on_skipped instead, from the
+	consumer thread. The checks are settled in input order, so the row kept
+	out of duplicates is always the first one of the list.
+
+	Args:
+		rows: iterable of (row_id, website, event) tuples
+		on_skipped: callable receiving the result record of each skipped row
+		concurrency: number of websites checked at once
+		timeout: timeout of each request, in seconds
+		cache: optional PreflightCache
+		resolve: coroutine function resolving a host name to its addresses
+
+	Yields:
+		(row_id, website, event) tuples of the websites for the browser, in input order
+	"""
+	done = queue.Queue(maxsize=concurrency * 4)
+	finished = object()
+	counters = {'alive': 0, 'unknown': 0, 'dead': 0, 'parked': 0, 'duplicate': 0, 'cached': 0}
+
+	async def run_all():
+		session = create_session(concurrency)
+		semaphore = asyncio.Semaphore(concurrency)
+		# Website key of the url in the list to the first row having it
+		seen = {}
+		# Website keys of the settled live rows, before and after their redirects, to their row
+		settled = {}
+		# Rows being checked with their tasks, in input order
+		window = deque()
+
+		async def emit(row, status, check=None, duplicate_of=None):
+			counters[status] += 1
+			item = row if status in ('alive', 'unknown') else skipped_record(row, status, check, duplicate_of)
+			await asyncio.to_thread(done.put, (status, item))
+
+		async def run(row):
+			check = await asyncio.to_thread(cache.get, row[1]) if cache else None
+			if check:
+				counters['cached'] += 1
+				return check
+			check = await check_site(session, row[1], semaphore, timeout, resolve)
+			if cache:
+				await asyncio.to_thread(cache.put, row[1], check)
+			return check
+
+		async def settle(row, task):
+			check = await task
+			if check['status'] == 'alive':
+				keys = [site_key(normalize_url(row[1]) or row[1]), site_key(check['final_url'] or row[1])]
+				first = next((settled[key] for key in keys if key in settled), None)
+				if first is not None:
+					await emit(row, 'duplicate', check, first)
+					return
+				settled.update(dict.fromkeys(keys, row[0]))
+			await emit(row, check['status'], check)
+
+		try:
+			for row in rows:
+				key = site_key(normalize_url(row[1]) or row[1])
+				if seen.setdefault(key, row[0]) != row[0]:
+					await emit(row, 'duplicate', duplicate_of=seen[key])
+					continue
+				window.append((row, asyncio.ensure_future(run(row))))
+				while window and (len(window) >= concurrency * 2 or window[0][1].done()):
+					await settle(*window.popleft())
+			while window:
+				await settle(*window.popleft())
+		finally:
+			session.close()
+			done.put(finished)
+
+	thread = threading.Thread(target=lambda: asyncio.run(run_all()), daemon=True)
+	thread.start()
+	while True:
+		item = done.get()
+		if item is finished:
+			break
+		status, item = item
+		if status in ('alive', 'unknown'):
+			yield item
+		elif on_skipped:
+			on_skipped(item)
+	print(f"Preflight: {counters['alive']} alive, {counters['unknown']} not checked, {counters['dead']} dead, "
+		f"{counters['parked']} parked, {counters['duplicate']} duplicates, {counters['cached']} from the cache")
+
+def main():
+	parser = argparse.ArgumentParser(description="Checks which websites answer, without a browser")
+	parser.add_argument('websites', nargs='+', help="website urls")
+	parser.add_argument('--concurrency', type=int, default=32)
+	parser.add_argument('--timeout', type=float, default=10)
+	args = parser.parse_args()
+
+	rows = [(index, normalize_url(website) or website, None) for index, website in enumerate(args.websites)]
+	for row in preflight_rows(rows, on_skipped=lambda record: print(json.dumps(record)),
+							concurrency=args.concurrency, timeout=args.timeout):
+		print(f"{row[1]} is alive")
+
+
+if __name__ == '__main__':
+	main()
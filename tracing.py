@@ -0,0 +1,175 @@
+import time
+import argparse
+from contextlib import contextmanager
+from journal import read_journal
+
+
+def instrument_driver(driver):
+	"""
+	Counts the WebDriver commands sent by the driver and its elements.
+	The driver is only wrapped once.
+
+	Returns:
+		dict whose 'count' is the number of commands sent so far
+	"""
+	counter = getattr(driver, 'command_counter', None)
+	if counter is None:
+		counter = {'count': 0}
+		execute = driver.execute
+
+		def counting_execute(driver_command, params=None):
+			counter['count'] += 1
+			return execute(driver_command, params)
+
+		driver.execute = counting_execute
+		driver.command_counter = counter
+	return counter
+
+def new_report(driver):
+	"""
+	The trace of one site: the stage it is in, the wall time per stage name
+	and the list of traced stages. The driver is reused from site to site,
+	so the commands of the site are counted from 'commands_start'.
+	"""
+	counter = instrument_driver(driver)
+	return {'stage': None, 'timings': {}, 'stages': [], 'counter': counter, 'commands_start': counter['count']}
+
+def site_commands(report):
+	"""
+	Returns:
+		number of WebDriver commands sent since the report was started
+	"""
+	return report['counter']['count'] - report['commands_start']
+
+@contextmanager
+def trace_stage(report, name):
+	"""
+	Records the wall time, the number of WebDriver commands and the outcome of a stage
+
+	Args:
+		report: the site trace from new_report
+		name: name of the stage
+	"""
+	report['stage'] = name
+	start = time.time()
+	report['stage_started'] = start
+	commands = report['counter']['count']
+	outcome = 'ok'
+	try:
+		yield
+	except Exception as e:
+		outcome = type(e).__name__
+		raise
+	finally:
+		wall = time.time() - start
+		report['timings'][name] = round(report['timings'].get(name, 0) + wall, 3)
+		report['stages'].append({'name': name,
+								'wall': round(wall, 3),
+								'commands': report['counter']['count'] - commands,
+								'outcome': outcome})
+
+def percentile(values, fraction):
+	values = sorted(values)
+	if not values:
+		return 0.0
+	return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+# Stages a captcha short-circuit skips
+SKIPPED_BY_CAPTCHA = ('fill', 'submit', 'confirm')
+
+def captcha_savings(records):
+	"""
+	Estimates the time the captcha check saved: each site stopped with the
+	"captcha" status skipped the fill, submit and confirmation stages, which
+	took on average what they took on the sites of the same run going through them
+
+	Returns:
+		(number of captcha sites, estimated seconds saved), the seconds are
+		None when no site of the run went through all those stages
+	"""
+	captchas = sum(record['status'] == 'captcha' for record in records)
+	costs = []
+	for record in records:
+		timings = record.get('timings') or {}
+		if all(stage in timings for stage in SKIPPED_BY_CAPTCHA):
+			costs.append(sum(timings[stage] for stage in SKIPPED_BY_CAPTCHA))
+	if not costs:
+		return captchas, None
+	return captchas, round(captchas * sum(costs) / len(costs), 1)
+
+def print_report(records, top=10):
+	"""
+	Prints p50/p95/max wall time and commands per stage, the slowest sites,
+	the memory of the browsers with their restarts and the time lost per failure stage
+
+	Args:
+		records: result records, e.g. the values of read_journal
+		top: number of slowest sites to list
+	"""
+	stages = {}
+	for record in records:
+		for stage in record.get('stages') or []:
+			entry = stages.setdefault(stage['name'], {'wall': [], 'commands': [], 'errors': 0})
+			entry['wall'].append(stage['wall'])
+			entry['commands'].append(stage['commands'])
+			entry['errors'] += stage['outcome'] != 'ok'
+
+	print(f"{len(records)} sites")
+	print(f"\n{'stage':<14} {'runs':>6} {'p50 s':>8} {'p95 s':>8} {'max s':>8} {'total s':>9} "
+		f"{'p50 cmd':>8} {'max cmd':>8} {'errors':>7}")
+	for name, entry in sorted(stages.items(), key=lambda item: -sum(item[1]['wall'])):
+		print(f"{name:<14} {len(entry['wall']):>6} {percentile(entry['wall'], 0.5):>8.2f} "
+			f"{percentile(entry['wall'], 0.95):>8.2f} {max(entry['wall']):>8.2f} {sum(entry['wall']):>9.1f} "
+			f"{percentile(entry['commands'], 0.5):>8} {max(entry['commands']):>8} {entry['errors']:>7}")
+
+	print("\nSlowest sites")
+	for record in sorted(records, key=lambda r: -(r.get('elapsed') or 0))[:top]:
+		slowest = max(record.get('stages') or [{'name': '-', 'wall': 0}], key=lambda s: s['wall'])
+		print(f"{record.get('elapsed') or 0:>8.1f} s  {record['status']:<14} {record['website']}  "
+			f"(slowest stage {slowest['name']} {slowest['wall']:.1f} s)")
+
+	samples = [record['memory'] for record in records if (record.get('memory') or {}).get('rss_mb') is not None]
+	recycles = {}
+	for record in records:
+		if record.get('recycle'):
+			# Journals written before the codes only have the message
+			code = record['recycle'].get('code') or record['recycle']['reason']
+			recycles[code] = recycles.get(code, 0) + 1
+	if samples:
+		rss = [sample['rss_mb'] for sample in samples]
+		handles = [sample['handles'] for sample in samples]
+		print(f"\nBrowser memory over {len(samples)} samples: p50 {percentile(rss, 0.5):.0f} MB, "
+			f"p95 {percentile(rss, 0.95):.0f} MB, max {max(rss):.0f} MB, max handles {max(handles)}")
+	if recycles:
+		print(f"Browser restarts: {recycles}")
+
+	captchas, saved = captcha_savings(records)
+	if captchas:
+		kinds = {}
+		for record in records:
+			if record['status'] == 'captcha':
+				kind = (record.get('challenge') or {}).get('kind')
+				kinds[kind] = kinds.get(kind, 0) + 1
+		print(f"\nCaptcha protected sites: {kinds}, about {saved if saved is not None else '?'} s saved "
+			f"by stopping before {', '.join(SKIPPED_BY_CAPTCHA)}")
+
+	failures = {}
+	for record in records:
+		if record['status'] in ('failed', 'timeout'):
+			entry = failures.setdefault(record.get('stage') or 'unknown', [])
+			entry.append(record.get('elapsed') or 0)
+	if failures:
+		print(f"\n{'failure stage':<14} {'sites':>6} {'total s':>9} {'mean s':>8}")
+		for name, times in sorted(failures.items(), key=lambda item: -sum(item[1])):
+			print(f"{name:<14} {len(times):>6} {sum(times):>9.1f} {sum(times) / len(times):>8.1f}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Per stage timing report of a run")
+	parser.add_argument('journal', nargs='?', default='results.jsonl', help="results journal of the run")
+	parser.add_argument('--top', type=int, default=10, help="number of slowest sites to list")
+	args = parser.parse_args()
+	print_report(list(read_journal(args.journal).values()), args.top)
+
+
+if __name__ == '__main__':
+	main()
@@ -1,347 +1,511 @@
-import time
-import random
-import traceback
+import re
 from selenium import webdriver
-from bs4 import BeautifulSoup
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import Select
-from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import ElementNotInteractableException
-from selenium.common.exceptions import ElementClickInterceptedException
 from selenium.common.exceptions import TimeoutException
 from selenium.common.exceptions import StaleElementReferenceException
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains 
 from selenium.common.exceptions import WebDriverException
+from waits import STAGE_TIMEOUTS, pause, wait_for_page_ready
+from lexicon import keywords, page_language
+from consent import install_consent_preseed
+from captcha import classify_challenge
+from discovery import score_contact_link, score_contact_text, same_site
 
 class BotException(Exception):
 	pass
 
-def translate_page(driver, website_url):
-
-	driver.get(website_url)
-
-	# Use JavaScript to get the language from the <html> lang attribute
-	lang = driver.execute_script("return document.documentElement.lang;")
-
-	# Check if the page is already in English
-	if lang.startswith('en'):
-		print(f"Page is already in {lang}.")
-	else:
-		print(f"Page language is {lang}")
-		# Google Translate URL with auto-detection and English as the target language
-		google_translate_url = f'https://translate.google.com/translate?hl=en&sl=auto&tl=en&u={website_url}'
-
-		# Navigate to the Google Translate URL which will show the translated website
-		driver.get(google_translate_url)
-
-		# The content will now be within an iframe, so you might need to switch to it
-		# Look for the iframe id or name in the translated page (it might change over time or be different)
-		iframe_id = 'google_translate_iframe'  # This is a placeholder; you'll need to check the correct id or name
-		try:
-			WebDriverWait(driver, 10).until(EC.frame_to_be_available_and_switch_to_it((By.ID, iframe_id)))
-			# Now you can interact with the translated content
-		except WebDriverException as e:
-			pass
-		except Exception as e:
-			pass
-
-
-def find_elements_from_soup(query_element, include_tags, include_attributes_per_tag, exclude_attributes_per_tag):
-	
-	def match_conditions(tag, element):
-		# Check inclusion criteria (case-insensitive substring match)
-		for attr, include_values in include_attributes_per_tag.get(tag, {}).items():
-			element_attr_value = element.get(attr, '').lower()
-			# All include_values must be present in element_attr_value
-			if not all(include_value.lower() in element_attr_value for include_value in include_values):
-				return False
-		# Check exclusion criteria (case-insensitive substring match)
-		for attr, exclude_values in exclude_attributes_per_tag.get(tag, {}).items():
-			element_attr_value = element.get(attr, '').lower()
-			# Any of exclude_values being present means exclusion
-			if any(exclude_value.lower() in element_attr_value for exclude_value in exclude_values):
-				return False
-		return True
-
-	def construct_css_selector(element):
-		tag_name = element.name
-		class_name = element.get('class')[0] if element.get('class') else None
-		element_id = element.get('id')
-
-		selector = tag_name
-		if class_name:
-			selector += f".{class_name}"
-		if element_id:
-			selector += f"#{element_id}"
-
-
-		return selector
-
-	outer_html = query_element.get_attribute('outerHTML')
-	soup = BeautifulSoup(outer_html, 'html.parser')    
-	result = []
-	for tag in include_tags:
-		for element in soup.find_all(tag):
-			if match_conditions(tag, element):
-				css_selector = construct_css_selector(element)
-				result.append(css_selector)
+class CaptchaDetected(BotException):
+	"""
+	The form is protected by a captcha or the page by a bot challenge
+	"""
 
-	return result
+	def __init__(self, challenge):
+		super().__init__(f"Form is protected with {challenge['kind']} ({challenge['detail']})")
+		self.challenge = challenge
 
-def fill_in_section(element, attribute, inputs, message, visited):
+def open_page(driver, website_url):
 	"""
-	Fills in each input section in the contact form.
+	Loads the page and reads its language, which selects the keywords of
+	lexicon.json used on the page. Non-English pages are matched in their own
+	language, without a second load through a translation service.
 
 	Args:
 		driver: webdriver object
-		attribute: web element attribute name
-		section: the contact form section, i.e. name, phone, company, etc
-		message: the message to send in the form
-	"""
-	try:
-		res = {'@type': [],
-				'@name': [],
-				'@class': [],
-				'@placeholder': []}
-		for i in inputs:
-			res['@type'].append(xpath_lower('@type', i))
-			res['@name'].append(xpath_lower('@name', i))
-			res['@class'].append(xpath_lower('@class', i))
-			res['@placeholder'].append(xpath_lower('@placeholder', i))
-		xpath_query = f"""//{attribute}[({' and '.join(res['@type'])}) or
-										({' and '.join(res['@name'])}) or
-										({' and '.join(res['@class'])}) or
-										({' and '.join(res['@placeholder'])})]"""
-
-		section_input = element.find_element(By.XPATH, xpath_query)
-		if section_input.id in visited:
-			return None
-		time.sleep(1)
-		section_input.send_keys(message)
-		time.sleep(random.uniform(1.0, 2.0))
-		return section_input.id
-	except (NoSuchElementException, ElementNotInteractableException, TimeoutException) as e:
-		return None
+		website_url: url of the page
 
-def filter_contact_forms(forms):
+	Returns:
+		language code of the page, 'en' if it does not declare one
+	"""
+	load_page(driver, website_url)
+	wait_for_page_ready(driver)
+	lang = page_language(driver)
+	print(f"Page language is {lang}")
+	return lang
+
+
+# Collects in one call the links and link-like elements whose href or text
+# contains one of the keywords, with their position in the page
+CONTACT_LINKS_SCRIPT = """
+var keywords = arguments[0];
+var elements = document.querySelectorAll('a, button, [role="link"], [role="button"], [onclick]');
+var links = [];
+for (var i = 0; i < elements.length; i++) {
+	var el = elements[i];
+	var href = el.getAttribute('href') || el.getAttribute('data-href') || '';
+	var text = (el.innerText || el.textContent || '').trim().slice(0, 100) ||
+		el.getAttribute('title') || el.getAttribute('aria-label') || '';
+	var haystack = (href + ' ' + text).toLowerCase();
+	var found = false;
+	for (var k = 0; k < keywords.length && !found; k++) {
+		found = haystack.indexOf(keywords[k]) >= 0 || haystack.indexOf(keywords[k].replace(/ /g, '-')) >= 0;
+	}
+	if (!found) continue;
+	links.push({element: el, href: href, text: text,
+				inNav: !!el.closest('nav, header, footer'),
+				visible: !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)});
+}
+return links;
+"""
+
+def rank_contact_links(driver, lang='en'):
+	"""
+	Collects and scores the contact link candidates of the current page
 
-	for form in forms:
-		try:
-			email_inputs = form.find_element(By.XPATH, f"""//input[{
-											to_xpath_converter([('@name', 'email'),
-																('@id', 'email'),
-																('@class', 'email'),
-																('@placeholder', 'email')])}]""")
-			text_area = form.find_element(By.XPATH, "//textarea")
-			# Email input was found, try to find submit button
-			include_tags = ['input', 'button']
-			include_attributes_per_tag = {
-				'input': {'type': ['submit']},
-				'button': {}
-			}
-			exclude_attributes_per_tag = {}
-			submit_buttons = find_elements_from_soup(form, include_tags, include_attributes_per_tag, exclude_attributes_per_tag)
-			if len(submit_buttons) == 1:
-				return form
-		except NoSuchElementException:
-			continue
-	return None
+	Args:
+		driver: webdriver object
+		lang: language of the page, selects the contact keywords
 
-def find_contact_us_page(driver):
+	Returns:
+		(links, buttons): the (score, url, text) of the links best first, and
+		the (score, element, text) of the elements without a usable href,
+		which can only be clicked, best first
 	"""
-	Finds the contect form on the webpage using keywords
+	base_url = driver.current_url
+	current = base_url.split('#')[0]
+	links = {}
+	buttons = []
+	for candidate in driver.execute_script(CONTACT_LINKS_SCRIPT, keywords('contact', lang)):
+		score, url = score_contact_link(candidate['href'], candidate['text'], base_url,
+										candidate['inNav'], lang)
+		if url:
+			if url.split('#')[0] == current:
+				continue
+			score += candidate['visible']
+			if score > links.get(url, (0, ''))[0]:
+				links[url] = (score, candidate['text'])
+		elif not candidate['href'].lower().startswith(('mailto:', 'tel:', 'data:')):
+			score = score_contact_text(candidate['text'], lang)
+			if score:
+				buttons.append((score + candidate['inNav'] * 2 + candidate['visible'],
+								candidate['element'], candidate['text']))
+	links = sorted(((score, url, text) for url, (score, text) in links.items()), key=lambda c: -c[0])
+	buttons.sort(key=lambda c: -c[0])
+	return links, buttons
+
+def find_contact_us_page(driver, lang='en'):
+	"""
+	Goes to the contact page: straight to the url of the best ranked contact
+	link, or by clicking the best contact button when there is no link
 
 	Args:
 		driver: webdriver object
+		lang: language of the page, selects the contact keywords
+
+	Returns:
+		url of the contact page
 	"""
-	contact_strings = ['contact', 'kontakt', 'kontact', 'get in touch']
-	exclude_this = """not(contains(@id, 'css')) and
-						not(contains(@type, 'css')) and 
-						not(contains(@href, 'css')) and
-						not(contains(@id, 'javascript')) and
-						not(contains(@type, 'javascript')) and 
-						not(contains(@src, 'javascript'))"""
-	contact_list = []
-	for i in contact_strings:
-		xpath_query = f"""//a[({to_xpath_converter([('@href', i),('text()', i)])}) and {exclude_this}] |
-						//span[({to_xpath_converter([('@href', i),('text()', i)])}) and {exclude_this}] |
-						//button[({to_xpath_converter([('@href', i),('text()', i)])}) and {exclude_this}] |
-						//*[(name()!='span' and name()!='button') and 
-						({to_xpath_converter([('@href', i),('text()', i)])}) and {exclude_this}]"""
-
-		elements_containing_contact = driver.find_elements(By.XPATH, xpath_query)
-		contact_list.extend(elements_containing_contact)
-	
-	for contact in contact_list:
+	links, buttons = rank_contact_links(driver, lang)
+	if links:
+		score, url, text = links[0]
+		print(f"Contact link '{text}' ({score}): {url}")
+		load_page(driver, url)
+		wait_for_page_ready(driver, STAGE_TIMEOUTS['contact_page'])
+		pause('navigation')
+		return driver.current_url
+
+	# JS-only buttons, e.g. opening the contact page from an onclick handler
+	for score, button, text in buttons:
 		try:
-			driver.execute_script("arguments[0].scrollIntoView(true);", contact)
-			time.sleep(random.uniform(1.0, 2.0))
-			driver.execute_script("arguments[0].click();", contact)
-			# element_attributes(driver, contact)
-			time.sleep(random.uniform(3.0, 4.0))
-			return
+			start_url = driver.current_url
+			driver.execute_script("arguments[0].scrollIntoView(true);", button)
+			pause('click')
+			driver.execute_script("arguments[0].click();", button)
+			wait_for_page_ready(driver, STAGE_TIMEOUTS['contact_page'])
+			if driver.current_url != start_url or find_contact_form(driver, lang):
+				print(f"Contact button '{text}' ({score}) clicked")
+				pause('navigation')
+				return driver.current_url
 		except (ElementNotInteractableException,
 				StaleElementReferenceException) as e:
 			continue
 	raise BotException("'Contac us' page was not found")
 
-def find_contact_form(driver):
-	# if there is only one post method form, take it
+# Summarizes every form of the page in one call: the counts of the kinds of
+# fields, the method, the attributes and whether the form is visible
+FORM_INVENTORY_SCRIPT = """
+var forms = document.forms;
+var inventory = [];
+for (var i = 0; i < forms.length; i++) {
+	var form = forms[i];
+	var summary = {element: form, index: i, id: form.id || '', class: form.getAttribute('class') || '',
+		name: form.getAttribute('name') || '', action: form.getAttribute('action') || '',
+		method: (form.getAttribute('method') || 'get').toLowerCase(), role: form.getAttribute('role') || '',
+		visible: !!(form.offsetWidth || form.offsetHeight || form.getClientRects().length),
+		inputs: 0, emails: 0, textareas: 0, submits: 0, passwords: 0, searches: 0, selects: 0};
+	var controls = form.querySelectorAll('input, textarea, select, button');
+	for (var j = 0; j < controls.length; j++) {
+		var el = controls[j], tag = el.tagName.toLowerCase(), type = (el.getAttribute('type') || '').toLowerCase();
+		var text = [el.getAttribute('name'), el.id, el.getAttribute('placeholder'), el.getAttribute('autocomplete')].join(' ').toLowerCase();
+		if (tag === 'textarea') {
+			summary.textareas++;
+		} else if (tag === 'select') {
+			summary.selects++;
+		} else if (tag === 'button') {
+			if (type !== 'button' && type !== 'reset') summary.submits++;
+		} else if (type === 'submit' || type === 'image') {
+			summary.submits++;
+		} else if (type === 'password') {
+			summary.passwords++;
+		} else if (type === 'search') {
+			summary.searches++;
+		} else if (['hidden', 'checkbox', 'radio', 'file', 'reset', 'button'].indexOf(type) < 0) {
+			summary.inputs++;
+			if (type === 'email' || text.indexOf('mail') >= 0) summary.emails++;
+		}
+	}
+	inventory.push(summary);
+}
+return inventory;
+"""
+
+# An email field or a textarea, with a submit button, is the least a contact form has
+MIN_FORM_SCORE = 5
+
+def form_inventory(driver):
+	"""
+	Returns:
+		list of the summaries of all forms of the current page, with the form element
+	"""
+	return driver.execute_script(FORM_INVENTORY_SCRIPT)
 
-	forms = driver.find_elements(By.XPATH, "//form")
-	good_forms = []
-	post_forms = []
-	for f in range(len(forms)):
-		if (forms[f].get_attribute('id') == 'goog-gt-votingForm' or
-			'search' in forms[f].get_attribute('id') or
-			'search' in forms[f].get_attribute('class')):
-			continue
-		elif forms[f].get_attribute('method').lower() == 'post':
-			post_forms.append(forms[f])	
-			good_forms.append(forms[f])
-		else:
-			good_forms.append(forms[f])
-	if not good_forms:
-		return None
-	if len(post_forms) == 1:
-		return post_forms[0]
-	if len(good_forms) == 1:
-		element_attributes(driver, forms[0])
-		return good_forms[0]
+def score_form(summary, lang='en'):
+	"""
+	Scores how likely a form is the contact form
 
-	return filter_contact_forms(good_forms)
+	Args:
+		summary: form summary from form_inventory
+		lang: language of the page, selects the contact keywords
 
-def find_form_in_iframe(driver):
+	Returns:
+		(score, list of the reasons against the form)
+	"""
+	attributes = ' '.join([summary['id'], summary['class'], summary['name'], summary['action'], summary['role']]).lower()
+	score = 0
+	reasons = []
+	if summary['id'] == 'goog-gt-votingForm':
+		return -100, ["translation widget"]
+	if summary['emails']:
+		score += 4
+	else:
+		reasons.append("no email field")
+	if summary['textareas']:
+		score += 4
+	else:
+		reasons.append("no textarea")
+	if summary['submits']:
+		score += 1
+	else:
+		reasons.append("no submit button")
+	if summary['inputs'] >= 2:
+		score += 2
+	if summary['method'] == 'post':
+		score += 1
+	if any(keyword.replace(' ', '-') in attributes or keyword in attributes for keyword in keywords('contact', lang)):
+		score += 2
+	if summary['passwords']:
+		score -= 10
+		reasons.append("login form")
+	if summary['searches'] or 'search' in attributes:
+		score -= 8
+		reasons.append("search form")
+	elif 'newsletter' in attributes or 'subscribe' in attributes or (
+		summary['emails'] and not summary['textareas'] and summary['inputs'] <= 2):
+		score -= 4
+		reasons.append("newsletter form")
+	if not summary['visible']:
+		score -= 5
+		reasons.append("hidden")
+	return score, reasons
+
+def find_contact_form(driver, lang='en'):
+	"""
+	Picks the contact form of the current page from the inventory of its forms
 
-	iframes = driver.find_elements(By.TAG_NAME, "iframe")
+	Args:
+		driver: webdriver object
+		lang: language of the page, selects the contact keywords
 
-	# Step 2: Iterate through each iframe to find the form
-	for index, iframe in enumerate(iframes):
-		# Switch to the iframe
-		driver.switch_to.frame(iframe)
-		
-		# Try to find the form within this iframe
-		try:
-			# Example: Looking for a form element directly
-			form_element = find_contact_form(driver)
-			if form_element:
-				element_attributes(driver, form_element)
-				return form_element
-		except:
-			# If the form is not found, an exception will be thrown, and we catch it here
-			driver.switch_to.default_content()
-
-	# Step 4: Switch back to the main document if further actions are needed outside of iframes
-	driver.switch_to.default_content()
-	raise BotException("Contact form was not found")
+	Returns:
+		the form element, or None if no form looks like a contact form
+	"""
+	best, best_score = None, MIN_FORM_SCORE - 1
+	for summary in form_inventory(driver):
+		score, reasons = score_form(summary, lang)
+		name = summary['id'] or summary['name'] or summary['action'] or f"#{summary['index']}"
+		if score > best_score:
+			if best is not None:
+				print(f"Form '{best[1]}' rejected: lower score {best_score} than {score}")
+			best, best_score = (summary['element'], name), score
+		else:
+			print(f"Form '{name}' rejected: score {score}" + (f", {', '.join(reasons)}" if reasons else ""))
+	return best[0] if best else None
+
+# Iframes of known form providers, searched first
+FORM_PROVIDER_FRAMES = ['hsforms.com', 'hsforms.net', 'hubspot.com', 'typeform.com', 'docs.google.com/forms',
+						'forms.gle', 'jotform.com', 'jotform.eu', 'formstack.com', 'cognitoforms.com', 'wufoo.com',
+						'123formbuilder.com', 'forms.zohopublic', 'paperform.co', 'tally.so', 'formsite.com',
+						'pipedrive.com/form', 'mailchimp.com/contact']
+
+# Iframes which never hold the contact form: ads, video, maps, social, chat and captcha widgets
+SKIPPED_FRAMES = ['doubleclick.net', 'googlesyndication.com', 'googleadservices.com', 'adnxs.com', 'criteo',
+				'taboola.com', 'outbrain.com', 'amazon-adsystem.com', 'youtube.com', 'youtube-nocookie.com',
+				'player.vimeo.com', 'wistia', 'google.com/maps', 'maps.google', 'facebook.com/plugins',
+				'platform.twitter.com', 'instagram.com', 'linkedin.com', 'spotify.com', 'soundcloud.com',
+				'intercom', 'drift.com', 'tawk.to', 'livechatinc.com', 'zopim', 'zendesk', 'crisp.chat',
+				'hotjar.com', 'googletagmanager.com', 'recaptcha', 'hcaptcha.com', 'challenges.cloudflare.com']
+
+# Depth of the nested iframes searched for the form
+MAX_FRAME_DEPTH = 2
+
+# Lists the iframes of the current browsing context in one call
+FRAME_INVENTORY_SCRIPT = """
+var frames = document.getElementsByTagName('iframe');
+var inventory = [];
+for (var i = 0; i < frames.length; i++) {
+	var frame = frames[i], rect = frame.getBoundingClientRect();
+	var style = window.getComputedStyle(frame);
+	inventory.push({element: frame, index: i, src: frame.src || '', width: rect.width, height: rect.height,
+		visible: style.display !== 'none' && style.visibility !== 'hidden' && rect.width > 0 && rect.height > 0});
+}
+return inventory;
+"""
+
+def score_frame(frame, base_url):
+	"""
+	Scores how likely an iframe holds the contact form
+
+	Args:
+		frame: iframe summary from FRAME_INVENTORY_SCRIPT
+		base_url: url of the page the iframe is on
 
+	Returns:
+		the score, or None for the iframes which are skipped
+	"""
+	src = frame['src'].lower()
+	if any(pattern in src for pattern in SKIPPED_FRAMES):
+		return None
+	score = 0
+	if any(pattern in src for pattern in FORM_PROVIDER_FRAMES):
+		score += 10
+	if src.startswith('http') and same_site(src, base_url):
+		score += 2
+	if 'form' in src or 'contact' in src:
+		score += 3
+	if frame['width'] >= 200 and frame['height'] >= 200:
+		score += 2
+	elif frame['width'] < 50 or frame['height'] < 50:
+		score -= 5
+	if not frame['visible']:
+		score -= 4
+	return score
+
+def rank_frames(driver, base_url):
+	"""
+	Returns:
+		(ranked iframes of the current browsing context best first, number of skipped iframes)
+	"""
+	frames = driver.execute_script(FRAME_INVENTORY_SCRIPT)
+	ranked = []
+	for frame in frames:
+		score = score_frame(frame, base_url)
+		if score is not None:
+			ranked.append((score, frame))
+	ranked.sort(key=lambda f: (-f[0], f[1]['index']))
+	return [frame for _, frame in ranked], len(frames) - len(ranked)
+
+def find_form_in_iframe(driver, lang='en', max_depth=MAX_FRAME_DEPTH):
+	"""
+	Looks for the contact form inside the iframes of the page, the most
+	promising first, and inside their nested iframes up to max_depth.
+	Ad, video, map, social and chat iframes are skipped.
 
-def create_driver():
+	Args:
+		driver: webdriver object
+		lang: language of the page, selects the contact keywords
+		max_depth: depth of the nested iframes to search
 
-	options = Options()
-	options.add_argument("--start-maximized")
-	driver = webdriver.Chrome(options)
+	Returns:
+		(form element, frame path: list of the index and src of each iframe
+		from the page down to the form). The driver stays switched into the last iframe.
+	"""
+	base_url = driver.current_url
+	searched = [0, 0]
+
+	def search(path):
+		frames, skipped = rank_frames(driver, base_url)
+		searched[1] += skipped
+		for frame in frames:
+			try:
+				driver.switch_to.frame(frame['element'])
+			except WebDriverException:
+				continue
+			searched[0] += 1
+			frame_path = path + [{'index': frame['index'], 'src': frame['src']}]
+			try:
+				form_element = find_contact_form(driver, lang)
+				if form_element:
+					return form_element, frame_path
+				if len(frame_path) < max_depth:
+					found = search(frame_path)
+					if found:
+						return found
+			except WebDriverException:
+				pass
+			driver.switch_to.parent_frame()
+		return None
 
-	return driver
+	found = search([])
+	print(f"{searched[0]} iframes searched, {searched[1]} skipped")
+	if found:
+		return found
+	driver.switch_to.default_content()
+	raise BotException("Contact form was not found")
 
-def to_xpath_converter(attributes):
+def switch_to_frame(driver, frame):
 	"""
-	Adds the attribute and the search string to the
-	XPath expresion
+	Switches into the iframe recorded by find_form_in_iframe, level by level,
+	each found by its src, or by its index if the src changed
 
 	Args:
-		attributes: list of 2d tuples
+		driver: webdriver object
+		frame: frame path, or the single frame dict of the older cache entries
 
 	Returns:
-		XPath string expresion
+		True if the iframe was found
+	"""
+	for level in (frame if isinstance(frame, list) else [frame]):
+		iframes = driver.find_elements(By.TAG_NAME, "iframe")
+		for iframe in iframes:
+			if level['src'] and iframe.get_attribute('src') == level['src']:
+				driver.switch_to.frame(iframe)
+				break
+		else:
+			if level['index'] >= len(iframes):
+				driver.switch_to.default_content()
+				return False
+			driver.switch_to.frame(iframes[level['index']])
+	return True
+
+
+# Resources a form submission does not need, blocked in the lean mode.
+# The patterns are matched against the whole request url.
+# Images, fonts and media, blocked by the extension at the end of the path,
+# so hosts like www.icodata.de or www.moviik.com still load
+BLOCKED_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp',
+					'woff', 'woff2', 'ttf', 'otf', 'eot',
+					'mp4', 'webm', 'mp3', 'ogg', 'avi', 'mov')
+
+BLOCKED_URL_PATTERNS = [pattern for extension in BLOCKED_EXTENSIONS
+						for pattern in (f'*.{extension}', f'*.{extension}?*')] + [
+	# ads and analytics
+	'*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+	'*googlesyndication.com*', '*googleadservices.com*', '*facebook.net*',
+	'*connect.facebook.com*', '*hotjar.com*', '*hs-analytics.net*', '*clarity.ms*',
+	'*linkedin.com/px*', '*snap.licdn.com*', '*ads-twitter.com*', '*adnxs.com*',
+	'*criteo.com*', '*taboola.com*', '*outbrain.com*', '*matomo*', '*piwik*',
+	'*youtube.com/embed*', '*player.vimeo.com*',
+]
+
+def url_blocked(url, patterns=BLOCKED_URL_PATTERNS):
+	"""
+	Whether Network.setBlockedURLs blocks the url: a pattern matches the
+	whole url, its '*' standing for any characters
 	"""
-	xpath_conditions = [
-		f"""contains(translate({attribute}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 
-					'abcdefghijklmnopqrstuvwxyz'), '{value.lower()}')"""
-		for attribute, value in attributes
-	]
-	return " or ".join(xpath_conditions)
-
-def xpath_lower(attribute, value):
-	res = f"""contains(translate({attribute}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 
-				'abcdefghijklmnopqrstuvwxyz'), '{value.lower()}')"""
-
-	return res
-
-def element_attributes(driver, element):
-
-	script = """
-	var items = {}; 
-	for (var index = 0; index < arguments[0].attributes.length; ++index) { 
-		items[arguments[0].attributes[index].name] = arguments[0].attributes[index].value
-	}; 
-	return items;
+	for pattern in patterns:
+		if re.fullmatch('.*'.join(re.escape(part) for part in pattern.split('*')), url, re.DOTALL):
+			return True
+	return False
+
+def create_driver(lean=False, page_load_timeout=30, arguments=(), consent_preseed=True):
 	"""
+	Creates the Chrome webdriver
 
-	# Execute the script to get all attributes
-	attributes = driver.execute_script(script, element)
+	Args:
+		lean: headless browser with the 'eager' page load strategy, no
+			extensions nor GPU, and the images, fonts, media and known
+			ad/analytics hosts blocked
+		page_load_timeout: seconds driver.get waits for the page before giving up
+		arguments: extra Chrome command line arguments
+		consent_preseed: store the answered state of the common cookie consent
+			platforms before each page loads, so their banner does not show up
 
-def check_for_captcha(driver):
+	Returns:
+		webdriver object
+	"""
+	options = Options()
+	if lean:
+		options.add_argument("--headless=new")
+		options.add_argument("--window-size=1920,1080")
+		options.add_argument("--disable-extensions")
+		options.add_argument("--disable-gpu")
+		options.add_argument("--mute-audio")
+		options.add_argument("--blink-settings=imagesEnabled=false")
+		options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+		options.page_load_strategy = 'eager'
+	else:
+		options.add_argument("--start-maximized")
+	for argument in arguments:
+		options.add_argument(argument)
+	driver = webdriver.Chrome(options)
+	driver.set_page_load_timeout(page_load_timeout)
+	if lean:
+		driver.execute_cdp_cmd('Network.enable', {})
+		driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+	if consent_preseed:
+		install_consent_preseed(driver)
 
+	return driver
+
+def load_page(driver, url):
+	"""
+	Opens the url. When the page load timeout runs out, the loading is
+	stopped and the bot goes on with what is already there.
+	"""
 	try:
-		captchas = driver.find_elements(By.XPATH, f"""//input[{
-									to_xpath_converter([('@name', 'captcha'),
-														('@id', 'captcha'),
-														('@class', 'captcha')])}] |
-									//img[{to_xpath_converter([('@id', 'captcha'),
-																('@alt', 'captcha')])}]""")
-		raise BotException("Form is protected with a Captcha")
-	except (NoSuchElementException):
-		return
-
-def check_for_cookie(driver):
+		driver.get(url)
+	except TimeoutException:
+		print(f"Page load timeout on {url}, continuing with the partial page")
+		driver.execute_script("window.stop();")
+
+def check_for_captcha(driver, form_element=None, fields=None):
 	"""
-	Checks for the Cookies pop up on the webpage.
-	Tries to Accept Cookies if any.
+	Classifies the protection of the form and stops the site when it can not be submitted
 
 	Args:
-		driver: webdriver object
+		driver: webdriver object, in the browsing context of the form
+		form_element: the contact form, None to check the page only
+		fields: field dicts from snapshot_form, the honeypot fields are marked invisible in them
+
+	Returns:
+		the challenge dict of classify_challenge, for the forms which can be submitted
 	"""
-	time.sleep(7)
-	accept_buttons = driver.find_elements(By.XPATH, f"""//a[
-								{to_xpath_converter([('@data-action', 'accept'),
-													('text()', 'accept'),
-													('@id', 'accept'),
-													('@class', 'accept'),
-													('@data-action', 'allow'),
-													('text()', 'allow'),
-													('@id', 'allow'),
-													('@class', 'allow')])}] | 
-								//button[
-								{to_xpath_converter([('@data-action', 'accept'),
-													('text()', 'accept'),
-													('@id', 'accept'),
-													('@class', 'accept'),
-													('@data-action', 'allow'),
-													('text()', 'allow'),
-													('@id', 'allow'),
-													('@class', 'allow')])}] |
-								//div[
-								{to_xpath_converter([('@class', 'button')])} and
-								{to_xpath_converter([('@class', 'accept')])}] |
-								//a[
-								({to_xpath_converter([('@class', 'button')])} and
-								{to_xpath_converter([('text()', 'accept')])}) or
-								({to_xpath_converter([('@id', 'button')])} and
-								{to_xpath_converter([('text()', 'accept')])}) or
-								({to_xpath_converter([('@class', 'button')])} and
-								{to_xpath_converter([('text()', 'allow')])}) or
-								({to_xpath_converter([('@id', 'button')])} and
-								{to_xpath_converter([('text()', 'allow')])})]""")
-	for accept in accept_buttons:
-		try:
-			accept.click()
-			time.sleep(1)
-			print("Cookie pop-up accepted.")
-			return
-		except (NoSuchElementException, ElementNotInteractableException):
-			continue
-	print("No cookie pop-up found or error in accepting cookies.")
+	challenge = classify_challenge(driver, form_element, fields)
+	if challenge['blocking']:
+		raise CaptchaDetected(challenge)
+	for index in challenge['honeypots']:
+		# Left empty, like a user who does not see them
+		if fields and index < len(fields):
+			fields[index]['visible'] = False
+	return challenge
+
@@ -0,0 +1,132 @@
+import time
+import random
+from selenium.common.exceptions import WebDriverException
+from selenium.common.exceptions import StaleElementReferenceException
+
+# Timeout budget of each pipeline stage, in seconds. The waits return as soon
+# as the page is ready, the budget is only spent on slow pages.
+STAGE_TIMEOUTS = {
+	'page_load': 15,
+	'cookie': 5,
+	'contact_page': 10,
+	'field': 3,
+	'confirm': 12,
+}
+
+# Deliberate human-like pauses, (min, max) seconds per kind of action.
+# They are independent from the readiness waits.
+PACING_PROFILES = {
+	'fast': {'field': (0.0, 0.0), 'click': (0.0, 0.0), 'navigation': (0.0, 0.0)},
+	'human': {'field': (1.0, 2.0), 'click': (1.0, 2.0), 'navigation': (3.0, 4.0)},
+}
+
+POLL_INTERVAL = 0.1
+
+_pacing = {'profile': 'fast'}
+
+# Only nodes added or removed count as DOM activity: the carousels, tickers and
+# animations of many pages change their style attributes forever
+READINESS_SCRIPT = """
+if (!window.__botMutationObserver && document.documentElement) {
+	window.__botLastMutation = performance.now();
+	window.__botMutationObserver = new MutationObserver(function() {
+		window.__botLastMutation = performance.now();
+	});
+	window.__botMutationObserver.observe(document.documentElement,
+		{childList: true, subtree: true});
+}
+var resources = performance.getEntriesByType('resource');
+var lastResponse = 0;
+for (var i = 0; i < resources.length; i++) {
+	lastResponse = Math.max(lastResponse, resources[i].responseEnd);
+}
+var now = performance.now();
+return {
+	state: document.readyState,
+	resources: resources.length,
+	networkQuiet: (now - lastResponse) / 1000,
+	domQuiet: (now - (window.__botLastMutation || 0)) / 1000
+};
+"""
+
+def set_pacing(profile):
+	"""
+	Selects the pacing profile used by pause()
+
+	Args:
+		profile: name of the profile in PACING_PROFILES
+	"""
+	if profile not in PACING_PROFILES:
+		raise ValueError(f"Unknown pacing profile '{profile}'")
+	_pacing['profile'] = profile
+
+def pause(kind):
+	"""
+	Sleeps for the human-like delay of the action kind in the current profile
+
+	Args:
+		kind: 'field', 'click' or 'navigation'
+	"""
+	low, high = PACING_PROFILES[_pacing['profile']][kind]
+	if high > 0:
+		time.sleep(random.uniform(low, high))
+
+def wait_for_page_ready(driver, timeout=None, quiet_period=0.5):
+	"""
+	Waits until the document is loaded, the network is idle and no node was
+	added to or removed from the DOM for quiet_period seconds, or the timeout
+	runs out.
+
+	Args:
+		driver: webdriver object
+		timeout: budget in seconds, the 'page_load' stage budget by default
+		quiet_period: seconds without new responses and added or removed nodes
+
+	Returns:
+		True if the page became ready, False if the budget was exhausted
+	"""
+	if timeout is None:
+		timeout = STAGE_TIMEOUTS['page_load']
+	deadline = time.time() + timeout
+	last_resources = None
+	while True:
+		try:
+			state = driver.execute_script(READINESS_SCRIPT)
+			if (state['state'] == 'complete' and
+				state['resources'] == last_resources and
+				state['networkQuiet'] >= quiet_period and
+				state['domQuiet'] >= quiet_period):
+				return True
+			last_resources = state['resources']
+		except WebDriverException:
+			# The page is navigating or the script was blocked, try again
+			last_resources = None
+		if time.time() >= deadline:
+			return False
+		time.sleep(POLL_INTERVAL)
+
+def wait_for_interactable(element, timeout=None):
+	"""
+	Waits until the element is displayed and enabled
+
+	Args:
+		element: web element
+		timeout: budget in seconds, the 'field' stage budget by default
+
+	Returns:
+		True if the element became interactable, False otherwise
+	"""
+	if timeout is None:
+		timeout = STAGE_TIMEOUTS['field']
+	deadline = time.time() + timeout
+	while True:
+		try:
+			if element.is_displayed() and element.is_enabled():
+				return True
+		except StaleElementReferenceException:
+			return False
+		except WebDriverException:
+			pass
+		if time.time() >= deadline:
+			return False
+		time.sleep(POLL_INTERVAL)
@@ -0,0 +1,221 @@
+import time
+import threading
+from selenium.common.exceptions import WebDriverException
+from utils import BotException, create_driver
+from governor import MemoryGovernor, browser_processes, clear_browser_state
+
+# Hard budget of each stage, in seconds. Unlike the readiness waits of
+# STAGE_TIMEOUTS, which only bound one wait, a stage running over its budget
+# is cancelled together with the whole site.
+STAGE_BUDGETS = {
+	'load_page': 45,
+	'cookie': 20,
+	'contact_page': 45,
+	'find_form': 30,
+	'iframe_form': 60,
+	'challenge': 15,
+	'fill': 60,
+	'submit': 30,
+	'confirm': 30,
+}
+
+# Hard deadline of one site, in seconds
+SITE_DEADLINE = 180
+
+# Seconds the browser has to answer a trivial command before it is replaced
+RESPONSIVE_TIMEOUT = 5
+
+WATCH_INTERVAL = 0.5
+
+class SiteTimeout(BotException):
+	pass
+
+def kill_driver(driver):
+	"""
+	Kills the chromedriver process and the browsers it started. A command
+	blocked on the driver fails right away instead of waiting for the page.
+	"""
+	process = getattr(getattr(driver, 'service', None), 'process', None)
+	if process is None:
+		return
+	# psutil finds the browser processes started by chromedriver, without it only chromedriver is killed
+	for child in browser_processes(driver)[1:]:
+		try:
+			child.kill()
+		except Exception:
+			pass
+	try:
+		process.kill()
+	except OSError:
+		pass
+
+class Watchdog:
+	"""
+	Runs next to one site and cancels it when the site deadline or the budget
+	of the current stage runs out: the stage it was stuck in is recorded and
+	the driver is killed, which makes the blocked WebDriver command fail.
+
+	Usage:
+		with Watchdog(driver, report) as watchdog:
+			...
+		if watchdog.expired: ...
+	"""
+
+	def __init__(self, driver, report, deadline=SITE_DEADLINE, budgets=STAGE_BUDGETS):
+		"""
+		Args:
+			driver: webdriver object of the site
+			report: the site trace from new_report, giving the current stage
+			deadline: seconds the whole site may take
+			budgets: seconds each stage may take
+		"""
+		self.driver = driver
+		self.report = report
+		self.deadline = deadline
+		self.budgets = budgets
+		self.expired = None
+		self.stage = None
+		self.done = threading.Event()
+
+	def __enter__(self):
+		self.start = time.time()
+		threading.Thread(target=self.watch, daemon=True).start()
+		return self
+
+	def __exit__(self, *exc):
+		self.done.set()
+		return False
+
+	def overrun(self):
+		"""
+		Returns:
+			'site' or 'stage' if a budget ran out, None otherwise
+		"""
+		now = time.time()
+		if now - self.start > self.deadline:
+			return 'site'
+		stage = self.report.get('stage')
+		started = self.report.get('stage_started')
+		if stage in self.budgets and started and now - started > self.budgets[stage]:
+			return 'stage'
+		return None
+
+	def watch(self):
+		while not self.done.wait(WATCH_INTERVAL):
+			overrun = self.overrun()
+			if overrun:
+				self.stage = self.report.get('stage')
+				self.expired = overrun
+				print(f"Watchdog: {overrun} budget exceeded in stage '{self.stage}', cancelling the site")
+				kill_driver(self.driver)
+				return
+
+	def error(self):
+		"""
+		The exception recorded for a cancelled site
+		"""
+		budget = self.deadline if self.expired == 'site' else self.budgets.get(self.stage)
+		return SiteTimeout(f"{self.expired} budget of {budget} s exceeded in stage '{self.stage}'")
+
+def is_responsive(driver, timeout=RESPONSIVE_TIMEOUT):
+	"""
+	Checks that the browser still answers a trivial command within the timeout
+	"""
+	answered = threading.Event()
+
+	def ping():
+		try:
+			driver.execute_script("return 1;")
+			answered.set()
+		except Exception:
+			pass
+
+	threading.Thread(target=ping, daemon=True).start()
+	return answered.wait(timeout)
+
+def reset_driver(driver):
+	"""
+	Brings the browser back to a clean state between two sites: one window,
+	the top document, no cookies, storage nor cache, and a blank page
+
+	Returns:
+		True if the browser could be reset
+	"""
+	try:
+		handles = driver.window_handles
+		for handle in handles[1:]:
+			driver.switch_to.window(handle)
+			driver.close()
+		driver.switch_to.window(handles[0])
+		driver.switch_to.default_content()
+		# Cleared before leaving the page, the storage is cleared for its origin
+		clear_browser_state(driver)
+		driver.get('about:blank')
+		return True
+	except WebDriverException:
+		return False
+
+class BrowserSession:
+	"""
+	The browser of a worker. After each site it is reset to a clean state,
+	or replaced when the site was cancelled, the browser stopped answering
+	or the memory governor asks for a restart.
+	"""
+
+	def __init__(self, driver_settings=None, governor_settings=None):
+		"""
+		Args:
+			driver_settings: keyword arguments of create_driver
+			governor_settings: keyword arguments of MemoryGovernor
+		"""
+		self.driver_settings = driver_settings or {}
+		self.governor = MemoryGovernor(**(governor_settings or {}))
+		self.driver = create_driver(**self.driver_settings)
+		self.replaced = 0
+
+	def recover(self, result):
+		"""
+		Gets the browser ready for the next site
+
+		Args:
+			result: result dict of the site which just finished, the memory
+				sample and the restart of the browser, if any, are stored in it
+
+		Returns:
+			'reset' or 'replaced'
+		"""
+		if result.get('backend') == 'http':
+			# The site was submitted without the browser
+			return 'reset'
+		if result.get('cancelled'):
+			recycle = ('cancelled', "cancelled")
+		elif not is_responsive(self.driver):
+			recycle = ('unresponsive', "unresponsive")
+		elif not reset_driver(self.driver):
+			recycle = ('reset', "reset failed")
+		else:
+			recycle = self.governor.check(self.driver, result)
+		if not recycle:
+			return 'reset'
+		code, reason = recycle
+		result['recycle'] = {'code': code, 'reason': reason, 'sites': self.governor.sites,
+							'rss_mb': result.get('memory', {}).get('rss_mb')}
+		self.replace(reason)
+		return 'replaced'
+
+	def replace(self, reason=None):
+		kill_driver(self.driver)
+		try:
+			self.driver.quit()
+		except Exception:
+			pass
+		self.driver = create_driver(**self.driver_settings)
+		self.governor.started()
+		self.replaced += 1
+		print(f"Browser replaced ({reason}, {self.replaced} so far)")
+
+	def quit(self):
+		try:
+			self.driver.quit()
+		except Exception:
+			kill_driver(self.driver)
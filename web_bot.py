@@ -1,9 +1,29 @@
+import os
 import time
 import json
+import argparse
+import itertools
 import random
 import traceback
-import pandas as pd
 from utils import *
+from lexicon import keywords
+from worker_pool import run_pool
+from discovery import prefetch_homepages, prefetch_rows
+from journal import Journal, completed_rows, export_xlsx
+from input_reader import iter_websites
+from discovery_cache import DiscoveryCache
+from preflight import PreflightCache, preflight_rows
+from ledger import LEASE_SECONDS, WorkLedger, Heartbeat, ledger_rows
+from form_analysis import snapshot_form, build_fill_plan, describe_plan, execute_fill_plan, set_type_fallback
+from form_analysis import form_fingerprint, plan_to_mapping, replay_fill_plan
+from tracing import new_report, trace_stage, site_commands, captcha_savings
+from confirmation import arm_confirmation, detect_confirmation
+from consent import handle_consent
+from watchdog import SITE_DEADLINE, Watchdog, BrowserSession
+from governor import MAX_RSS_MB, MAX_SITES, MAX_ERROR_STREAK
+from http_submit import submit_static_form
+from archive import open_archive, close_archive, record_rows
+from waits import PACING_PROFILES, set_pacing, pause
 from selenium import webdriver
 from bs4 import BeautifulSoup
 from selenium.webdriver.chrome.options import Options
@@ -19,40 +39,6 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.common.action_chains import ActionChains 
 from selenium.common.exceptions import WebDriverException
 
-class BotException(Exception):
-	pass
-
-
-def select_options(element, attribute, input_str):
-
-	try:
-		select_option = element.find_element(By.XPATH, f"""//{attribute}[
-										{to_xpath_converter([('@name', input_str),
-															('@id', input_str),
-															('text()', input_str),
-															('@class', input_str)])}]""")
-
-		if 'radio' in select_option.get_attribute('id'):
-			try:
-				select_option.click()
-				time.sleep(1)
-			except ElementClickInterceptedException:
-				label_xpath = "//label[contains(@for,'radio')]"
-				select_option = element.find_element(By.XPATH, label_xpath)
-				select_option.click()
-				time.sleep(1)
-		else:
-			options = select_option.find_elements(By.TAG_NAME, "option")
-
-			# Iterate over the options and click the first enabled one
-			for option in options:
-				if option.is_enabled() and option.get_attribute("value"):
-					option.click()
-					break
-			time.sleep(1)
-	except (NoSuchElementException):
-		return
-
 def filter_submit_buttons(driver, form_element, submit_buttons):
 	"""
 	Filter elements that have the given ancestor_element in their ancestor chain.
@@ -100,238 +86,509 @@ def click_submit(element, driver):
 			raise BotException("Submit button click exception")
 	raise BotException("Submit button click exception")
 
-def click_on_checkbox(element, driver):
-	"""
-	Clicks on the checkbox for acceptance, to be able to submit the form
+class StaleCacheEntry(BotException):
+	pass
+
+def automate_contact_form(driver,website_url, info, confirmation_messages, discovery=None, report=None,
+						cached=None, http_submit=False, stop_before_submit=False):
+
+	if report is None:
+		report = new_report(driver)
+	if http_submit and discovery and discovery.get('static_form'):
+		# A plain HTML form is posted without the browser, unless it turns out to need one
+		with trace_stage(report, 'http_submit'):
+			outcome = submit_static_form(discovery['form_url'], info, confirmation_messages)
+		if not outcome['fallback']:
+			print(f"Confirmation: {outcome['confirmed']} by {outcome['signal']} {outcome['detail'] or ''}")
+			report.update(backend='http', lang=outcome['lang'], contact_url=discovery['form_url'],
+						signal=outcome['signal'], stage=None)
+			return (outcome['confirmed'], outcome['signal'])
+		print(f"HTTP submit not possible, {outcome['fallback']}")
+		report['http_fallback'] = outcome['fallback']
+	report['backend'] = 'browser'
+	if cached:
+		start_url = cached['contact_url']
+	else:
+		start_url = (discovery['form_url'] or discovery['contact_url']) if discovery else None
+	if start_url:
+		# The contact page is already known, start right there
+		with trace_stage(report, 'load_page'):
+			lang = open_page(driver, start_url)
+		with trace_stage(report, 'cookie'):
+			report['consent'] = handle_consent(driver, lang)
+	else:
+		with trace_stage(report, 'load_page'):
+			lang = open_page(driver, website_url)
+		with trace_stage(report, 'cookie'):
+			report['consent'] = handle_consent(driver, lang)
+		with trace_stage(report, 'contact_page'):
+			try:
+				find_contact_us_page(driver, lang)
+			except BotException:
+				# A bot challenge page has no links, it is reported as such
+				report['challenge'] = check_for_captcha(driver)
+				raise
+		with trace_stage(report, 'cookie'):
+			# The consent given on the homepage usually holds, a single look is enough
+			handle_consent(driver, lang, window=0)
+	report['lang'] = lang
+	contact_url = driver.current_url
+	report['contact_url'] = contact_url
+	frame = None
+	with trace_stage(report, 'find_form'):
+		if cached and cached['frame'] and not switch_to_frame(driver, cached['frame']):
+			raise StaleCacheEntry("The cached iframe of the form was not found")
+		form_element = find_contact_form(driver, lang)
+	if not form_element:
+		if cached:
+			raise StaleCacheEntry("The cached form was not found")
+		with trace_stage(report, 'challenge'):
+			# A bot challenge page has no form, it is not searched for in iframes
+			report['challenge'] = check_for_captcha(driver)
+		with trace_stage(report, 'iframe_form'):
+			form_element, frame = find_form_in_iframe(driver, lang)
+	elif cached:
+		frame = cached['frame']
+	with trace_stage(report, 'challenge'):
+		fields = snapshot_form(driver, form_element)
+		report['challenge'] = check_for_captcha(driver, form_element, fields)
+		if report['challenge']['kind']:
+			print(f"Form protection: {report['challenge']['kind']}, {report['challenge']['detail']}")
+	pause('navigation')
+	with trace_stage(report, 'fill'):
+		fingerprint = form_fingerprint(fields)
+		if cached and cached['fingerprint'] != fingerprint:
+			raise StaleCacheEntry("The form changed since it was cached")
+		if cached:
+			plan = replay_fill_plan(fields, cached['mapping'], info)
+		else:
+			plan = build_fill_plan(fields, info, lang)
+		print(f"Fill plan: {describe_plan(plan)}")
+		report['discovery'] = {'contact_url': contact_url,
+								'frame': frame,
+								'fingerprint': fingerprint,
+								'mapping': plan_to_mapping(plan)}
+		report['fill'] = execute_fill_plan(driver, plan, form_element)
+		if report['fill']['rejected']:
+			print(f"Rejected by the page: {report['fill']['rejected']}, typed in: {report['fill']['typed']}")
+	if stop_before_submit:
+		# Recording or replaying an archive, the form is never posted
+		if frame:
+			driver.switch_to.default_content()
+		report['stage'] = None
+		return (None, 'stopped before submit')
+	messages = confirmation_messages + keywords('confirmation', lang)
+	with trace_stage(report, 'submit'):
+		armed = arm_confirmation(driver, form_element, messages)
+		click_submit(form_element, driver)
+	with trace_stage(report, 'confirm'):
+		confirmed, signal, detail = detect_confirmation(driver, messages, form=armed)
+		print(f"Confirmation: {confirmed} by {signal} {detail or ''}")
+		report['signal'] = signal
+		if frame:
+			driver.switch_to.default_content()
+	report['stage'] = None
+	return (confirmed, signal)
 
-	Args:
-		driver: webdriver object
-	"""
-	try:
-		data_collection_checkbox = element.find_element(By.XPATH, """
-															//input[@type='checkbox' and 
-															(@aria-required='true' or
-															@required='required' or
-															@required or
-															contains(@name,'accept'))]""")
-		driver.execute_script("arguments[0].click();", data_collection_checkbox)
-		# data_collection_checkbox.click()
-		print("Checkbox clicked")
-		time.sleep(random.uniform(2.0, 3.0))
-	except (NoSuchElementException, ElementNotInteractableException):
-		try:
-			data_collection_checkbox = element.find_element(By.XPATH, "//input[@type='checkbox']")
-		except NoSuchElementException:
-			pass
 
-def fill_input_by_label(element, xpath_expression, message, checker):
+confirmation_messages = [
+	"thank you",
+	"thanks",
+	"contact you soon",
+	"was submitted",
+	"has been submitted",
+	"submitted successfully",
+	"was send",
+	"has been sent"
+]
+
+def load_contact_information(path="contact_information.json"):
 	"""
-	Finds an input element based on the text of its associated label.
+	Loads the information used to fill in the contact forms
 
-	:param driver: The Selenium WebDriver.
-	:param label_text: The text contained in the label associated with the input.
-	:return: The input WebElement if found, None otherwise.
+	Args:
+		path: path of the json file with the contact information
+
+	Returns:
+		dict with the contact information
 	"""
-	try:
-		# Find the label by its text using XPath
-
-		label = element.find_element(By.XPATH, xpath_expression)
-		
-		# Get the 'for' attribute, which should match the input element's ID
-		input_id = label.get_attribute('for')
-		
-		if input_id:
-			# Find and return the input element by its ID
-			section_input = element.find_element(By.ID, input_id)
-			if section_input.id in checker:
-				return None
-			section_input.send_keys(message)
-			time.sleep(random.uniform(1.0, 2.0))
-			return section_input.id
-		else:
-			return None
-	except NoSuchElementException as e:
-		return None
+	with open(path, 'r') as f:
+		return json.load(f)
 
-def check_for_success_alert(driver, confirmation_messages):
+def process_website(driver, row, info, confirmation_messages, discovery=None, cache=None,
+					deadline=SITE_DEADLINE, http_submit=False, stop_before_submit=False):
 	"""
-	Checks for the "Successfull submission" alert after form submission
+	Runs the contact form automation for one row of the websites list, under
+	the watchdog: a site running over its deadline or over the budget of a
+	stage is cancelled with the "timeout" status
 
 	Args:
 		driver: webdriver object
+		row: (row_id, website, event) tuple
+		info: contact information dict
 		confirmation_messages: list of strings to check if the submission was successfull or failed
-	
+		discovery: result of the HTTP prefetch of the website, if any
+		cache: DiscoveryCache to replay and store the discovery of the domain
+		deadline: seconds the site may take
+		http_submit: post the static contact forms found by the prefetch without the browser
+		stop_before_submit: fill in the form without submitting it, the site gets the "filled" status
+
 	Returns:
-		boolean: successfull or failed
+		result dict with the row id, website, status, the stage it failed or got stuck in,
+		the exception text, the elapsed time in total and per stage, the
+		number of WebDriver commands, the trace of each stage, the
+		discovery cache outcome, the contact page url, the page language, how
+		the cookie consent was handled, the signal which decided the confirmation,
+		whether the watchdog cancelled the site, whether the form was
+		submitted over HTTP or with the browser, with the reason of the fallback,
+		the captcha or bot protection found on the form and the outcome of the fill
 	"""
-	try:
-		# Wait for the success alert to be visible (timeout 5 seconds)
-		success_alert = WebDriverWait(driver, 5).until(
-			EC.visibility_of_element_located((By.CLASS_NAME, "alert-success"))
-		)
-		# Check if the expected text is in the success alert
-		for message in confirmation_messages:
-			if message in success_alert.text:
-				return True
-	except Exception as e:
-		return False
-	return False
-
-def is_submission_confirmed(driver, confirmation_messages):
+	row_id, website_url, event = row
+	site_info = dict(info)
+	site_info["message"] = "Meeting at " + event if isinstance(event, str) else ""
+	report = new_report(driver)
+	if discovery and discovery.get('elapsed') is not None:
+		report['stages'].append({'name': 'prefetch', 'wall': discovery['elapsed'],
+								'commands': 0, 'outcome': 'error' if discovery['error'] else 'ok'})
+	cached = cache.get(website_url) if cache else None
+	cache_status = ('hit' if cached else 'miss') if cache else None
+	start = time.time()
+	with Watchdog(driver, report, deadline) as watchdog:
+		try:
+			try:
+				confirmed, note = automate_contact_form(driver, website_url, site_info, confirmation_messages,
+														discovery, report, cached, http_submit, stop_before_submit)
+			except StaleCacheEntry as e:
+				# Nothing was filled in yet, run the full discovery instead
+				print(e)
+				cache.invalidate(website_url)
+				cache_status = 'stale'
+				confirmed, note = automate_contact_form(driver, website_url, site_info, confirmation_messages,
+														discovery, report, http_submit=http_submit,
+														stop_before_submit=stop_before_submit)
+			if confirmed is None and stop_before_submit:
+				status = "filled"
+			else:
+				status = "confirmed" if confirmed else "not confirmed"
+			error = None
+		except CaptchaDetected as e:
+			# Stopped before filling in, the form can not be submitted
+			print(e)
+			report['challenge'] = e.challenge
+			status = "captcha"
+			error = f"{type(e).__name__}: {e}".strip()
+		except Exception as e:
+			print(e)
+			status = "failed"
+			error = f"{type(e).__name__}: {e}".strip()
+	if watchdog.expired:
+		# Whatever the killed driver raised, the site ran out of time
+		status = "timeout"
+		error = f"{type(watchdog.error()).__name__}: {watchdog.error()}"
+		report['stage'] = watchdog.stage
+	if cache and cache_status != 'hit' and report.get('discovery'):
+		cache.put(website_url, report['discovery'])
+	return {'row_id': row_id,
+			'website': website_url,
+			'status': status,
+			'stage': report['stage'],
+			'error': error,
+			'elapsed': round(time.time() - start, 3),
+			'timings': report['timings'],
+			'commands': site_commands(report),
+			'stages': report['stages'],
+			'cache': cache_status,
+			'contact_url': report.get('contact_url'),
+			'lang': report.get('lang'),
+			'consent': report.get('consent'),
+			'signal': report.get('signal'),
+			'cancelled': bool(watchdog.expired),
+			'backend': report.get('backend'),
+			'challenge': report.get('challenge'),
+			'fill': report.get('fill'),
+			'http_fallback': report.get('http_fallback'),
+			'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def open_cache(settings):
+	"""
+	Opens the discovery cache described in the run settings, if it is enabled
 	"""
-	Checks for the "Successfull submission" message after form submission on the webpage
+	if not settings.get('cache'):
+		return None
+	return DiscoveryCache(**settings['cache'])
+
+def print_summary(results):
+	"""
+	Prints the number of websites per status, the discovery cache counters,
+	the browser restarts, the peak memory of the browsers and the time saved
+	on the captcha protected websites
+	"""
+	statuses = {}
+	cache = {}
+	stuck = {}
+	recycles = {}
+	peak = None
+	for result in results:
+		if result.get('recycle'):
+			code = result['recycle']['code']
+			recycles[code] = recycles.get(code, 0) + 1
+		rss = (result.get('memory') or {}).get('rss_mb')
+		if rss is not None and (peak is None or rss > peak):
+			peak = rss
+		if result['status'] == 'timeout':
+			stuck[result.get('stage')] = stuck.get(result.get('stage'), 0) + 1
+		statuses[result['status']] = statuses.get(result['status'], 0) + 1
+		if result.get('cache'):
+			cache[result['cache']] = cache.get(result['cache'], 0) + 1
+	print(f"Run summary: {len(results)} websites, {statuses}")
+	if cache:
+		print(f"Discovery cache: {cache.get('hit', 0)} hits, {cache.get('miss', 0)} misses, "
+			f"{cache.get('stale', 0)} stale")
+	if stuck:
+		print(f"Timed out sites per stage: {stuck}")
+	if recycles or peak is not None:
+		print(f"Browser restarts: {recycles}, peak browser memory {peak} MB")
+	captchas, saved = captcha_savings(results)
+	if captchas:
+		print(f"Captcha check: {captchas} protected websites stopped before filling in, "
+			f"about {saved if saved is not None else '?'} s saved")
+
+def run_sequential(tasks, info, confirmation_messages, on_result=None, settings=None):
+	"""
+	Processes the rows one at a time with a single browser, which is reset
+	after each site, or replaced when it was cancelled, stopped answering or
+	crossed a threshold of the memory governor
 
 	Args:
-		driver: webdriver object
+		tasks: iterable of (row, discovery) tuples, row being (row_id, website, event)
+		info: contact information dict
 		confirmation_messages: list of strings to check if the submission was successfull or failed
-	
+		on_result: optional callback called with each result dict
+		settings: run settings, e.g. the discovery cache
+
 	Returns:
-		boolean: successfull or failed
+		list of result dicts in row order
+	"""
+	settings = settings or {}
+	cache = open_cache(settings)
+	browser = BrowserSession(settings.get('driver', {}), settings.get('governor', {}))
+	results = []
+	try:
+		for row, discovery in tasks:
+			result = process_website(browser.driver, row, info, confirmation_messages, discovery, cache,
+									settings.get('site_timeout', SITE_DEADLINE), settings.get('http_submit', False),
+									settings.get('stop_before_submit', False))
+			browser.recover(result)
+			results.append(result)
+			if on_result:
+				on_result(result)
+			print(f"Finished {row[0]}")
+	finally:
+		browser.quit()
+		if cache:
+			cache.close()
+	return sorted(results, key=lambda result: result['row_id'])
+
+def export_ledger(ledger, input_path, output_path):
 	"""
-	for message in confirmation_messages:
+	Writes the merged results of all the nodes, once every website of the
+	ledger has one, to a journal next to the ledger and to the Excel file.
+	Only the node claiming the export in the ledger writes them.
+	"""
+	progress = ledger.progress()
+	print(f"Node {ledger.node}: {ledger.reclaimed} websites reclaimed, {ledger.lost} leases lost, ledger {progress}")
+	if not ledger.finished():
+		print(f"Other nodes are still running, the last one to finish writes {output_path}")
+		return
+	if not ledger.claim_export():
+		print(f"Another node finished at the same time and writes {output_path}")
+		return
+	merged = os.path.splitext(ledger.path)[0] + '.jsonl'
+	print(f"{ledger.export_journal(merged)} results of all the nodes written to {merged}")
+	export_xlsx(merged, input_path, output_path)
+
+def main():
+	parser = argparse.ArgumentParser(description="Submits the contact form on each website of the list")
+	parser.add_argument('--input', default='Websites Sample.xlsx',
+						help="websites list with \"Website\" and \"Event\" columns (.xlsx, .csv or .jsonl)")
+	parser.add_argument('--output', default='full_test.xlsx', help="Excel file to write the results to")
+	parser.add_argument('--journal', default='results.jsonl', help="append-only results journal")
+	parser.add_argument('--resume', action='store_true',
+						help="keep the journal of the previous run and skip the websites already in it")
+	parser.add_argument('--retry-failed', action='store_true',
+						help="with --resume, process the failed and timed out websites again")
+	parser.add_argument('--cache', default='discovery_cache.sqlite',
+						help="per domain cache of the contact page, the form and its field mapping")
+	parser.add_argument('--cache-ttl-days', type=float, default=30)
+	parser.add_argument('--cache-size', type=int, default=10000, help="maximum number of cached domains")
+	parser.add_argument('--no-cache', action='store_true', help="always run the full discovery")
+	parser.add_argument('--export', action='store_true',
+						help="only write the Excel file from the journal and exit")
+	parser.add_argument('--workers', type=int, default=1, help="number of parallel browser workers")
+	parser.add_argument('--limit', type=int, default=None, help="process only the first N websites")
+	parser.add_argument('--website', default=None, help="run the bot on a single website and exit")
+	parser.add_argument('--pacing', default='fast', choices=sorted(PACING_PROFILES),
+						help="human-like pauses between actions")
+	parser.add_argument('--type-fallback', action='store_true',
+						help="type in with keystrokes the values a page rejects when they are set from a script")
+	parser.add_argument('--lean', action='store_true',
+						help="headless browser which does not load images, fonts, media nor ads and analytics")
+	parser.add_argument('--page-load-timeout', type=float, default=30,
+						help="seconds to wait for a page to load before going on with the partial page")
+	parser.add_argument('--site-timeout', type=float, default=SITE_DEADLINE,
+						help="seconds after which a website is cancelled and the browser reset")
+	parser.add_argument('--max-rss-mb', type=float, default=MAX_RSS_MB,
+						help="restart the browser when its processes use more memory, in MB")
+	parser.add_argument('--recycle-after', type=int, default=MAX_SITES,
+						help="restart the browser after this many websites")
+	parser.add_argument('--max-error-streak', type=int, default=MAX_ERROR_STREAK,
+						help="restart the browser after this many failed websites in a row")
+	parser.add_argument('--no-consent-preseed', action='store_true',
+						help="do not store the cookie consent of the common consent platforms before the pages load")
+	parser.add_argument('--no-http-submit', action='store_true',
+						help="always use the browser, also for the plain HTML contact forms")
+	parser.add_argument('--no-prefetch', action='store_true',
+						help="do not look for the contact pages over HTTP before opening the browser")
+	parser.add_argument('--prefetch-concurrency', type=int, default=16,
+						help="number of parallel HTTP requests of the prefetch stage")
+	parser.add_argument('--no-preflight', action='store_true',
+						help="do not check the websites for dead hosts, parked domains and duplicates before the browser")
+	parser.add_argument('--preflight-concurrency', type=int, default=32,
+						help="number of websites checked at once by the preflight")
+	parser.add_argument('--preflight-ttl-days', type=float, default=7,
+						help="days the preflight checks stay in the cache")
+	parser.add_argument('--ledger', default=None,
+						help="shared work ledger of a distributed run, the nodes running with the same ledger split the websites")
+	parser.add_argument('--node', default=None, help="name of this node in the ledger, the host name and process id by default")
+	parser.add_argument('--lease-seconds', type=float, default=LEASE_SECONDS,
+						help="seconds after which the websites of a node which stopped beating are claimed by the others")
+	archiving = parser.add_mutually_exclusive_group()
+	archiving.add_argument('--record', metavar='ARCHIVE', default=None,
+						help="store every response the browser fetches in this archive, filling in the forms without submitting them")
+	archiving.add_argument('--replay', metavar='ARCHIVE', default=None,
+						help="rerun the websites of this archive offline, from the recorded responses")
+	args = parser.parse_args()
+
+	set_pacing(args.pacing)
+	set_type_fallback(args.type_fallback)
+	settings = {'pacing': args.pacing,
+				'type_fallback': args.type_fallback,
+				'site_timeout': args.site_timeout,
+				'http_submit': not args.no_http_submit,
+				'governor': {'max_rss_mb': args.max_rss_mb, 'max_sites': args.recycle_after,
+							'max_error_streak': args.max_error_streak},
+				'driver': {'lean': args.lean, 'page_load_timeout': args.page_load_timeout,
+							'consent_preseed': not args.no_consent_preseed},
+				'cache': None if args.no_cache else {'path': args.cache,
+													'ttl_days': args.cache_ttl_days,
+													'max_entries': args.cache_size}}
+
+	archive = proxy = None
+	if args.record or args.replay:
+		# Everything goes through the browser and the proxy, and nothing is posted
+		archive, proxy = open_archive(args.record or args.replay, 'record' if args.record else 'replay')
+		settings['driver']['arguments'] = proxy.chrome_arguments()
+		settings.update(http_submit=False, stop_before_submit=True, cache=None)
+		args.no_prefetch = True
+		# The recorded websites were all alive, and the replay has no network to check them with
+		args.no_preflight = args.no_preflight or bool(args.replay)
+
+	info = load_contact_information()
+	if args.website:
+		discovery = None
+		if not args.no_prefetch:
+			discovery = prefetch_homepages([args.website])[args.website]
+			print(f"Prefetch: {discovery}")
+		rows = [(0, args.website, None)]
+		if args.record:
+			rows = record_rows(archive, rows)
 		try:
-			confirmation_message_xpath = f"//*[{to_xpath_converter([('.', message)])}]"
-	
-			# Wait for the confirmation message to be visible (timeout in 10 seconds)
-			confirmation_message_element = WebDriverWait(driver, 3).until(
-				EC.visibility_of_element_located((By.XPATH, confirmation_message_xpath))
-			)
-			print(f"'{message}' was found on page")
-			return True
-		except:
-			continue
-	return False
+			print(run_sequential([(row, discovery) for row in rows], info, confirmation_messages,
+								settings=settings)[0])
+		finally:
+			if proxy:
+				close_archive(archive, proxy)
+		return
 
-def check_form_disapears(form_element, driver):
+	if args.export:
+		export_xlsx(args.journal, args.input, args.output)
+		return
 
-	try:
-		form = find_contact_form(driver)
-		if form_element == form:
-			print("Form still exists")
-			return False
-	except NoSuchElementException:
-		return True
-	return True
-
-def fill_the_form(element, tag, search_array, input_str, checker):
-
-	inputed = fill_in_section(element, tag, search_array, input_str, checker)
-	if not inputed:
-		xpath = []
-		for text in search_array:
-			xpath.append(xpath_lower('text()', text))
-		xpath_expression = f"//label[{' and '.join(xpath)}]"
-		inputed = fill_input_by_label(element, xpath_expression, input_str, checker)
-	if not inputed:
-		xpath_expression = f"//font[{' and '.join(xpath)}]/ancestor::label"
-		inputed = fill_input_by_label(element, xpath_expression, input_str, checker)
-
-	return inputed
-
-def automate_contact_form(driver,website_url, info, confirmation_messages):
-
-	# try:
-
-	translate_page(driver, website_url)
-	check_for_cookie(driver)
-	time.sleep(5)
-	iframe_driver = False
-	find_contact_us_page(driver)
-	check_for_cookie(driver)
-	form_element = find_contact_form(driver)
-	if not form_element:
-		form_element = find_form_in_iframe(driver)
-		iframe_driver = True
-	time.sleep(5)
-	visited = []
-	visited.append(fill_the_form(form_element, 'input', ['full', 'name'], info['fullname'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['first', 'name'], info['firstname'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['last', 'name'], info['lastname'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['sur', 'name'], info['lastname'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['name'], info['fullname'], visited))
-
-	visited.append(fill_the_form(form_element, 'input', ['mail'], info['email'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['compan'], info['company'], visited))
-
-	visited.append(fill_the_form(form_element, 'input', ['phone'], info['phone'], visited))
-	visited.append(fill_the_form(form_element, 'input', ["tel"], info['phone'], visited))
-
-	country = fill_the_form(form_element, 'input', ['country'], info['country'], visited)
-	if not country:
-		visited.append(country)
+	rows = archive.sites() if args.replay else iter_websites(args.input)
+	if args.limit is not None:
+		rows = itertools.islice(rows, args.limit)
+	ledger = None
+	if args.ledger:
+		# The ledger knows which websites are done, each node claims the next one when it is free
+		ledger = WorkLedger(args.ledger, args.node, args.lease_seconds)
+		ledger.load(rows)
+		if args.retry_failed:
+			print(f"Retrying {ledger.retry_failed()} failed websites")
+		print(f"Node {ledger.node} joining the run, {ledger.progress()}")
+		rows = ledger_rows(ledger)
+		# The sites are claimed when a browser is free, never ahead of it: the
+		# preflight and the prefetch would hold claimed sites in their queues
+		args.no_preflight = args.no_prefetch = True
+	elif args.resume:
+		done = completed_rows(args.journal, args.retry_failed)
+		rows = (row for row in rows if row[0] not in done)
+		print(f"Resuming, {len(done)} websites already done")
+	journal = Journal(args.journal, resume=args.resume)
+
+	def on_result(record):
+		journal.append(record)
+		if ledger:
+			ledger.complete(record)
+
+	skipped = []
+	preflight_cache = None
+	if not args.no_preflight:
+		# Dead, parked and duplicate websites get their status without a browser
+		if not args.no_cache:
+			preflight_cache = PreflightCache(args.cache, args.preflight_ttl_days)
+
+		def on_skipped(record):
+			on_result(record)
+			skipped.append(record)
+
+		rows = preflight_rows(rows, on_skipped, concurrency=args.preflight_concurrency, cache=preflight_cache)
+	if args.record:
+		rows = record_rows(archive, rows)
+
+	cache = None
+	if args.no_prefetch:
+		tasks = ((row, None) for row in rows)
 	else:
-		select_options(form_element, 'select', 'country')
-
-	visited.append(fill_the_form(form_element, 'input', ['address'], info['address'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['street'], info['street'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['city'], info['city'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['postcode'], info['postcode'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['zip'], info['postcode'], visited))
-
-	visited.append(fill_the_form(form_element, 'input', ['job'], info['job'], visited))
-
-	visited.append(fill_the_form(form_element, 'input', ['subject'], info['message'], visited))
-	visited.append(fill_the_form(form_element, 'input', ['regarding'], info['message'], visited))
-
-	select_options(form_element, 'select', 'request')
-	select_options(form_element, 'select', 'salutation')
-	select_options(form_element, 'select', 'gender')
-	select_options(form_element, 'input', 'salutation')
-
-	visited.append(fill_the_form(form_element, 'textarea', ['message'], info['message'], visited))
-	visited.append(fill_the_form(form_element, 'textarea', ['inquiry'], info['message'], visited))
-
-	click_on_checkbox(form_element, driver)
-	time.sleep(2)
-	click_submit(form_element, driver)
-	time.sleep(5)
-	if iframe_driver:
-		driver.switch_to.default_content()
-	is_on_page = is_submission_confirmed(driver, confirmation_messages)
-	is_alert = check_for_success_alert(driver, confirmation_messages)
-	return (is_on_page or is_alert , "Submitted")
-
-	# except Exception as e:
-	# 	print(e)
-	# 	return (False, e)
-
-
-# Load the Excel file with website URLs
-excel_file_path = 'Websites Sample.xlsx'
-df = pd.read_excel(excel_file_path)
-
-with open("contact_information.json", 'r') as f:
-	info = json.load(f)
-
-
-confirmation_messages = [
-	"thank you",
-	"thanks",
-	"contact you soon",
-	"was submitted",
-	"has been submitted",
-	"submitted successfully",
-	"was send",
-	"has been sent"
-]
-
-# Configure the Selenium webdriver
-driver = create_driver()
-
-website_url = "http://www.aclas.tw"
-message =   "Meeting at "
-info["message"] = message
-res = automate_contact_form(driver, website_url, info, confirmation_messages)
+		# The domains in the discovery cache do not need the prefetch
+		cache = open_cache(settings)
+		skip = (lambda row: cache.contains(row[1])) if cache else None
+		tasks = prefetch_rows(rows, concurrency=args.prefetch_concurrency, skip=skip)
 
+	heartbeat = Heartbeat(ledger).start() if ledger else None
+	try:
+		if args.workers > 1:
+			results = run_pool(tasks, info, confirmation_messages, workers=args.workers,
+							on_result=on_result, settings=settings, in_flight=args.workers if ledger else None)
+		else:
+			results = run_sequential(tasks, info, confirmation_messages,
+									on_result=on_result, settings=settings)
+		print_summary(results + skipped)
+	finally:
+		if heartbeat:
+			heartbeat.stop()
+		journal.close()
+		if cache:
+			cache.close()
+		if preflight_cache:
+			preflight_cache.close()
+		if proxy:
+			close_archive(archive, proxy)
+		if ledger:
+			export_ledger(ledger, args.input, args.output)
+			ledger.close()
+		else:
+			export_xlsx(args.journal, args.input, args.output)
 
-# df['Status'] = ''
-# for i in range(0, len(df)):
-# 	website_url = df.loc[i, 'Website']
-# 	event = df.loc[i, 'Event']
-# 	message =   "Meeting at " + event  if isinstance(event, str) else ""
-# 	info["message"] = message
-# 	res = automate_contact_form(driver, website_url, info, confirmation_messages)
-# 	df.loc[i, 'Status'] = res[0]
-# 	df.to_excel('full_test.xlsx', index=False)
-# 	print(f"Finished {i}")
 
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,163 @@
+import time
+import queue
+import threading
+import multiprocessing
+
+
+def worker_main(worker_id, task_queue, result_queue, info, confirmation_messages, settings):
+	"""
+	Worker process loop. Creates its own isolated browser and processes
+	rows from the shared queue until it gets the stop sentinel. The browser
+	is reset after each row, or replaced when the watchdog cancelled the row
+	or the memory governor asks for a restart.
+
+	Args:
+		worker_id: index of the worker
+		task_queue: shared queue with (row, discovery) tuples
+		result_queue: queue the result dicts are put into
+		info: contact information dict
+		confirmation_messages: list of strings to check if the submission was successfull or failed
+		settings: run settings of the parent process, e.g. the pacing profile and the discovery cache
+	"""
+	# Imported here, web_bot imports this module at the top level
+	from web_bot import process_website, open_cache
+	from watchdog import SITE_DEADLINE, BrowserSession
+	from waits import set_pacing
+	from form_analysis import set_type_fallback
+
+	set_pacing(settings.get('pacing', 'fast'))
+	set_type_fallback(settings.get('type_fallback', False))
+	cache = open_cache(settings)
+	browser = BrowserSession(settings.get('driver', {}), settings.get('governor', {}))
+	try:
+		while True:
+			task = task_queue.get()
+			if task is None:
+				break
+			row, discovery = task
+			result = process_website(browser.driver, row, info, confirmation_messages, discovery, cache,
+									settings.get('site_timeout', SITE_DEADLINE), settings.get('http_submit', False),
+									settings.get('stop_before_submit', False))
+			browser.recover(result)
+			result['worker'] = worker_id
+			result_queue.put(result)
+	finally:
+		browser.quit()
+		if cache:
+			cache.close()
+
+def feed_tasks(tasks, task_queue, workers, submitted, feeding, slots=None):
+	"""
+	Puts the tasks into the shared queue, then one stop sentinel per worker.
+	With slots, the next task is only taken once a slot is free.
+	"""
+	try:
+		tasks = iter(tasks)
+		while True:
+			if slots:
+				slots.acquire()
+			task = next(tasks, None)
+			if task is None:
+				break
+			submitted.append(task[0])
+			task_queue.put(task)
+	finally:
+		for _ in range(workers):
+			task_queue.put(None)
+		feeding.set()
+
+def run_pool(tasks, info, confirmation_messages, workers=4, on_result=None, settings=None, in_flight=None):
+	"""
+	Processes the rows with N browser worker processes pulling from a shared queue
+
+	Args:
+		tasks: iterable of (row, discovery) tuples, row being (row_id, website, event)
+			and discovery the prefetch result or None. It is consumed lazily, so
+			the workers start on the first rows while the rest are still read.
+		info: contact information dict
+		confirmation_messages: list of strings to check if the submission was successfull or failed
+		workers: number of worker processes (concurrency level)
+		on_result: optional callback called with each result dict as soon as it arrives
+		settings: run settings passed to the workers
+		in_flight: maximum number of rows handed to the workers and not
+			finished yet, e.g. one per worker so the rows are only taken from
+			a shared ledger when a worker is free; unbounded by default
+
+	Returns:
+		list of result dicts sorted by row id
+	"""
+	settings = settings or {}
+	task_queue = multiprocessing.Queue()
+	result_queue = multiprocessing.Queue()
+	workers = max(1, workers)
+
+	processes = []
+	for worker_id in range(workers):
+		process = multiprocessing.Process(target=worker_main,
+										args=(worker_id, task_queue, result_queue,
+											info, confirmation_messages, settings),
+										daemon=True)
+		process.start()
+		processes.append(process)
+
+	submitted = []
+	feeding = threading.Event()
+	slots = threading.Semaphore(in_flight) if in_flight else None
+	feeder = threading.Thread(target=feed_tasks,
+							args=(tasks, task_queue, workers, submitted, feeding, slots),
+							daemon=True)
+	feeder.start()
+
+	results = {}
+	while not feeding.is_set() or len(results) < len(submitted):
+		try:
+			result = result_queue.get(timeout=5)
+		except queue.Empty:
+			if not any(process.is_alive() for process in processes):
+				break
+			continue
+		results[result['row_id']] = result
+		if on_result:
+			on_result(result)
+		if slots:
+			slots.release()
+		print(f"Finished {result['row_id']}")
+
+	# Rows lost together with a crashed worker are reported as failed
+	for row_id, website_url, _ in submitted:
+		if row_id not in results:
+			result = {'row_id': row_id,
+					'website': website_url,
+					'status': "failed",
+					'error': "Worker process exited before finishing the row",
+					'elapsed': 0.0}
+			results[row_id] = result
+			if on_result:
+				on_result(result)
+
+	for process in processes:
+		process.join(timeout=10)
+		if process.is_alive():
+			process.terminate()
+
+	return [results[row_id] for row_id in sorted(results)]
+
+def measure_throughput(rows, info, confirmation_messages, workers, settings=None):
+	"""
+	Runs the pool once and measures its throughput
+
+	Returns:
+		dict with the concurrency level, wall time, sites per minute and status counts
+	"""
+	start = time.time()
+	results = run_pool([(row, None) for row in rows], info, confirmation_messages,
+						workers=workers, settings=settings)
+	wall = time.time() - start
+	statuses = {}
+	for result in results:
+		statuses[result['status']] = statuses.get(result['status'], 0) + 1
+	return {'workers': workers,
+			'sites': len(results),
+			'wall': round(wall, 2),
+			'sites_per_minute': round(len(results) / wall * 60, 2) if wall else 0.0,
+			'statuses': statuses}